@@ -0,0 +1,133 @@
+# pos_project/benchmark.py
+
+import random
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+BATCH_SIZE = 5000
+
+# Kosakata katalog sintetis: nama produk = merek + jenis + ukuran, jadi
+# pencarian sebagian dan salah ketik punya banyak kandidat yang mirip.
+MEREK = [
+    'Indomie', 'Sedaap', 'Sarimi', 'Supermi', 'Kapal Api', 'Torabika', 'Luwak', 'Good Day', 'Nescafe', 'Aqua',
+    'Le Minerale', 'Cleo', 'Sania', 'Bimoli', 'Filma', 'Tropical', 'Gulaku', 'Rose Brand', 'Bogasari', 'Lifebuoy',
+    'Nuvo', 'Dettol', 'Pepsodent', 'Ciptadent', 'Sunsilk', 'Pantene', 'Rinso', 'Attack', 'Daia', 'Sunlight',
+    'Mama Lemon', 'Baygon', 'Frisian Flag', 'Indomilk', 'Ultra', 'Teh Pucuk', 'Sosro', 'Khong Guan', 'Roma', 'Chitato',
+]
+JENIS = [
+    'Goreng', 'Soto', 'Ayam Bawang', 'Kari Ayam', 'Rendang', 'Original', 'Mocha', 'Susu', 'Gula Aren', 'Lemon',
+    'Jeruk', 'Apel', 'Stroberi', 'Coklat', 'Vanila', 'Melon', 'Mint', 'Herbal', 'Cair', 'Bubuk',
+]
+UKURAN = ['50g', '75g', '85g', '100g', '200g', '250g', '500g', '1kg', '5kg', '330ml', '600ml', '1L', '2L']
+VARIAN = ['Satuan', 'Pak Isi 5', 'Renteng', 'Kardus', 'Grosir']
+
+
+@contextmanager
+def data_sementara():
+    """transaction.atomic yang selalu di-rollback: data benchmark tidak pernah tersimpan."""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def ukur(fungsi, ulang):
+    """Menjalankan `fungsi` `ulang` kali; waktu (ms) median, p99 dan maksimum."""
+    waktu = []
+    for _ in range(ulang):
+        mulai = time.perf_counter()
+        fungsi()
+        waktu.append((time.perf_counter() - mulai) * 1000)
+    waktu.sort()
+    return {
+        'median': waktu[len(waktu) // 2],
+        'p99': waktu[min(len(waktu) - 1, int(len(waktu) * 0.99))],
+        'maks': waktu[-1],
+    }
+
+
+def format_waktu(hasil):
+    return '  '.join(f"{nama} {ms:8.2f} ms" for nama, ms in hasil.items())
+
+
+def rencana_query(queryset):
+    """Rencana eksekusi `queryset`; di Postgres dengan ANALYZE agar waktu aslinya ikut tampil."""
+    if connection.vendor == 'postgresql':
+        return queryset.explain(analyze=True, buffers=True)
+    return queryset.explain()
+
+
+def buat_request(**params):
+    """Request DRF GET dengan query `params`, untuk memanggil paginator/filter langsung."""
+    return Request(APIRequestFactory().get('/', params))
+
+
+def panggil_view(view, user, **params):
+    """GET ke `view` (hasil as_view) sebagai `user`; melempar AssertionError jika status bukan 200."""
+    request = APIRequestFactory().get('/', params)
+    force_authenticate(request, user=user)
+    response = view(request)
+    assert response.status_code == 200, (response.status_code, getattr(response, 'data', None))
+    return response
+
+
+def kode_acak():
+    """Penanda unik per run, agar data benchmark tidak bentrok dengan kolom unique yang sudah ada."""
+    return 'B' + uuid.uuid4().hex[:6].upper()
+
+
+def buat_katalog(jumlah_varian, awalan=None):
+    """
+    Katalog sintetis `jumlah_varian` varian (lima per produk) dengan bulk_create.
+    Nama produk berakhiran `{awalan}{nomor}` dan SKU berbentuk `{awalan}0000001`.
+    Mengembalikan list VarianProduk.
+    """
+    from products.models import Kategori, Produk, VarianProduk, buat_dokumen_cari
+
+    awalan = awalan or kode_acak()
+    acak = random.Random(jumlah_varian)
+    kategori = Kategori.objects.create(nama_kategori=f'{awalan} Kategori')
+    nama_list = [f'{m} {j} {u}' for u in UKURAN for m in MEREK for j in JENIS]
+    jumlah_produk = -(-jumlah_varian // len(VARIAN))
+    produk_list = []
+    for i in range(0, jumlah_produk, BATCH_SIZE):
+        produk_list += Produk.objects.bulk_create([
+            Produk(nama_produk=f'{nama_list[n % len(nama_list)]} {awalan}{n // len(nama_list)}', kategori=kategori)
+            for n in range(i, min(i + BATCH_SIZE, jumlah_produk))
+        ])
+
+    varian_list = []
+    for i in range(0, jumlah_varian, BATCH_SIZE):
+        batch = []
+        for n in range(i, min(i + BATCH_SIZE, jumlah_varian)):
+            produk, nama_varian, sku = produk_list[n // len(VARIAN)], VARIAN[n % len(VARIAN)], f'{awalan}{n:07d}'
+            harga = acak.randrange(10, 500) * 100
+            batch.append(VarianProduk(
+                produk_induk=produk, nama_varian=nama_varian, sku=sku, satuan='pcs',
+                stok=acak.randrange(0, 200), purchase_price=harga * 8 // 10, harga_jual_normal=harga,
+                dokumen_cari=buat_dokumen_cari(produk.nama_produk, nama_varian, sku),
+            ))
+        varian_list += VarianProduk.objects.bulk_create(batch)
+    return varian_list
+
+
+def kueri_uji(varian_list, jumlah, seed=0):
+    """
+    Dua list kueri dari nama produk katalog sintetis: awalan (empat huruf
+    pertama tiap kata, mis. 'indo gore') dan salah ketik (satu huruf di kata
+    terpanjang diganti, mis. 'indomie gorwng').
+    """
+    acak = random.Random(seed)
+    awalan, salah_ketik = [], []
+    for varian in acak.sample(varian_list, min(jumlah, len(varian_list))):
+        kata = varian.produk_induk.nama_produk.lower().split()[:2]
+        awalan.append(' '.join(k[:4] for k in kata))
+        i = max(range(len(kata)), key=lambda n: len(kata[n]))
+        posisi = acak.randrange(1, len(kata[i]))
+        ganti = acak.choice([h for h in 'abcdefghijklmnopqrstuvwxyz' if h != kata[i][posisi]])
+        salah_ketik.append(' '.join([*kata[:i], kata[i][:posisi] + ganti + kata[i][posisi + 1:], *kata[i + 1:]]))
+    return awalan, salah_ketik
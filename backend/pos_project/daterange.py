@@ -0,0 +1,35 @@
+# pos_project/daterange.py
+
+from datetime import date, datetime, time, timedelta
+from django.utils import timezone
+
+
+def awal_hari(tanggal):
+    """Datetime (timezone-aware) tepat pada pukul 00:00 untuk tanggal tersebut."""
+    if isinstance(tanggal, str):
+        tanggal = date.fromisoformat(tanggal)
+    return timezone.make_aware(datetime.combine(tanggal, time.min))
+
+
+def rentang_waktu(start_date=None, end_date=None):
+    """
+    Mengubah parameter tanggal laporan (YYYY-MM-DD, inklusif) menjadi batas
+    datetime setengah terbuka [awal, akhir) yang timezone-aware.
+    Filter `created_at__gte=awal, created_at__lt=akhir` bisa memakai index,
+    berbeda dengan `created_at__date__range` yang meng-cast kolomnya.
+    Melempar ValueError jika format tanggal salah.
+    """
+    awal = awal_hari(start_date) if start_date else None
+    akhir = awal_hari(end_date) + timedelta(days=1) if end_date else None
+    return awal, akhir
+
+
+def filter_rentang(field, start_date=None, end_date=None):
+    """Kwargs filter setengah terbuka untuk `field` sesuai rentang_waktu."""
+    awal, akhir = rentang_waktu(start_date, end_date)
+    kwargs = {}
+    if awal:
+        kwargs[f'{field}__gte'] = awal
+    if akhir:
+        kwargs[f'{field}__lt'] = akhir
+    return kwargs
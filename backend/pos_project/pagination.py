@@ -1,8 +1,167 @@
 # pos_project/pagination.py
 
+import base64
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# Batas page_size yang bisa diminta klien; dikirim di setiap response sebagai
+# `max_page_size` agar frontend tahu berapa yang benar-benar dilayani.
+MAKS_HALAMAN = getattr(settings, 'PAGINATION_MAKS_HALAMAN', 1000)
+
+
+def perkiraan_jumlah(queryset):
+    """
+    Perkiraan jumlah baris dari planner Postgres (EXPLAIN), tanpa COUNT(*).
+    Di database lain jatuh ke count() biasa.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        rencana = cursor.fetchone()[0]
+    if isinstance(rencana, str):
+        rencana = json.loads(rencana)
+    return int(rencana[0]['Plan']['Plan Rows'])
+
+
+class _Paginator(DjangoPaginator):
+    """Paginator Django yang bisa menerima jumlah baris yang sudah diketahui."""
+
+    def __init__(self, object_list, per_page, jumlah=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if jumlah is not None:
+            self.__dict__['count'] = jumlah
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 5  # Ukuran halaman default
     page_size_query_param = 'page_size' # Parameter untuk override (cth: ?page_size=100)
-    max_page_size = 100000 # Batas maksimal yang diizinkan
\ No newline at end of file
+    max_page_size = MAKS_HALAMAN
+    hitung_query_param = 'hitung'  # ?hitung=perkiraan memakai estimasi planner
+
+    # Diisi view jika jumlah baris sudah dihitung (mis. bersama ringkasan)
+    jumlah_diketahui = None
+
+    def django_paginator_class(self, queryset, page_size):
+        jumlah = self.jumlah_diketahui
+        if jumlah is None and self.request.query_params.get(self.hitung_query_param) == 'perkiraan':
+            jumlah = perkiraan_jumlah(queryset)
+        return _Paginator(queryset, page_size, jumlah=jumlah)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        return super().paginate_queryset(queryset, request, view)
+
+    def halaman_pertama(self, request):
+        return request.query_params.get(self.page_query_param, '1') in ('', '1')
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['page_size'] = self.page.paginator.per_page
+        response.data['max_page_size'] = self.max_page_size
+        return response
+
+
+class RiwayatPagination(StandardResultsSetPagination):
+    """
+    Pagination untuk riwayat yang terus bertambah (transaksi, riwayat stok).
+    Tanpa `?cursor` perilakunya sama dengan StandardResultsSetPagination.
+    Dengan `?cursor=` (kosong untuk halaman pertama) dipakai keyset pagination
+    pada (created_at, id) menurun: setiap halaman cukup satu query dengan
+    `WHERE (created_at, id) < posisi LIMIT n`, tanpa OFFSET dan tanpa COUNT.
+    Jumlah baris hanya dihitung jika diminta dengan `?hitung=tepat|perkiraan`.
+    """
+    cursor_query_param = 'cursor'
+    kolom_urut = 'created_at'
+
+    def mode_kursor(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def halaman_pertama(self, request):
+        if self.mode_kursor(request):
+            return not request.query_params.get(self.cursor_query_param)
+        return super().halaman_pertama(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.mode_kursor(request):
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ukuran = self.get_page_size(request)
+        mundur, posisi = self._baca_kursor(request.query_params.get(self.cursor_query_param))
+
+        self.jumlah = None
+        hitung = request.query_params.get(self.hitung_query_param)
+        if self.jumlah_diketahui is not None:
+            self.jumlah = self.jumlah_diketahui
+        elif hitung == 'tepat':
+            self.jumlah = queryset.count()
+        elif hitung == 'perkiraan':
+            self.jumlah = perkiraan_jumlah(queryset)
+
+        kolom = self.kolom_urut
+        if posisi is not None:
+            nilai, pk = posisi
+            if mundur:
+                queryset = queryset.filter(Q(**{f'{kolom}__gt': nilai}) | Q(**{kolom: nilai, 'id__gt': pk}))
+            else:
+                queryset = queryset.filter(Q(**{f'{kolom}__lt': nilai}) | Q(**{kolom: nilai, 'id__lt': pk}))
+        urutan = (kolom, 'id') if mundur else (f'-{kolom}', '-id')
+        baris = list(queryset.order_by(*urutan)[:self.ukuran + 1])
+        ada_lagi = len(baris) > self.ukuran
+        baris = baris[:self.ukuran]
+        if mundur:
+            baris.reverse()
+
+        self.kursor_berikut = self.kursor_sebelum = None
+        if baris:
+            if ada_lagi or mundur:
+                self.kursor_berikut = self._tulis_kursor(baris[-1], mundur=False)
+            if (ada_lagi and mundur) or (posisi is not None and not mundur):
+                self.kursor_sebelum = self._tulis_kursor(baris[0], mundur=True)
+        return baris
+
+    def get_paginated_response(self, data):
+        if not self.mode_kursor(self.request):
+            return super().get_paginated_response(data)
+        url = self.request.build_absolute_uri()
+        response = {
+            'next': replace_query_param(url, self.cursor_query_param, self.kursor_berikut) if self.kursor_berikut else None,
+            'previous': replace_query_param(url, self.cursor_query_param, self.kursor_sebelum) if self.kursor_sebelum else None,
+        }
+        if self.jumlah is not None:
+            response['count'] = self.jumlah
+        response.update({'page_size': self.ukuran, 'max_page_size': self.max_page_size, 'results': data})
+        return Response(response)
+
+    @staticmethod
+    def _kode(data):
+        return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    def _tulis_kursor(self, obj, mundur):
+        return self._kode({'t': getattr(obj, self.kolom_urut).isoformat(), 'i': obj.pk, 'm': int(mundur)})
+
+    def _baca_kursor(self, kursor):
+        """(mundur, (nilai, pk)) dari kursor opaque; posisi None untuk halaman pertama."""
+        if not kursor:
+            return False, None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(kursor + '=' * (-len(kursor) % 4)))
+            nilai = parse_datetime(data['t'])
+            pk = int(data['i'])
+            if nilai is None:
+                raise ValueError
+        except (ValueError, TypeError, KeyError, json.JSONDecodeError):
+            raise NotFound('Kursor tidak valid.')
+        return bool(data.get('m')), (nilai, pk)
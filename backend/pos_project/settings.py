@@ -109,6 +109,24 @@ if database_url:
         ssl_require=True
     )
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Default locmem. Set CACHE_BACKEND/CACHE_LOCATION (mis. filebased) agar cache
+# katalog bisa dipakai bersama oleh beberapa worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Alias cache untuk tier bersama katalog kasir; kosong = hanya LRU in-process.
+KATALOG_CACHE_ALIAS = os.environ.get('KATALOG_CACHE_ALIAS') or None
+
+# Lama reservasi stok untuk transaksi ditahan (menit); 0 = tanpa reservasi.
+RESERVASI_DITAHAN_MENIT = int(os.environ.get('RESERVASI_DITAHAN_MENIT', '0'))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -197,6 +215,9 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'pos_project.pagination.StandardResultsSetPagination',
 }
 
+# Batas page_size yang dilayani API (frontend memuat katalog kasir dengan page_size=1000).
+PAGINATION_MAKS_HALAMAN = int(os.environ.get('PAGINATION_MAKS_HALAMAN', '1000'))
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=15),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
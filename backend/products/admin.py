@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import Kategori, Pemasok, Produk, VarianProduk, AturanHargaKuantitas
+from .models import Kategori, Pemasok, Produk, VarianProduk, AturanHargaKuantitas, BarcodeMetadata
 
 admin.site.register(Kategori)
 admin.site.register(Pemasok)
 admin.site.register(Produk)
 admin.site.register(VarianProduk)
-admin.site.register(AturanHargaKuantitas)
\ No newline at end of file
+admin.site.register(AturanHargaKuantitas)
+admin.site.register(BarcodeMetadata)
@@ -0,0 +1,283 @@
+# products/autocomplete.py
+
+import threading
+import time
+from collections import Counter
+from itertools import product
+
+from .cache_katalog import versi_katalog
+from .models import VarianProduk, buat_dokumen_cari, normalisasi_teks
+
+# Versi katalog dicek paling sering sekali per interval ini (detik); di antaranya
+# saran dijawab sepenuhnya dari memori tanpa query.
+INTERVAL_CEK_VERSI = 1.0
+MAKS_KANDIDAT_AWALAN = 300
+MAKS_KANDIDAT_FUZZY = 60
+# Trigram yang dimiliki terlalu banyak kata (mis. awalan SKU) tidak membedakan apa pun
+MAKS_KATA_PER_TRIGRAM = 2000
+MAKS_TOKEN = 4
+MAKS_HASIL = 50
+
+
+def _trigram(kata):
+    teks = f'^{kata}$'
+    return {teks[i:i + 3] for i in range(len(teks) - 2)}
+
+
+def _jarak_maks(token):
+    """Toleransi salah ketik per token: pendek tidak ditoleransi, panjang sampai 2."""
+    if len(token) <= 3:
+        return 0
+    return 1 if len(token) <= 6 else 2
+
+
+def jarak_edit(a, b, maks):
+    """Levenshtein a-b, berhenti lebih awal; mengembalikan maks + 1 jika lebih dari `maks`."""
+    if abs(len(a) - len(b)) > maks:
+        return maks + 1
+    sebelum = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        sekarang = [i]
+        for j, cb in enumerate(b, 1):
+            sekarang.append(min(sebelum[j] + 1, sekarang[j - 1] + 1, sebelum[j - 1] + (ca != cb)))
+        if min(sekarang) > maks:
+            return maks + 1
+        sebelum = sekarang
+    return sebelum[-1]
+
+
+class _Trie:
+    """Trie kata; setiap simpul akhir kata ditandai kunci '$'."""
+    __slots__ = ('akar',)
+
+    def __init__(self):
+        self.akar = {}
+
+    def tambah(self, kata):
+        simpul = self.akar
+        for huruf in kata:
+            simpul = simpul.setdefault(huruf, {})
+        simpul['$'] = True
+
+    def hapus(self, kata):
+        jalur = [self.akar]
+        for huruf in kata:
+            simpul = jalur[-1].get(huruf)
+            if simpul is None:
+                return
+            jalur.append(simpul)
+        jalur[-1].pop('$', None)
+        # Buang simpul yang sudah kosong dari bawah ke atas
+        for huruf, induk in zip(reversed(kata), reversed(jalur[:-1])):
+            if induk[huruf]:
+                break
+            del induk[huruf]
+
+    def awalan(self, prefix, batas):
+        """Sampai `batas` kata berawalan `prefix`, yang terpendek lebih dulu (BFS)."""
+        simpul = self.akar
+        for huruf in prefix:
+            simpul = simpul.get(huruf)
+            if simpul is None:
+                return []
+        hasil = []
+        antrean = [(prefix, simpul)]
+        while antrean and len(hasil) < batas:
+            berikut = []
+            for kata, node in antrean:
+                if '$' in node:
+                    hasil.append(kata)
+                    if len(hasil) >= batas:
+                        break
+                berikut.extend((kata + huruf, anak) for huruf, anak in node.items() if huruf != '$')
+            antrean = berikut
+        return hasil
+
+
+class MesinAutocomplete:
+    """
+    Autocomplete kasir di memori proses atas nama produk induk, nama varian
+    dan SKU varian aktif. Token yang diketik dicocokkan sebagai awalan lewat
+    trie, dan kata yang salah ketik dicari lewat index trigram lalu diverifikasi
+    dengan jarak edit terbatas. Semua token harus cocok; varian diurutkan
+    menurut total biaya (0 = persis, awalan dan salah ketik lebih mahal).
+
+    Saat versi katalog berubah, data varian dimuat dengan satu query dan hanya
+    varian yang berubah yang diindex ulang.
+    """
+
+    def __init__(self):
+        self._versi = None
+        self._cek_terakhir = 0.0
+        self._kunci = threading.RLock()
+        self._record = {}      # varian_id -> dict hasil
+        self._kata_varian = {}  # varian_id -> set kata
+        self._posting = {}     # kata -> set varian_id
+        self._trie = _Trie()
+        self._trigram = {}     # trigram -> set kata
+        self._urutan = []      # varian_id urut nama terpendek, untuk memecah skor yang sama
+        self._posisi = {}
+
+    # --- pemeliharaan index ---
+
+    def _tambah_kata(self, kata, varian_id):
+        posting = self._posting.get(kata)
+        if posting is None:
+            posting = self._posting[kata] = set()
+            self._trie.tambah(kata)
+            for gram in _trigram(kata):
+                self._trigram.setdefault(gram, set()).add(kata)
+        posting.add(varian_id)
+
+    def _hapus_kata(self, kata, varian_id):
+        posting = self._posting.get(kata)
+        if posting is None:
+            return
+        posting.discard(varian_id)
+        if not posting:
+            del self._posting[kata]
+            self._trie.hapus(kata)
+            for gram in _trigram(kata):
+                kata_gram = self._trigram.get(gram)
+                if kata_gram is not None:
+                    kata_gram.discard(kata)
+                    if not kata_gram:
+                        del self._trigram[gram]
+
+    def _hapus_varian(self, varian_id):
+        for kata in self._kata_varian.pop(varian_id, ()):
+            self._hapus_kata(kata, varian_id)
+        self._record.pop(varian_id, None)
+
+    def _muat(self):
+        data = {}
+        for varian_id, nama_produk, nama_varian, sku, satuan, harga in VarianProduk.objects.filter(
+            is_active=True
+        ).values_list('id', 'produk_induk__nama_produk', 'nama_varian', 'sku', 'satuan', 'harga_jual_normal'):
+            data[varian_id] = {
+                'id': varian_id, 'nama_produk': nama_produk, 'nama_varian': nama_varian,
+                'sku': sku, 'satuan': satuan, 'harga_jual_normal': str(harga),
+            }
+        return data
+
+    def segarkan(self, paksa=False):
+        """Menyamakan index dengan versi katalog terkini (paling sering sekali per interval)."""
+        sekarang = time.monotonic()
+        if not paksa and self._versi is not None and sekarang - self._cek_terakhir < INTERVAL_CEK_VERSI:
+            return
+        self._cek_terakhir = sekarang
+        versi = versi_katalog()[0]
+        if versi == self._versi and not paksa:
+            return
+        data = self._muat()
+        with self._kunci:
+            berubah = False
+            for varian_id in [v for v in self._record if v not in data]:
+                self._hapus_varian(varian_id)
+                berubah = True
+            for varian_id, record in data.items():
+                if self._record.get(varian_id) == record:
+                    continue
+                berubah = True
+                self._hapus_varian(varian_id)
+                kata = set(buat_dokumen_cari(record['nama_produk'], record['nama_varian'], record['sku']).split())
+                for k in kata:
+                    self._tambah_kata(k, varian_id)
+                self._kata_varian[varian_id] = kata
+                self._record[varian_id] = record
+            if berubah:
+                self._urutan = sorted(
+                    self._record, key=lambda v: (len(self._record[v]['nama_produk']) + len(self._record[v]['nama_varian']), v)
+                )
+                self._posisi = {varian_id: i for i, varian_id in enumerate(self._urutan)}
+            self._versi = versi
+
+    # --- pencarian ---
+
+    def _kandidat_kata(self, token):
+        """{kata: biaya} untuk satu token: persis 0, awalan 0.5, salah ketik = jarak (+0.5 jika awalan)."""
+        biaya = {}
+        for kata in self._trie.awalan(token, MAKS_KANDIDAT_AWALAN):
+            biaya[kata] = 0.0 if kata == token else 0.5
+
+        maks = 0 if token.isdigit() else _jarak_maks(token)
+        if maks:
+            hitung = Counter()
+            for gram in _trigram(token):
+                kata_gram = self._trigram.get(gram, ())
+                if len(kata_gram) <= MAKS_KATA_PER_TRIGRAM:
+                    hitung.update(kata_gram)
+            for kata, _ in hitung.most_common(MAKS_KANDIDAT_FUZZY):
+                if kata in biaya:
+                    continue
+                jarak = jarak_edit(token, kata, maks)
+                if jarak <= maks:
+                    biaya[kata] = float(jarak)
+                    continue
+                # Token yang belum selesai diketik: bandingkan dengan awalan kata
+                if len(kata) > len(token):
+                    jarak = jarak_edit(token, kata[:len(token)], maks)
+                    if jarak <= maks:
+                        biaya[kata] = jarak + 0.5
+        return biaya
+
+    def _tingkat(self, token):
+        """[(biaya, set varian_id)] satu token, biaya naik dan himpunannya saling lepas."""
+        per_biaya = {}
+        for kata, biaya in self._kandidat_kata(token).items():
+            per_biaya.setdefault(biaya, []).append(self._posting[kata])
+        tingkat, terlihat = [], set()
+        for biaya in sorted(per_biaya):
+            ids = set().union(*per_biaya[biaya]) - terlihat
+            if ids:
+                terlihat |= ids
+                tingkat.append((biaya, ids))
+        return tingkat
+
+    def _ambil_urut(self, ids, jumlah):
+        """`jumlah` id pertama dari `ids` menurut urutan global (nama terpendek dulu)."""
+        if len(ids) * 8 < len(self._urutan):
+            return sorted(ids, key=self._posisi.__getitem__)[:jumlah]
+        hasil = []
+        for varian_id in self._urutan:
+            if varian_id in ids:
+                hasil.append(varian_id)
+                if len(hasil) >= jumlah:
+                    break
+        return hasil
+
+    def cari(self, teks, limit=10):
+        """Sampai `limit` record varian yang paling cocok dengan `teks`, dengan `skor` (kecil = lebih cocok)."""
+        self.segarkan()
+        token_list = list(dict.fromkeys(normalisasi_teks(teks).split()))[:MAKS_TOKEN]
+        if not token_list:
+            return []
+        with self._kunci:
+            tingkat_list = []
+            for token in token_list:
+                tingkat = self._tingkat(token)
+                if not tingkat:
+                    return []
+                tingkat_list.append(tingkat)
+
+            # Kombinasi tingkat per token diurutkan menurut total biaya; irisan
+            # himpunan dikerjakan di C dan berhenti begitu hasil cukup.
+            hasil = []
+            batas_biaya = None
+            for kombinasi in sorted(product(*tingkat_list), key=lambda k: sum(b for b, _ in k)):
+                biaya = sum(b for b, _ in kombinasi)
+                if batas_biaya is not None and biaya > batas_biaya:
+                    break
+                himpunan = sorted((ids for _, ids in kombinasi), key=len)
+                ids = himpunan[0].intersection(*himpunan[1:])
+                if not ids:
+                    continue
+                # Kombinasi lain dengan biaya sama masih diambil, lalu diurutkan ulang di bawah
+                hasil.extend((biaya, v) for v in self._ambil_urut(ids, limit))
+                if len(hasil) >= limit and batas_biaya is None:
+                    batas_biaya = biaya
+            hasil.sort(key=lambda item: (item[0], self._posisi[item[1]]))
+            return [{**self._record[varian_id], 'skor': biaya} for biaya, varian_id in hasil[:limit]]
+
+
+autocomplete = MesinAutocomplete()
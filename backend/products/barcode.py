@@ -0,0 +1,109 @@
+# products/barcode.py
+
+import threading
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .models import BarcodeMetadata
+
+URL_OFF = "https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
+# (connect, read) dalam detik; upstream yang lambat tidak boleh menahan kasir
+TIMEOUT = getattr(settings, 'BARCODE_LOOKUP_TIMEOUT', (2, 3))
+TTL_DITEMUKAN = timedelta(days=getattr(settings, 'BARCODE_CACHE_TTL_HARI', 30))
+TTL_NEGATIF = timedelta(hours=getattr(settings, 'BARCODE_CACHE_NEGATIF_JAM', 24))
+
+FIELD_DATA = ('nama_produk_induk', 'nama_varian', 'kategori', 'pemasok')
+
+_session = None
+_kunci_session = threading.Lock()
+
+
+class BarcodeLookupError(Exception):
+    """Layanan eksternal tidak bisa dihubungi dan tidak ada cache yang bisa dipakai."""
+    pass
+
+
+def _get_session():
+    """Session HTTP per proses dengan connection pool (keep-alive dipakai ulang)."""
+    global _session
+    if _session is None:
+        with _kunci_session:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=10, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def format_produk_off(barcode, product_data):
+    """Memetakan data produk Open Food Facts ke field form produk frontend."""
+    kategori = product_data.get('categories_tags') or [None]
+    if isinstance(kategori, str):
+        # Dump CSV menyimpan tag sebagai teks dipisah koma
+        kategori = kategori.split(',')
+    return {
+        'nama_produk_induk': product_data.get('product_name_id', '') or product_data.get('product_name', '') or '',
+        'nama_varian': product_data.get('generic_name_id', '') or product_data.get('generic_name', '') or 'Eceran',
+        'sku': barcode,
+        'kategori': kategori[0] or None,
+        'pemasok': product_data.get('brands', None) or None,
+    }
+
+
+def potong_field(data):
+    """Field metadata yang dipotong sesuai panjang kolom tabel."""
+    return {f: data[f][:255] if isinstance(data[f], str) else data[f] for f in FIELD_DATA}
+
+
+def _masih_berlaku(meta):
+    if meta.sumber == BarcodeMetadata.Sumber.IMPOR:
+        return True
+    ttl = TTL_DITEMUKAN if meta.ditemukan else TTL_NEGATIF
+    return meta.diperbarui_pada >= timezone.now() - ttl
+
+
+def _sebagai_data(meta):
+    if not meta.ditemukan:
+        return None
+    return {'sku': meta.barcode, **{f: getattr(meta, f) for f in FIELD_DATA}}
+
+
+def cari_barcode(barcode):
+    """
+    Mencari metadata barcode: dari tabel lokal jika masih berlaku, jika tidak
+    dari Open Food Facts lalu disimpan (termasuk hasil negatif). Mengembalikan
+    dict data atau None jika produk tidak ada. Jika upstream gagal, data lokal
+    yang sudah kedaluwarsa tetap dipakai; tanpa itu BarcodeLookupError dilempar.
+    """
+    meta = BarcodeMetadata.objects.filter(barcode=barcode).first()
+    if meta is not None and _masih_berlaku(meta):
+        return _sebagai_data(meta)
+
+    try:
+        response = _get_session().get(URL_OFF.format(barcode=barcode), timeout=TIMEOUT)
+        if response.status_code == 404:
+            data = {'status': 0}
+        else:
+            response.raise_for_status()
+            data = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        if meta is not None:
+            return _sebagai_data(meta)
+        raise BarcodeLookupError(str(e))
+
+    if data.get('status') == 1 and data.get('product'):
+        hasil = format_produk_off(barcode, data['product'])
+        defaults = {'ditemukan': True, **potong_field(hasil)}
+    else:
+        hasil = None
+        defaults = {'ditemukan': False, **{f: None if f in ('kategori', 'pemasok') else '' for f in FIELD_DATA}}
+    BarcodeMetadata.objects.update_or_create(
+        barcode=barcode, defaults={**defaults, 'sumber': BarcodeMetadata.Sumber.API}
+    )
+    return hasil
@@ -0,0 +1,125 @@
+# products/cache_katalog.py
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.utils.http import parse_etags
+
+from .models import VersiKatalog
+
+PK_VERSI = 1
+MAKS_LOKAL = getattr(settings, 'KATALOG_CACHE_LOKAL_MAKS', 64)
+TIMEOUT_BERSAMA = getattr(settings, 'KATALOG_CACHE_TIMEOUT', 60 * 60)
+
+_lokal = OrderedDict()
+_kunci_lokal = threading.Lock()
+
+
+def versi_katalog():
+    """(versi, versi_stok) terkini, dibaca dengan satu query primary key."""
+    try:
+        return VersiKatalog.objects.values_list('versi', 'versi_stok').get(pk=PK_VERSI)
+    except VersiKatalog.DoesNotExist:
+        VersiKatalog.objects.get_or_create(pk=PK_VERSI)
+        return 0, 0
+
+
+def _naikkan(kolom):
+    if not VersiKatalog.objects.filter(pk=PK_VERSI).update(**{kolom: F(kolom) + 1}):
+        VersiKatalog.objects.get_or_create(pk=PK_VERSI, defaults={kolom: 1})
+
+
+def versi_stok_rendah():
+    try:
+        return VersiKatalog.objects.values_list('versi_stok_rendah', flat=True).get(pk=PK_VERSI)
+    except VersiKatalog.DoesNotExist:
+        VersiKatalog.objects.get_or_create(pk=PK_VERSI)
+        return 0
+
+
+def naikkan_versi(stok=False, stok_rendah=False):
+    """
+    Menaikkan versi katalog setelah transaksi yang sedang berjalan di-commit.
+    Dijalankan di luar transaksi agar baris versi tidak terkunci selama checkout
+    berlangsung; pembaca yang sempat menyimpan data baru di bawah versi lama
+    tetap aman karena datanya sudah yang terbaru.
+    """
+    kolom = 'versi_stok_rendah' if stok_rendah else 'versi_stok' if stok else 'versi'
+    transaction.on_commit(lambda: _naikkan(kolom))
+
+
+def _digest(versi, query_params):
+    params = sorted((k, v) for k in query_params for v in query_params.getlist(k))
+    return hashlib.md5(repr((tuple(versi), params)).encode()).hexdigest()[:16]
+
+
+def etag_katalog(versi, query_params):
+    """ETag untuk daftar katalog: (versi, versi_stok) + parameter query yang dipakai."""
+    return f'"katalog-{versi[0]}-{versi[1]}-{_digest(versi, query_params)}"'
+
+
+def kunci_katalog(versi, query_params):
+    """
+    Kunci cache payload katalog. Hanya memakai versi struktur (produk, harga),
+    bukan versi_stok, agar penjualan tidak membuang cache; stok ditimpa per
+    request oleh view.
+    """
+    return f'katalog:{versi}:{_digest((versi,), query_params)}'
+
+
+def etag_cocok(etag, if_none_match):
+    """
+    Apakah header If-None-Match cocok dengan `etag`: daftar entity tag dipisah
+    koma atau `*`, dibandingkan secara lemah (prefix W/ diabaikan) seperti
+    yang diminta RFC 9110 untuk GET.
+    """
+    if not if_none_match:
+        return False
+    tag_list = parse_etags(if_none_match)
+    if tag_list == ['*']:
+        return True
+    etag = etag.removeprefix('W/')
+    return any(tag.removeprefix('W/') == etag for tag in tag_list)
+
+
+def _cache_bersama():
+    alias = getattr(settings, 'KATALOG_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def ambil(kunci):
+    """Mencari data di LRU lokal, lalu di cache bersama (jika diaktifkan)."""
+    with _kunci_lokal:
+        if kunci in _lokal:
+            _lokal.move_to_end(kunci)
+            return _lokal[kunci]
+    bersama = _cache_bersama()
+    data = bersama.get(kunci) if bersama is not None else None
+    if data is not None:
+        _simpan_lokal(kunci, data)
+    return data
+
+
+def simpan(kunci, data):
+    _simpan_lokal(kunci, data)
+    bersama = _cache_bersama()
+    if bersama is not None:
+        bersama.set(kunci, data, TIMEOUT_BERSAMA)
+
+
+def _simpan_lokal(kunci, data):
+    with _kunci_lokal:
+        _lokal[kunci] = data
+        _lokal.move_to_end(kunci)
+        while len(_lokal) > MAKS_LOKAL:
+            _lokal.popitem(last=False)
+
+
+def kosongkan_lokal():
+    with _kunci_lokal:
+        _lokal.clear()
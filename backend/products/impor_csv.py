@@ -0,0 +1,268 @@
+# products/impor_csv.py
+
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+
+from transactions.models import StockHistory
+from transactions.persediaan import buka_persediaan
+from transactions.services import setel_stok
+from .cache_katalog import naikkan_versi
+from .models import Kategori, Pemasok, Produk, VarianProduk, buat_dokumen_cari
+from . import stok_rendah
+
+UKURAN_CHUNK = 500
+MAKS_ERROR = 200
+CATATAN_STOK = 'Impor CSV'
+NOL = Decimal('0')
+KOLOM_WAJIB = ('kategori', 'nama_produk_induk', 'nama_varian')
+
+# Field varian yang diisi dari CSV dan dibandingkan untuk mendeteksi baris tidak berubah
+FIELD_BANDING = (
+    'produk_induk_id', 'pemasok_id', 'nama_varian', 'stok', 'satuan',
+    'purchase_price', 'harga_jual_normal', 'harga_jual_reseller', 'lacak_stok',
+)
+# Stok tidak ikut di-upsert: selisihnya diterapkan lewat `setel_stok` agar tercatat di riwayat dan valuasi
+FIELD_UPDATE_SKU = [
+    'produk_induk', 'pemasok', 'nama_varian', 'satuan',
+    'purchase_price', 'harga_jual_normal', 'harga_jual_reseller', 'lacak_stok', 'dokumen_cari',
+]
+# Kunci nama: produk, nama varian dan SKU lama tetap, jadi dokumen pencarian tidak berubah
+FIELD_UPDATE_NAMA = [f for f in FIELD_UPDATE_SKU if f not in ('produk_induk', 'nama_varian', 'dokumen_cari')]
+
+
+class ImporError(Exception):
+    """Kesalahan yang membuat seluruh file tidak bisa diproses (mis. kolom wajib hilang)."""
+    pass
+
+
+def _desimal(nilai, presisi, nama, batas, default=Decimal('0')):
+    if nilai is None or str(nilai).strip() == '':
+        return default
+    try:
+        angka = Decimal(str(nilai).strip()).quantize(Decimal(presisi))
+    except InvalidOperation:
+        raise ValueError(f"Kolom {nama} bukan angka: '{nilai}'.")
+    if abs(angka) >= batas:
+        raise ValueError(f"Kolom {nama} terlalu besar: '{nilai}'.")
+    return angka
+
+
+def _parse_baris(row):
+    """Mengubah satu baris CSV menjadi dict siap pakai; ValueError jika tidak valid."""
+    nama_produk = (row.get('nama_produk_induk') or '').strip()
+    nama_varian = (row.get('nama_varian') or '').strip()
+    kategori = (row.get('kategori') or '').strip()
+    if not (nama_produk and nama_varian and kategori):
+        raise ValueError('Kolom kategori, nama_produk_induk dan nama_varian wajib diisi.')
+    return {
+        'kategori': kategori,
+        'pemasok': (row.get('pemasok') or '').strip() or None,
+        'nama_produk': nama_produk,
+        'nama_varian': nama_varian,
+        'sku': (row.get('sku') or '').strip() or None,
+        'stok': _desimal(row.get('stok'), '0.001', 'stok', Decimal('1e7')),
+        'satuan': (row.get('satuan') or '').strip() or 'pcs',
+        'purchase_price': _desimal(row.get('harga_beli'), '0.01', 'harga_beli', Decimal('1e10')),
+        'harga_jual_normal': _desimal(row.get('harga_ecer'), '0.01', 'harga_ecer', Decimal('1e10')),
+        'harga_jual_reseller': _desimal(row.get('harga_grosir'), '0.01', 'harga_grosir', Decimal('1e10'), default=None),
+        'lacak_stok': (row.get('lacak_stok') or 'True').lower() == 'true',
+    }
+
+
+class ImporVarianCSV:
+    """
+    Importer CSV produk yang membaca file secara streaming per chunk.
+    Kategori, pemasok dan produk induk di-resolve lewat dict yang dimuat sekali
+    di awal; varian di-upsert dengan `bulk_create(update_conflicts=True)` per
+    chunk dalam transaksi pendek. Stok tidak ditulis langsung: varian baru
+    dibuat dengan stok 0 dan saldo awal persediaan, lalu stok dari file
+    disetel lewat `setel_stok` (AWAL untuk varian baru, OPNAME untuk varian
+    lama) sehingga StockHistory dan lapisan biaya ikut tercatat. Baris yang
+    isinya sama dengan database dilewati. Dengan `dry_run=True` tidak ada
+    yang ditulis, hanya laporannya.
+    """
+
+    def __init__(self, dry_run=False, ukuran_chunk=UKURAN_CHUNK, user=None):
+        self.dry_run = dry_run
+        self.user = user
+        self.ukuran_chunk = ukuran_chunk
+        self.kategori = dict(Kategori.objects.values_list('nama_kategori', 'id'))
+        # Nama pemasok tidak unik: pakai id terkecil, sama seperti data lama dibuat
+        self.pemasok = dict(Pemasok.objects.order_by('-id').values_list('nama_pemasok', 'id'))
+        self.produk = dict(Produk.objects.values_list('nama_produk', 'id'))
+        self.laporan = {
+            'dry_run': dry_run,
+            'dibuat': 0, 'diperbarui': 0, 'tidak_berubah': 0, 'duplikat': 0, 'gagal': 0,
+            'kategori_baru': [], 'pemasok_baru': [], 'produk_baru': [],
+            'errors': [],
+        }
+
+    def jalankan(self, berkas):
+        teks = io.TextIOWrapper(berkas, encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(teks)
+        kolom = reader.fieldnames or []
+        hilang = [k for k in KOLOM_WAJIB if k not in kolom]
+        if hilang:
+            raise ImporError(f"Kolom wajib tidak ditemukan: {', '.join(hilang)}.")
+
+        baris = ((reader.line_num, row) for row in reader)
+        while True:
+            chunk = list(islice(baris, self.ukuran_chunk))
+            if not chunk:
+                break
+            self._proses_chunk(chunk)
+
+        if not self.dry_run and (self.laporan['dibuat'] or self.laporan['diperbarui']):
+            # bulk_create tidak memicu signal, jadi versi katalog dinaikkan manual
+            naikkan_versi()
+            naikkan_versi(stok=True)
+            # ...dan status stok rendah disamakan sekali untuk seluruh impor
+            with transaction.atomic():
+                stok_rendah.sinkronkan()
+        return self.laporan
+
+    def _error(self, nomor, pesan):
+        self.laporan['gagal'] += 1
+        if len(self.laporan['errors']) < MAKS_ERROR:
+            self.laporan['errors'].append({'baris': nomor, 'pesan': pesan})
+
+    def _proses_chunk(self, chunk):
+        data = []
+        for nomor, row in chunk:
+            try:
+                data.append((nomor, _parse_baris(row)))
+            except ValueError as e:
+                self._error(nomor, str(e))
+        if not data:
+            return
+
+        if self.dry_run:
+            self._catat_dimensi_baru(data)
+            self._upsert(data)
+        else:
+            with transaction.atomic():
+                self._buat_dimensi(data)
+                self._upsert(data)
+
+    def _dimensi_baru(self, data):
+        kategori = {d['kategori'] for _, d in data if d['kategori'] not in self.kategori}
+        pemasok = {d['pemasok'] for _, d in data if d['pemasok'] and d['pemasok'] not in self.pemasok}
+        produk = {}
+        for _, d in data:
+            if d['nama_produk'] not in self.produk:
+                produk.setdefault(d['nama_produk'], d['kategori'])
+        return kategori, pemasok, produk
+
+    def _catat_dimensi_baru(self, data):
+        kategori, pemasok, produk = self._dimensi_baru(data)
+        # Tandai dengan None agar tidak dilaporkan dua kali di chunk berikutnya
+        for nama, kunci in ((kategori, 'kategori'), (pemasok, 'pemasok'), (produk, 'produk')):
+            for n in nama:
+                getattr(self, kunci)[n] = None
+            self.laporan[f'{kunci}_baru'].extend(sorted(nama))
+
+    def _buat_dimensi(self, data):
+        kategori, pemasok, produk = self._dimensi_baru(data)
+        if kategori:
+            Kategori.objects.bulk_create([Kategori(nama_kategori=n) for n in kategori], ignore_conflicts=True)
+            self.kategori.update(Kategori.objects.filter(nama_kategori__in=kategori).values_list('nama_kategori', 'id'))
+            self.laporan['kategori_baru'].extend(sorted(kategori))
+        if pemasok:
+            Pemasok.objects.bulk_create([Pemasok(nama_pemasok=n) for n in pemasok])
+            self.pemasok.update(
+                Pemasok.objects.filter(nama_pemasok__in=pemasok).order_by('-id').values_list('nama_pemasok', 'id')
+            )
+            self.laporan['pemasok_baru'].extend(sorted(pemasok))
+        if produk:
+            Produk.objects.bulk_create(
+                [Produk(nama_produk=n, kategori_id=self.kategori[k]) for n, k in produk.items()],
+                ignore_conflicts=True,
+            )
+            self.produk.update(Produk.objects.filter(nama_produk__in=produk).values_list('nama_produk', 'id'))
+            self.laporan['produk_baru'].extend(sorted(produk))
+
+    def _upsert(self, data):
+        # Baris dengan kunci yang sama di satu chunk: baris terakhir yang berlaku
+        per_kunci = {}
+        for nomor, d in data:
+            d['produk_induk_id'] = self.produk.get(d['nama_produk'])
+            d['pemasok_id'] = self.pemasok.get(d['pemasok']) if d['pemasok'] else None
+            kunci = ('sku', d['sku']) if d['sku'] else ('nama', d['nama_produk'], d['nama_varian'])
+            if kunci in per_kunci:
+                self.laporan['duplikat'] += 1
+            per_kunci[kunci] = (nomor, d)
+
+        skus = [d['sku'] for _, d in per_kunci.values() if d['sku']]
+        produk_ids = {d['produk_induk_id'] for _, d in per_kunci.values() if d['produk_induk_id']}
+        nama_varian = {d['nama_varian'] for _, d in per_kunci.values()}
+        ada = list(VarianProduk.objects.filter(
+            Q(sku__in=skus) | Q(produk_induk_id__in=produk_ids, nama_varian__in=nama_varian)
+        ).values('id', 'sku', *FIELD_BANDING))
+        per_sku = {v['sku']: v for v in ada if v['sku']}
+        per_nama = {(v['produk_induk_id'], v['nama_varian']): v for v in ada}
+
+        tulis_sku, tulis_nama, pasangan_dipakai = [], [], set()
+        for nomor, d in per_kunci.values():
+            pasangan = (d['produk_induk_id'], d['nama_varian'])
+            if d['sku']:
+                lama = per_sku.get(d['sku'])
+                pemilik = per_nama.get(pasangan) if d['produk_induk_id'] else None
+                if (pemilik and (lama is None or pemilik['id'] != lama['id'])) or \
+                        (d['produk_induk_id'] and pasangan in pasangan_dipakai):
+                    self._error(nomor, f"Varian '{d['nama_varian']}' sudah ada di produk '{d['nama_produk']}' dengan SKU lain.")
+                    continue
+                pasangan_dipakai.add(pasangan)
+                tujuan = tulis_sku
+            else:
+                lama = per_nama.get(pasangan) if d['produk_induk_id'] else None
+                tujuan = tulis_nama
+
+            if lama is not None and all(lama[f] == d[f] for f in FIELD_BANDING):
+                self.laporan['tidak_berubah'] += 1
+                continue
+            self.laporan['diperbarui' if lama is not None else 'dibuat'] += 1
+            d['varian_id'] = lama['id'] if lama is not None else None
+            tujuan.append(d)
+
+        if self.dry_run:
+            return
+        varian_baru = []
+        for tulis, unique_fields, update_fields in (
+            (tulis_sku, ['sku'], FIELD_UPDATE_SKU),
+            (tulis_nama, ['produk_induk', 'nama_varian'], FIELD_UPDATE_NAMA),
+        ):
+            if not tulis:
+                continue
+            objs = VarianProduk.objects.bulk_create(
+                [self._varian(d) for d in tulis],
+                update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields,
+            )
+            for d, obj in zip(tulis, objs):
+                if d['varian_id'] is None:
+                    d['varian_id'] = obj.pk
+                    varian_baru.append(obj)
+        self._setel_stok(tulis_sku + tulis_nama, varian_baru)
+
+    def _setel_stok(self, tulis, varian_baru):
+        # bulk_create tidak memicu post_save, jadi saldo awal (stok 0) dibuka di sini
+        if varian_baru:
+            buka_persediaan(*varian_baru)
+        ids_baru = {obj.pk for obj in varian_baru}
+        awal = {d['varian_id']: d['stok'] for d in tulis if d['varian_id'] in ids_baru}
+        lama = {d['varian_id']: d['stok'] for d in tulis if d['varian_id'] not in ids_baru}
+        if awal:
+            setel_stok(awal, self.user, reason=StockHistory.Reason.AWAL, catatan=CATATAN_STOK)
+        if lama:
+            setel_stok(lama, self.user, catatan=CATATAN_STOK)
+
+    @staticmethod
+    def _varian(d):
+        return VarianProduk(
+            sku=d['sku'], dokumen_cari=buat_dokumen_cari(d['nama_produk'], d['nama_varian'], d['sku']),
+            **{f: d[f] for f in FIELD_BANDING if f != 'stok'}, stok=NOL,
+        )
@@ -0,0 +1,88 @@
+# products/indeks_sku.py
+
+import threading
+import time
+
+from django.conf import settings
+
+from .cache_katalog import versi_katalog
+from .models import VarianProduk
+
+# Versi katalog dicek paling sering sekali per interval ini (detik) per proses
+INTERVAL_CEK = getattr(settings, 'INDEKS_SKU_INTERVAL_CEK', 1.0)
+
+
+class IndeksSKU:
+    """
+    Index SKU -> record varian yang sudah diserialisasi (bentuk yang sama
+    dengan VarianProdukSerializer), disimpan di memori proses. Index dibangun
+    ulang hanya saat versi struktur katalog berubah.
+
+    Versi (versi, versi_stok) dicek paling sering sekali per `interval_cek`
+    detik, jadi scan beruntun tidak menjalankan query sama sekali. Stok setiap
+    varian disimpan bersama versi_stok saat dibaca; setelah versi_stok naik,
+    stok varian yang discan dibaca ulang dengan satu query primary key.
+    Artinya perubahan dari proses lain baru terlihat paling lambat
+    `interval_cek` detik kemudian. Stok hasil scan hanya informasi untuk
+    kasir; checkout tetap memeriksa stok dengan UPDATE bersyarat.
+    """
+
+    def __init__(self, interval_cek=INTERVAL_CEK):
+        self.interval_cek = interval_cek
+        self._versi = None
+        self._versi_stok = None
+        self._dicek_pada = None
+        self._data = {}
+        self._stok = {}
+        self._kunci = threading.Lock()
+
+    def _bangun(self, versi_stok):
+        from .serializers import VarianProdukSerializer
+
+        queryset = VarianProduk.objects.untuk_tampilan().filter(is_active=True).exclude(sku__isnull=True).exclude(sku='')
+        data, stok = {}, {}
+        for record in VarianProdukSerializer(queryset, many=True).data:
+            record = dict(record)
+            record['aturan_harga'] = sorted(
+                (dict(a) for a in record['aturan_harga']), key=lambda a: a['jumlah_minimal']
+            )
+            # Stok dibaca setelah versi_stok, jadi paling tidak sebaru versi itu
+            stok[record['id']] = (versi_stok, record.pop('stok'))
+            data[record['sku'].strip()] = record
+        return data, stok
+
+    def _segarkan(self):
+        sekarang = time.monotonic()
+        if self._dicek_pada is not None and sekarang - self._dicek_pada < self.interval_cek:
+            return
+        versi, versi_stok = versi_katalog()
+        if versi != self._versi:
+            with self._kunci:
+                if versi != self._versi:
+                    # Ganti referensi dict sekaligus; pembaca lain tetap memakai dict lama
+                    self._data, self._stok = self._bangun(versi_stok)
+                    self._versi = versi
+        self._versi_stok = versi_stok
+        self._dicek_pada = sekarang
+
+    def cari(self, sku):
+        """Record varian aktif untuk `sku` (tanpa stok), atau None."""
+        self._segarkan()
+        return self._data.get(sku.strip())
+
+    def cari_dengan_stok(self, sku):
+        """Record varian aktif untuk `sku` beserta stoknya, atau None."""
+        record = self.cari(sku)
+        if record is None:
+            return None
+        versi_stok = self._versi_stok
+        tersimpan = self._stok.get(record['id'])
+        if tersimpan is None or tersimpan[0] != versi_stok:
+            stok = VarianProduk.objects.filter(pk=record['id']).values_list('stok', flat=True).first()
+            if stok is None:
+                return None
+            tersimpan = self._stok[record['id']] = (versi_stok, f'{stok:.3f}')
+        return {**record, 'stok': tersimpan[1]}
+
+
+indeks_sku = IndeksSKU()
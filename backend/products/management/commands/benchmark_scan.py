@@ -0,0 +1,73 @@
+# products/management/commands/benchmark_scan.py
+
+import itertools
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from pos_project import benchmark
+from products.autocomplete import autocomplete
+from products.indeks_sku import indeks_sku
+from products.models import VarianProduk
+from products.serializers import VarianProdukSerializer
+from products.views import VarianProdukViewSet
+
+TARGET_P99_MS = 2.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark kasir di atas katalog sintetis: scan SKU lewat index di memori vs pencarian "
+        "icontains lama, dan autocomplete untuk kueri awalan dan salah ketik. Data dibuat di dalam "
+        "transaksi database yang di-rollback di akhir."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jumlah', type=int, default=20_000, help="Jumlah varian sintetis.")
+        parser.add_argument('--ulang', type=int, default=500, help="Jumlah lookup per pengukuran.")
+
+    def _tulis(self, nama, hasil, target=None):
+        baris = f"  {nama:<34} {benchmark.format_waktu(hasil)}"
+        if target is not None:
+            gaya = self.style.SUCCESS if hasil['p99'] <= target else self.style.ERROR
+            baris += gaya(f"  (target p99 {target} ms)")
+        self.stdout.write(baris)
+
+    def handle(self, *args, **options):
+        ulang = options['ulang']
+        with benchmark.data_sementara():
+            user = get_user_model().objects.create(username=f'benchmark-{benchmark.kode_acak()}', role='kasir')
+            self.stdout.write(f"Mengisi {options['jumlah']:,} varian sintetis...")
+            varian_list = benchmark.buat_katalog(options['jumlah'])
+            sku = itertools.cycle([v.sku for v in varian_list[::max(len(varian_list) // ulang, 1)]])
+
+            self.stdout.write(self.style.MIGRATE_HEADING("Scan SKU:"))
+            self._tulis("membangun index (sekali per versi)", benchmark.ukur(lambda: indeks_sku.cari(next(sku)), 1))
+            self._tulis("indeks_sku.cari", benchmark.ukur(lambda: indeks_sku.cari(next(sku)), ulang))
+            scan = VarianProdukViewSet.as_view({'get': 'scan'})
+            self._tulis(
+                "endpoint scan (stok dari index)",
+                benchmark.ukur(lambda: benchmark.panggil_view(scan, user, sku=next(sku)), ulang),
+                target=TARGET_P99_MS,
+            )
+
+            def cari_icontains():
+                teks = next(sku)
+                queryset = VarianProduk.objects.untuk_tampilan().filter(is_active=True).filter(
+                    Q(nama_varian__icontains=teks) | Q(sku__icontains=teks) | Q(produk_induk__nama_produk__icontains=teks)
+                )
+                return VarianProdukSerializer(queryset, many=True).data
+
+            self._tulis("?search= icontains lama", benchmark.ukur(cari_icontains, max(ulang // 10, 1)))
+
+            self.stdout.write(self.style.MIGRATE_HEADING("Autocomplete:"))
+            awalan, salah_ketik = benchmark.kueri_uji(varian_list, ulang)
+            self._tulis("membangun index (sekali per versi)", benchmark.ukur(lambda: autocomplete.segarkan(paksa=True), 1))
+            for nama, kueri in (('awalan', awalan), ('salah ketik', salah_ketik)):
+                urutan = iter(kueri)
+                hasil = benchmark.ukur(lambda: autocomplete.cari(next(urutan)), len(kueri))
+                self._tulis(f"autocomplete.cari {nama}", hasil, target=TARGET_P99_MS)
+                kena = sum(1 for k in kueri if autocomplete.cari(k, limit=1))
+                self.stdout.write(f"    {kena}/{len(kueri)} kueri {nama} menemukan varian")
+        self.stdout.write(self.style.SUCCESS("Selesai; data benchmark sudah di-rollback."))
@@ -0,0 +1,95 @@
+# products/management/commands/load_barcode_metadata.py
+
+import csv
+import gzip
+import json
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from products.barcode import FIELD_DATA, format_produk_off, potong_field
+from products.models import BarcodeMetadata
+
+
+class Command(BaseCommand):
+    help = (
+        "Memuat metadata barcode dari dump Open Food Facts (JSONL atau CSV/TSV, boleh .gz) "
+        "atau file lokal lain ke tabel BarcodeMetadata, agar lookup barcode bisa offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path file dump.")
+        parser.add_argument(
+            '--format', choices=['jsonl', 'csv'],
+            help="Format file; default ditebak dari ekstensi (.jsonl/.json = jsonl, lainnya csv)."
+        )
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help="Hanya memuat N baris pertama (untuk uji coba)."
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        nama = path[:-3] if path.endswith('.gz') else path
+        fmt = options['format'] or ('jsonl' if nama.endswith(('.jsonl', '.json')) else 'csv')
+        buka = gzip.open if path.endswith('.gz') else open
+
+        try:
+            berkas = buka(path, 'rt', encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(f"File tidak bisa dibuka: {e}")
+
+        with berkas:
+            produk = self._baca_jsonl(berkas) if fmt == 'jsonl' else self._baca_csv(berkas, nama)
+            if options['limit']:
+                produk = islice(produk, options['limit'])
+            total = self._simpan(produk, options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f"{total} barcode dimuat ke BarcodeMetadata."))
+
+    def _baca_jsonl(self, berkas):
+        for nomor, baris in enumerate(berkas, start=1):
+            if not baris.strip():
+                continue
+            try:
+                yield json.loads(baris)
+            except json.JSONDecodeError:
+                self.stderr.write(f"Baris {nomor} bukan JSON yang valid, dilewati.")
+
+    def _baca_csv(self, berkas, nama):
+        # Dump CSV resmi Open Food Facts sebenarnya dipisah tab dan kolomnya sangat panjang
+        csv.field_size_limit(sys.maxsize)
+        header = berkas.readline()
+        delimiter = '\t' if nama.endswith('.tsv') or '\t' in header else ','
+        kolom = next(csv.reader([header], delimiter=delimiter))
+        for row in csv.DictReader(berkas, fieldnames=kolom, delimiter=delimiter):
+            if 'code' not in row and 'barcode' in row:
+                row['code'] = row['barcode']
+            yield row
+
+    def _simpan(self, produk, batch_size):
+        total = 0
+        batch = {}
+        for data in produk:
+            barcode = str(data.get('code') or '').strip()
+            if not barcode or len(barcode) > 64:
+                continue
+            batch[barcode] = BarcodeMetadata(
+                barcode=barcode, ditemukan=True, sumber=BarcodeMetadata.Sumber.IMPOR,
+                **potong_field(format_produk_off(barcode, data)),
+            )
+            if len(batch) >= batch_size:
+                total += self._tulis(batch)
+                batch = {}
+        if batch:
+            total += self._tulis(batch)
+        return total
+
+    def _tulis(self, batch):
+        BarcodeMetadata.objects.bulk_create(
+            batch.values(), update_conflicts=True, unique_fields=['barcode'],
+            update_fields=['ditemukan', 'sumber', 'diperbarui_pada', *FIELD_DATA],
+        )
+        self.stdout.write(f"  {len(batch)} barcode disimpan...")
+        return len(batch)
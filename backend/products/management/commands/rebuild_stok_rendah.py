@@ -0,0 +1,19 @@
+# products/management/commands/rebuild_stok_rendah.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products import stok_rendah
+
+
+class Command(BaseCommand):
+    help = (
+        "Menyamakan kolom stok_rendah semua varian dengan stok dan batasnya. "
+        "Hanya perlu dijalankan jika data stok diubah di luar aplikasi; "
+        "varian yang dikoreksi ikut dicatat ke feed perubahan stok rendah."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            jumlah = stok_rendah.sinkronkan()
+        self.stdout.write(self.style.SUCCESS(f"{jumlah} varian dikoreksi, {stok_rendah.jumlah_stok_rendah()} varian stok rendah."))
@@ -0,0 +1,190 @@
+# products/mesin_harga.py
+
+import threading
+from bisect import bisect_right
+from decimal import Decimal, ROUND_HALF_UP
+from fractions import Fraction
+
+from .cache_katalog import versi_katalog
+from .models import AturanHargaKuantitas, VarianProduk
+
+SEN = Decimal('0.01')
+NOL = Decimal('0')
+# Batas panjang tabel DP per varian. Tabel diisi di jalur request (quote,
+# checkout), jadi batas ini sekaligus membatasi kerja satu request; aturan
+# harga toko biasanya hanya butuh beberapa ratus entri.
+MAKS_TABEL = 20_000
+
+
+class JumlahDiLuarTabel(ValueError):
+    """
+    Jumlah utuh melebihi tabel harga yang terpotong MAKS_TABEL; di atas tabel
+    itu harga termurahnya tidak bisa dijamin, jadi jumlah ditolak.
+    """
+
+    def __init__(self, batas, varian_id=None):
+        super().__init__(batas, varian_id)
+        self.batas = batas
+        self.varian_id = varian_id
+
+
+def _ke_sen(harga):
+    return int((harga * 100).to_integral_value(ROUND_HALF_UP))
+
+
+class TabelHarga:
+    """
+    Tabel harga satu varian yang sudah dikompilasi. Aturan harga kuantitas
+    diperlakukan sebagai bundel (beli `jumlah_minimal` seharga
+    `harga_total_khusus`) dan harga normal sebagai bundel isi 1. Biaya termurah
+    untuk setiap jumlah utuh dihitung dengan DP (unbounded knapsack) yang diisi
+    bertahap sampai jumlah yang diminta; di atas batas tabel, sisanya pasti
+    diisi bundel dengan harga per unit terbaik, jadi jumlah berapa pun
+    dihitung dalam O(1).
+    """
+    __slots__ = (
+        'harga_normal', 'harga_reseller', 'ukuran', 'harga', 'biaya', 'batas', 'panjang', 'lengkap',
+        'ukuran_terbaik', 'harga_terbaik',
+    )
+
+    def __init__(self, harga_normal, harga_reseller=None, aturan=()):
+        self.harga_normal = harga_normal
+        self.harga_reseller = harga_reseller if harga_reseller and harga_reseller > 0 else None
+        self.biaya = None
+
+        bundel = {1: _ke_sen(harga_normal)}
+        for jumlah_minimal, harga_total in aturan:
+            if jumlah_minimal >= 1:
+                sen = _ke_sen(harga_total)
+                bundel[jumlah_minimal] = min(bundel.get(jumlah_minimal, sen), sen)
+        if len(bundel) == 1 and bundel[1] == _ke_sen(harga_normal):
+            # Tanpa aturan efektif: harga normal x jumlah, persis seperti sebelumnya
+            return
+
+        pasangan = sorted(bundel.items())
+        self.ukuran = [m for m, _ in pasangan]
+        self.harga = [p for _, p in pasangan]
+        self.ukuran_terbaik, self.harga_terbaik = min(pasangan, key=lambda b: (Fraction(b[1], b[0]), -b[0]))
+        # Solusi optimal memakai kurang dari `ukuran_terbaik` bundel selain bundel
+        # terbaik, jadi di atas ukuran_terbaik * ukuran_maksimal biaya(q) =
+        # biaya(q - ukuran_terbaik) + harga_terbaik. Jika batas itu melebihi
+        # MAKS_TABEL, tabel dipotong dan jumlah di atasnya ditolak.
+        batas_optimal = self.ukuran_terbaik * self.ukuran[-1]
+        self.lengkap = batas_optimal <= MAKS_TABEL
+        self.batas = min(batas_optimal, MAKS_TABEL)
+        self.panjang = self.batas + self.ukuran_terbaik if self.lengkap else self.batas
+        self.biaya = [0]
+
+    def _biaya(self, q):
+        """Biaya termurah (sen) untuk q unit utuh, q <= panjang; tabel diperpanjang bila perlu."""
+        biaya = self.biaya
+        if q >= len(biaya):
+            # Diisi pada salinan lalu ditukar, agar thread lain tidak melihat tabel setengah jadi;
+            # tumbuh berlipat supaya jumlah yang naik sedikit demi sedikit tidak mengisi ulang terus
+            biaya = list(biaya)
+            for n in range(len(biaya), min(max(q, 2 * len(biaya)), self.panjang) + 1):
+                i = bisect_right(self.ukuran, n)
+                biaya.append(min(biaya[n - self.ukuran[j]] + self.harga[j] for j in range(i)))
+            self.biaya = biaya
+        return biaya[q]
+
+    def _total_aturan(self, jumlah):
+        if self.biaya is None:
+            return self.harga_normal * jumlah
+        utuh = int(jumlah)
+        sisa = jumlah - utuh
+        sen = 0
+        if utuh > self.batas:
+            if not self.lengkap:
+                raise JumlahDiLuarTabel(self.batas)
+            k = (utuh - self.batas) // self.ukuran_terbaik
+            sen = k * self.harga_terbaik
+            utuh -= k * self.ukuran_terbaik
+        sen += self._biaya(utuh)
+        return Decimal(sen) / 100 + self.harga_normal * sisa
+
+    def total(self, jumlah, customer_type='Biasa'):
+        """
+        Harga total termurah untuk `jumlah` unit, dibulatkan ke sen. Melempar
+        JumlahDiLuarTabel jika jumlah melewati tabel yang terpotong.
+        """
+        total = self._total_aturan(jumlah)
+        if customer_type == 'Reseller' and self.harga_reseller is not None:
+            total = min(total, self.harga_reseller * jumlah)
+        return total.quantize(SEN, ROUND_HALF_UP)
+
+
+class MesinHarga:
+    """
+    Cache TabelHarga per varian di memori proses, berlaku selama versi struktur
+    katalog tidak berubah. Varian yang belum ada di cache dikompilasi sekaligus
+    dengan dua query, jadi satu keranjang tidak pernah memicu query per item.
+    """
+
+    def __init__(self):
+        self._versi = None
+        self._tabel = {}
+        self._kunci = threading.Lock()
+
+    def tabel(self, varian_ids):
+        """{varian_id: TabelHarga} untuk varian yang ada; id yang tidak ada dilewati."""
+        versi = versi_katalog()[0]
+        with self._kunci:
+            if versi != self._versi:
+                self._tabel = {}
+                self._versi = versi
+            tabel = self._tabel
+
+        hilang = [varian_id for varian_id in set(varian_ids) if varian_id not in tabel]
+        if hilang:
+            aturan = {}
+            for varian_id, jumlah_minimal, harga_total in AturanHargaKuantitas.objects.filter(
+                varian_produk_id__in=hilang
+            ).values_list('varian_produk_id', 'jumlah_minimal', 'harga_total_khusus'):
+                aturan.setdefault(varian_id, []).append((jumlah_minimal, harga_total))
+            for varian_id, normal, reseller in VarianProduk.objects.filter(id__in=hilang).values_list(
+                'id', 'harga_jual_normal', 'harga_jual_reseller'
+            ):
+                tabel[varian_id] = TabelHarga(normal, reseller, aturan.get(varian_id, ()))
+        return {varian_id: tabel[varian_id] for varian_id in varian_ids if varian_id in tabel}
+
+    def hitung_keranjang(self, items, customer_type='Biasa'):
+        """
+        Menghitung harga satu keranjang. `items` adalah list (varian_id, jumlah).
+        Aturan harga diterapkan pada total jumlah per varian; jika satu varian
+        muncul di beberapa baris, subtotalnya dibagi proporsional.
+        Mengembalikan (baris, total_harga); `baris` berisi dict varian_id,
+        jumlah, harga_satuan dan subtotal sesuai urutan `items`.
+        Melempar KeyError jika ada varian yang tidak ditemukan dan
+        JumlahDiLuarTabel jika jumlahnya melewati tabel harga yang terpotong.
+        """
+        jumlah_per_varian = {}
+        for varian_id, jumlah in items:
+            jumlah_per_varian[varian_id] = jumlah_per_varian.get(varian_id, NOL) + jumlah
+
+        tabel = self.tabel(jumlah_per_varian.keys())
+        for varian_id in jumlah_per_varian:
+            if varian_id not in tabel:
+                raise KeyError(varian_id)
+        sisa_subtotal = {}
+        for varian_id, jumlah in jumlah_per_varian.items():
+            try:
+                sisa_subtotal[varian_id] = tabel[varian_id].total(jumlah, customer_type)
+            except JumlahDiLuarTabel as e:
+                raise JumlahDiLuarTabel(e.batas, varian_id) from e
+        sisa_jumlah = dict(jumlah_per_varian)
+
+        baris = []
+        for varian_id, jumlah in items:
+            if jumlah == sisa_jumlah[varian_id]:
+                subtotal = sisa_subtotal[varian_id]
+            else:
+                subtotal = (sisa_subtotal[varian_id] * jumlah / sisa_jumlah[varian_id]).quantize(SEN, ROUND_HALF_UP)
+            sisa_subtotal[varian_id] -= subtotal
+            sisa_jumlah[varian_id] -= jumlah
+            harga_satuan = (subtotal / jumlah).quantize(SEN, ROUND_HALF_UP) if jumlah else tabel[varian_id].harga_normal
+            baris.append({'varian_id': varian_id, 'jumlah': jumlah, 'harga_satuan': harga_satuan, 'subtotal': subtotal})
+        return baris, sum((b['subtotal'] for b in baris), NOL)
+
+
+mesin_harga = MesinHarga()
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+def buat_baris_versi(apps, schema_editor):
+    VersiKatalog = apps.get_model('products', 'VersiKatalog')
+    VersiKatalog.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_alter_varianproduk_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersiKatalog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versi', models.BigIntegerField(default=0)),
+                ('versi_stok', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Versi Katalog',
+            },
+        ),
+        migrations.RunPython(buat_baris_versi, migrations.RunPython.noop),
+    ]
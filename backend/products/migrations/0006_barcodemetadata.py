@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_versikatalog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarcodeMetadata',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode', models.CharField(max_length=64, unique=True)),
+                ('ditemukan', models.BooleanField(default=True)),
+                ('nama_produk_induk', models.CharField(blank=True, default='', max_length=255)),
+                ('nama_varian', models.CharField(blank=True, default='', max_length=255)),
+                ('kategori', models.CharField(blank=True, max_length=255, null=True)),
+                ('pemasok', models.CharField(blank=True, max_length=255, null=True)),
+                ('sumber', models.CharField(choices=[('API', 'Open Food Facts API'), ('IMPOR', 'Impor Dump')], default='API', max_length=10)),
+                ('diperbarui_pada', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Barcode Metadata',
+            },
+        ),
+    ]
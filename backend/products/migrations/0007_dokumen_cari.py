@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+NAMA_INDEKS = 'products_varian_dokumen_trgm'
+
+
+def isi_dokumen_cari(apps, schema_editor):
+    VarianProduk = apps.get_model('products', 'VarianProduk')
+    last_id = 0
+    while True:
+        varian = list(
+            VarianProduk.objects.filter(id__gt=last_id).order_by('id')
+            .select_related('produk_induk').only('id', 'nama_varian', 'sku', 'produk_induk__nama_produk')[:2000]
+        )
+        if not varian:
+            break
+        last_id = varian[-1].id
+        for v in varian:
+            teks = ' '.join(filter(None, (v.produk_induk.nama_produk, v.nama_varian, v.sku)))
+            v.dokumen_cari = ' '.join(teks.lower().split())
+        VarianProduk.objects.bulk_update(varian, ['dokumen_cari'])
+
+
+def buat_indeks_trigram(apps, schema_editor):
+    # Hanya Postgres: index GIN pg_trgm untuk ILIKE '%..%' dan operator kemiripan kata
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {NAMA_INDEKS} ON products_varianproduk '
+        f'USING gin (dokumen_cari gin_trgm_ops)'
+    )
+
+
+def hapus_indeks_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {NAMA_INDEKS}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_barcodemetadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='varianproduk',
+            name='dokumen_cari',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(isi_dokumen_cari, migrations.RunPython.noop),
+        migrations.RunPython(buat_indeks_trigram, hapus_indeks_trigram),
+    ]
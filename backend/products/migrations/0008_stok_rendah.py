@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def isi_stok_rendah(apps, schema_editor):
+    VarianProduk = apps.get_model('products', 'VarianProduk')
+    VarianProduk.objects.filter(
+        lacak_stok=True, is_active=True, stok__lte=models.F('peringatan_stok_rendah')
+    ).update(stok_rendah=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_dokumen_cari'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerubahanStokRendah',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rendah', models.BooleanField()),
+                ('stok', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('batas', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Perubahan Stok Rendah',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='varianproduk',
+            name='stok_rendah',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(isi_stok_rendah, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='versikatalog',
+            name='versi_stok_rendah',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='varianproduk',
+            index=models.Index(condition=models.Q(('stok_rendah', True)), fields=['stok', 'id'], name='products_varian_stok_rendah'),
+        ),
+        migrations.AddField(
+            model_name='perubahanstokrendah',
+            name='varian',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='perubahan_stok_rendah', to='products.varianproduk'),
+        ),
+    ]
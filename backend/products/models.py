@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 class Kategori(models.Model):
     nama_kategori = models.CharField(max_length=100, unique=True)
@@ -30,6 +32,36 @@ class Produk(models.Model):
     def __str__(self):
         return self.nama_produk
 
+def normalisasi_teks(teks):
+    """Huruf kecil dengan spasi dirapikan, bentuk yang dipakai dokumen pencarian."""
+    return ' '.join((teks or '').lower().split())
+
+
+def buat_dokumen_cari(nama_produk, nama_varian, sku):
+    """Dokumen pencarian satu varian: nama produk induk, nama varian dan SKU."""
+    return normalisasi_teks(' '.join(filter(None, (nama_produk, nama_varian, sku))))
+
+
+class VarianProdukQuerySet(models.QuerySet):
+    def dengan_varian_count(self):
+        """
+        Menambahkan anotasi `varian_count` (jumlah varian dalam produk induk
+        yang sama) lewat subquery, agar serializer tidak menjalankan COUNT per baris.
+        """
+        saudara = VarianProduk.objects.filter(
+            produk_induk=OuterRef('produk_induk')
+        ).order_by().values('produk_induk').annotate(total=Count('id')).values('total')
+        return self.annotate(varian_count=Coalesce(Subquery(saudara), 0))
+
+    def untuk_tampilan(self):
+        """
+        Queryset siap untuk VarianProdukSerializer: relasi yang ditampilkan
+        di-join/prefetch dan varian_count dianotasi, jadi jumlah query tetap.
+        """
+        return self.dengan_varian_count().select_related(
+            'produk_induk__kategori', 'pemasok'
+        ).prefetch_related('aturan_harga')
+
 class VarianProduk(models.Model):
     """
     Model untuk setiap varian yang dijual. STOK SEKARANG DI SINI.
@@ -55,15 +87,46 @@ class VarianProduk(models.Model):
     is_favorit = models.BooleanField(default=False)
 
     is_active = models.BooleanField(default=True, help_text="Nonaktifkan untuk menyembunyikan dari daftar jual")
+    # Denormalisasi untuk pencarian (lihat products/pencarian.py); diisi otomatis saat save
+    dokumen_cari = models.TextField(blank=True, default='', editable=False)
+    # lacak_stok AND is_active AND stok <= peringatan_stok_rendah, dijaga oleh setiap
+    # jalur yang mengubah stok (lihat products/stok_rendah.py)
+    stok_rendah = models.BooleanField(default=False, editable=False)
+
+    objects = VarianProdukQuerySet.as_manager()
 
     class Meta:
         # Memastikan tidak ada nama varian yang sama untuk satu produk induk
         unique_together = ('produk_induk', 'nama_varian')
         verbose_name_plural = "Varian Produk"
+        indexes = [
+            # Index parsial: hanya berisi varian stok rendah, urut seperti laporannya
+            models.Index(fields=['stok', 'id'], condition=models.Q(stok_rendah=True), name='products_varian_stok_rendah'),
+        ]
         
     def __str__(self):
         return f"{self.produk_induk.nama_produk} ({self.nama_varian})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Status saat dimuat, untuk mendeteksi perpindahan batas stok rendah saat save
+        instance._stok_rendah_awal = instance.__dict__.get('stok_rendah')
+        return instance
+
+    def hitung_stok_rendah(self):
+        return bool(self.lacak_stok and self.is_active and self.stok <= self.peringatan_stok_rendah)
+
+    def save(self, *args, **kwargs):
+        self.dokumen_cari = buat_dokumen_cari(self.produk_induk.nama_produk, self.nama_varian, self.sku)
+        self.stok_rendah = self.hitung_stok_rendah()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = [*update_fields, *(
+                f for f in ('dokumen_cari', 'stok_rendah') if f not in update_fields
+            )]
+        super().save(*args, **kwargs)
+
 class AturanHargaKuantitas(models.Model):
     """
     Model untuk harga berdasarkan jumlah, cth: beli 1 harga Rp 3.500, beli 2 harga Rp 6.500, beli 3 harga Rp 10.000.
@@ -77,4 +140,64 @@ class AturanHargaKuantitas(models.Model):
         verbose_name_plural = "Aturan Harga Kuantitas"
 
     def __str__(self):
-        return f"Aturan {self.varian_produk.nama_varian}: Beli {self.jumlah_minimal} seharga {self.harga_total_khusus}"
\ No newline at end of file
+        return f"Aturan {self.varian_produk.nama_varian}: Beli {self.jumlah_minimal} seharga {self.harga_total_khusus}"
+
+
+class VersiKatalog(models.Model):
+    """
+    Penghitung versi katalog (satu baris). `versi` naik setiap ada perubahan
+    data produk/harga, `versi_stok` naik setiap ada mutasi stok. Disimpan di
+    database agar sama untuk semua proses worker.
+    """
+    versi = models.BigIntegerField(default=0)
+    versi_stok = models.BigIntegerField(default=0)
+    # Naik hanya saat ada varian yang masuk/keluar dari daftar stok rendah
+    versi_stok_rendah = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Versi Katalog"
+
+
+class PerubahanStokRendah(models.Model):
+    """
+    Feed perpindahan batas stok rendah: satu baris setiap kali varian masuk
+    (`rendah=True`) atau keluar (`rendah=False`) dari daftar stok rendah.
+    Hanya ditambah, tidak pernah diubah; UI mengikuti feed ini lewat id.
+    """
+    varian = models.ForeignKey(VarianProduk, on_delete=models.SET_NULL, null=True, related_name='perubahan_stok_rendah')
+    rendah = models.BooleanField()
+    stok = models.DecimalField(max_digits=10, decimal_places=3)
+    batas = models.DecimalField(max_digits=10, decimal_places=3)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = "Perubahan Stok Rendah"
+
+    def __str__(self):
+        return f"{self.varian_id} {'rendah' if self.rendah else 'pulih'} ({self.stok})"
+
+
+class BarcodeMetadata(models.Model):
+    """
+    Cache lokal hasil pencarian barcode (Open Food Facts atau dump yang diimpor).
+    `ditemukan=False` adalah cache negatif: barcode yang sudah dicari tapi tidak ada.
+    """
+    class Sumber(models.TextChoices):
+        API = 'API', 'Open Food Facts API'
+        IMPOR = 'IMPOR', 'Impor Dump'
+
+    barcode = models.CharField(max_length=64, unique=True)
+    ditemukan = models.BooleanField(default=True)
+    nama_produk_induk = models.CharField(max_length=255, blank=True, default='')
+    nama_varian = models.CharField(max_length=255, blank=True, default='')
+    kategori = models.CharField(max_length=255, blank=True, null=True)
+    pemasok = models.CharField(max_length=255, blank=True, null=True)
+    sumber = models.CharField(max_length=10, choices=Sumber.choices, default=Sumber.API)
+    diperbarui_pada = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Barcode Metadata"
+
+    def __str__(self):
+        return self.barcode
@@ -0,0 +1,85 @@
+# products/pencarian.py
+
+from django.db import connection
+from django.db.models import BooleanField, Case, Exists, F, FloatField, Func, OuterRef, Q, Subquery, Value, When
+from rest_framework.filters import BaseFilterBackend
+
+from .models import VarianProduk, normalisasi_teks
+
+# Token sependek ini tidak punya trigram yang berarti, jadi hanya dicocokkan substring
+MIN_PANJANG_MIRIP = 3
+
+
+class _MiripKata(Func):
+    """`token <% dokumen` dari pg_trgm: token mirip dengan salah satu kata di dokumen (tahan salah ketik)."""
+    arity = 2
+    template = '%(expressions)s'
+    arg_joiner = ' <%% '
+    output_field = BooleanField()
+
+
+class _KemiripanKata(Func):
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+
+def _pakai_trigram():
+    return connection.vendor == 'postgresql'
+
+
+def cari_varian(queryset, teks):
+    """
+    Menyaring queryset VarianProduk dengan teks pencarian yang sudah
+    dinormalisasi dan menambahkan anotasi `skor` untuk peringkat.
+    Semua token harus cocok dengan `dokumen_cari`: sebagai substring, atau di
+    Postgres juga lewat kemiripan trigram per kata. Kedua bentuk dilayani
+    index GIN pg_trgm, jadi tidak ada sequential scan.
+    """
+    trigram = _pakai_trigram()
+    for token in teks.split():
+        kondisi = Q(dokumen_cari__contains=token)
+        if trigram and len(token) >= MIN_PANJANG_MIRIP:
+            kondisi |= Q(_MiripKata(Value(token), F('dokumen_cari')))
+        queryset = queryset.filter(kondisi)
+
+    # SKU persis > awalan dokumen > frasa utuh; di Postgres ditambah kemiripan kata
+    skor = Case(
+        When(sku__iexact=teks, then=Value(3.0)),
+        When(dokumen_cari__startswith=teks, then=Value(2.0)),
+        When(dokumen_cari__contains=teks, then=Value(1.0)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    if trigram:
+        skor = skor + _KemiripanKata(Value(teks), F('dokumen_cari'))
+    return queryset.annotate(skor=skor)
+
+
+class PencarianVarianFilter(BaseFilterBackend):
+    """Pengganti SearchFilter untuk varian: `?search=` memakai dokumen pencarian dan diurutkan per skor."""
+    search_param = 'search'
+
+    def get_teks(self, request):
+        return normalisasi_teks(request.query_params.get(self.search_param, ''))
+
+    def filter_queryset(self, request, queryset, view):
+        teks = self.get_teks(request)
+        if not teks:
+            return queryset
+        return cari_varian(queryset, teks).order_by('-skor', 'id')
+
+
+class PencarianProdukFilter(PencarianVarianFilter):
+    """
+    Pencarian produk induk lewat variannya dengan subquery EXISTS (tanpa join
+    dan distinct); peringkat produk = skor varian terbaiknya.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        teks = self.get_teks(request)
+        if not teks:
+            return queryset
+        cocok = cari_varian(VarianProduk.objects.filter(produk_induk=OuterRef('pk')), teks)
+        return queryset.filter(Exists(cocok)).annotate(
+            skor=Subquery(cocok.order_by('-skor').values('skor')[:1])
+        ).order_by('-skor', 'nama_produk')
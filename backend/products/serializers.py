@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Kategori, Pemasok, Produk, VarianProduk, AturanHargaKuantitas
+from .models import Kategori, Pemasok, Produk, VarianProduk, AturanHargaKuantitas, PerubahanStokRendah
 from django.db import transaction
 
 # Serializer ini tidak berubah
@@ -45,7 +45,14 @@ class VarianProdukSerializer(serializers.ModelSerializer):
         ]
     
     def get_varian_count(self, obj):
+        # Gunakan anotasi dari VarianProduk.objects.dengan_varian_count() jika ada
+        if hasattr(obj, 'varian_count'):
+            return obj.varian_count
         if obj.produk_induk:
+            # Jika varian sudah di-prefetch dari produk induk (cth: ProdukSerializer), hitung tanpa query
+            prefetched = getattr(obj.produk_induk, '_prefetched_objects_cache', {})
+            if 'varian' in prefetched:
+                return len(prefetched['varian'])
             return obj.produk_induk.varian.count()
         return 0
 
@@ -125,3 +132,18 @@ class VarianUpdateWithRulesSerializer(serializers.ModelSerializer):
         for rule_data in rules_data:
             AturanHargaKuantitas.objects.create(varian_produk=instance, **rule_data)
         return super().update(instance, validated_data)
+
+
+class PerubahanStokRendahSerializer(serializers.ModelSerializer):
+    """Satu baris feed perpindahan batas stok rendah (varian bisa None jika sudah dihapus)."""
+    nama_produk_induk = serializers.CharField(source='varian.produk_induk.nama_produk', read_only=True, default=None)
+    nama_varian = serializers.CharField(source='varian.nama_varian', read_only=True, default=None)
+    sku = serializers.CharField(source='varian.sku', read_only=True, default=None)
+    satuan = serializers.CharField(source='varian.satuan', read_only=True, default=None)
+
+    class Meta:
+        model = PerubahanStokRendah
+        fields = [
+            'id', 'varian', 'nama_produk_induk', 'nama_varian', 'sku', 'satuan',
+            'rendah', 'stok', 'batas', 'created_at',
+        ]
@@ -0,0 +1,52 @@
+# products/signals.py
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache_katalog import naikkan_versi
+from .models import AturanHargaKuantitas, Kategori, Pemasok, Produk, VarianProduk, buat_dokumen_cari
+from .stok_rendah import catat_perubahan
+
+
+@receiver([post_save, post_delete], sender=VarianProduk)
+@receiver([post_save, post_delete], sender=Produk)
+@receiver([post_save, post_delete], sender=Kategori)
+@receiver([post_save, post_delete], sender=Pemasok)
+@receiver([post_save, post_delete], sender=AturanHargaKuantitas)
+def katalog_berubah(sender, raw=False, **kwargs):
+    """Setiap perubahan data katalog membuat versi cache lama tidak berlaku."""
+    if not raw:
+        naikkan_versi()
+
+
+@receiver(post_save, sender=Produk)
+def perbarui_dokumen_cari(sender, instance, created, raw=False, **kwargs):
+    """Nama produk induk ikut di dokumen pencarian setiap variannya."""
+    if raw or created:
+        return
+    varian = list(VarianProduk.objects.filter(produk_induk=instance).only('id', 'nama_varian', 'sku', 'dokumen_cari'))
+    berubah = []
+    for v in varian:
+        dokumen = buat_dokumen_cari(instance.nama_produk, v.nama_varian, v.sku)
+        if v.dokumen_cari != dokumen:
+            v.dokumen_cari = dokumen
+            berubah.append(v)
+    VarianProduk.objects.bulk_update(berubah, ['dokumen_cari'])
+
+
+@receiver(post_save, sender=VarianProduk)
+def varian_melewati_batas(sender, instance, created, raw=False, **kwargs):
+    """Edit manual (stok, batas, lacak_stok, aktif/nonaktif) yang memindahkan varian melewati batas stok rendah."""
+    if raw:
+        return
+    sebelum = bool(getattr(instance, '_stok_rendah_awal', None))
+    if instance.stok_rendah != sebelum:
+        catat_perubahan([(instance.pk, instance.stok_rendah, instance.stok, instance.peringatan_stok_rendah)])
+    instance._stok_rendah_awal = instance.stok_rendah
+
+
+@receiver(post_delete, sender=VarianProduk)
+def varian_stok_rendah_dihapus(sender, instance, **kwargs):
+    # Varian dihapus keluar dari daftar stok rendah; baris feed tetap ada tanpa varian
+    if instance.stok_rendah:
+        catat_perubahan([(None, False, instance.stok, instance.peringatan_stok_rendah)])
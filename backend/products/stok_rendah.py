@@ -0,0 +1,70 @@
+# products/stok_rendah.py
+
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+
+from . import cache_katalog
+from .models import PerubahanStokRendah, VarianProduk
+
+KONDISI_STOK_RENDAH = Q(lacak_stok=True, is_active=True, stok__lte=F('peringatan_stok_rendah'))
+UKURAN_BATCH = 1000
+
+
+def sql_stok_rendah(stok='stok', tabel=None):
+    """
+    Fragment SQL nilai `stok_rendah` untuk UPDATE mentah. `stok` adalah
+    ekspresi stok setelah update (mis. `stok + CASE ... END`); sisi kanan SET
+    selalu membaca nilai lama, jadi tidak bisa memakai kolom stok langsung.
+    """
+    awalan = f'{tabel}.' if tabel else ''
+    return f"({awalan}lacak_stok AND {awalan}is_active AND {stok} <= {awalan}peringatan_stok_rendah)"
+
+
+def catat_perubahan(perubahan):
+    """
+    Mencatat perpindahan batas [(varian_id, rendah, stok, batas)] ke feed
+    dan membuat jumlah stok rendah yang di-cache tidak berlaku setelah commit.
+    """
+    if not perubahan:
+        return []
+    cache_katalog.naikkan_versi(stok_rendah=True)
+    return PerubahanStokRendah.objects.bulk_create([
+        PerubahanStokRendah(varian_id=varian_id, rendah=rendah, stok=stok, batas=batas)
+        for varian_id, rendah, stok, batas in perubahan
+    ])
+
+
+def sinkronkan(varian_ids=None):
+    """
+    Menyamakan kolom `stok_rendah` dengan kondisinya, untuk jalur yang
+    menulis varian secara bulk (impor CSV) atau perbaikan data. Hanya baris
+    yang salah yang diupdate dan dicatat ke feed. Mengembalikan jumlahnya.
+    """
+    queryset = VarianProduk.objects.all()
+    if varian_ids is not None:
+        queryset = queryset.filter(id__in=varian_ids)
+    salah = list(
+        queryset.annotate(seharusnya=ExpressionWrapper(KONDISI_STOK_RENDAH, output_field=BooleanField()))
+        .exclude(stok_rendah=F('seharusnya'))
+        .values_list('id', 'seharusnya', 'stok', 'peringatan_stok_rendah')
+    )
+    for rendah in (True, False):
+        ids = [varian_id for varian_id, seharusnya, _, _ in salah if seharusnya == rendah]
+        for i in range(0, len(ids), UKURAN_BATCH):
+            VarianProduk.objects.filter(id__in=ids[i:i + UKURAN_BATCH]).update(stok_rendah=rendah)
+    catat_perubahan(salah)
+    return len(salah)
+
+
+def jumlah_stok_rendah():
+    """
+    Jumlah varian stok rendah dari cache katalog, dikunci dengan
+    `versi_stok_rendah` yang hanya naik saat ada perpindahan batas. Penjualan
+    biasa tidak membuatnya kedaluwarsa; saat dihitung ulang pun cukup membaca
+    index parsial.
+    """
+    kunci = f'stok-rendah:jumlah:{cache_katalog.versi_stok_rendah()}'
+    jumlah = cache_katalog.ambil(kunci)
+    if jumlah is None:
+        jumlah = VarianProduk.objects.filter(stok_rendah=True).count()
+        cache_katalog.simpan(kunci, jumlah)
+    return jumlah
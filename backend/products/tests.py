@@ -1,3 +1,614 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from functools import lru_cache
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from transactions.models import LapisanBiaya, NilaiPersediaan, StockHistory
+from transactions.services import ubah_stok
+from users.models import User
+from . import barcode, cache_katalog
+from .autocomplete import MesinAutocomplete, jarak_edit
+from .barcode import BarcodeLookupError, cari_barcode
+from .impor_csv import ImporVarianCSV
+from .indeks_sku import IndeksSKU
+from .mesin_harga import JumlahDiLuarTabel, MesinHarga, TabelHarga
+from .models import AturanHargaKuantitas, BarcodeMetadata, Kategori, Produk, VarianProduk, buat_dokumen_cari
+
+
+class KatalogTestCase(TestCase):
+    """
+    Setiap perubahan katalog dibuat di dalam captureOnCommitCallbacks agar
+    versi katalog (dinaikkan lewat on_commit) benar-benar naik seperti di produksi.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kategori = Kategori.objects.create(nama_kategori='Sembako')
+
+    def buat_varian(self, nama_produk, nama_varian='Biasa', sku=None, **kwargs):
+        data = {'stok': 50, 'satuan': 'pcs', 'harga_jual_normal': 3000, 'purchase_price': 2500, **kwargs}
+        with self.captureOnCommitCallbacks(execute=True):
+            produk, _ = Produk.objects.get_or_create(nama_produk=nama_produk, defaults={'kategori': self.kategori})
+            return VarianProduk.objects.create(produk_induk=produk, nama_varian=nama_varian, sku=sku, **data)
+
+
+class IndeksSKUTests(KatalogTestCase):
+
+    def test_index_dibangun_ulang_saat_versi_katalog_naik(self):
+        indeks = IndeksSKU(interval_cek=0)
+        varian = self.buat_varian('Indomie Goreng', sku='899001')
+        self.assertEqual(indeks.cari(' 899001 ')['harga_jual_normal'], '3000.00')
+
+        # Update tanpa signal tidak menaikkan versi: index lama tetap dipakai, cukup satu query versi
+        VarianProduk.objects.filter(pk=varian.pk).update(harga_jual_normal=3500)
+        with self.assertNumQueries(1):
+            self.assertEqual(indeks.cari('899001')['harga_jual_normal'], '3000.00')
+
+        varian.refresh_from_db()
+        varian.sku = '899002'
+        with self.captureOnCommitCallbacks(execute=True):
+            varian.save()
+        self.assertIsNone(indeks.cari('899001'))
+        self.assertEqual(indeks.cari('899002')['harga_jual_normal'], '3500.00')
+
+    def test_varian_nonaktif_tidak_bisa_discan(self):
+        indeks = IndeksSKU(interval_cek=0)
+        varian = self.buat_varian('Gula Pasir', sku='899100')
+        self.assertIsNotNone(indeks.cari('899100'))
+        varian.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            varian.save()
+        self.assertIsNone(indeks.cari('899100'))
+
+    @mock.patch('products.indeks_sku.time.monotonic')
+    def test_versi_dicek_paling_sering_sekali_per_interval(self, monotonic):
+        monotonic.return_value = 100.0
+        indeks = IndeksSKU(interval_cek=1.0)
+        varian = self.buat_varian('Indomie Goreng', sku='899001')
+        indeks.cari('899001')
+
+        varian.harga_jual_normal = 3500
+        with self.captureOnCommitCallbacks(execute=True):
+            varian.save()
+        # Masih di dalam interval: tanpa query, perubahan belum terlihat
+        monotonic.return_value = 100.9
+        with self.assertNumQueries(0):
+            self.assertEqual(indeks.cari_dengan_stok('899001')['harga_jual_normal'], '3000.00')
+
+        monotonic.return_value = 101.0
+        self.assertEqual(indeks.cari('899001')['harga_jual_normal'], '3500.00')
+
+    def test_stok_disimpan_di_index_dan_dibaca_ulang_setelah_versi_stok_naik(self):
+        indeks = IndeksSKU(interval_cek=0)
+        varian = self.buat_varian('Indomie Goreng', sku='899001', stok=50)
+        self.assertEqual(indeks.cari_dengan_stok('899001')['stok'], '50.000')
+        self.assertNotIn('stok', indeks.cari('899001'))
+        with self.assertNumQueries(1):
+            self.assertEqual(indeks.cari_dengan_stok('899001')['stok'], '50.000')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ubah_stok({varian.id: Decimal('-3')})
+        # Versi struktur tetap: index tidak dibangun ulang, hanya stok varian ini yang dibaca
+        with self.assertNumQueries(2):
+            self.assertEqual(indeks.cari_dengan_stok('899001')['stok'], '47.000')
+        with self.assertNumQueries(1):
+            self.assertEqual(indeks.cari_dengan_stok('899001')['stok'], '47.000')
+
+    def test_endpoint_scan(self):
+        self.buat_varian('Indomie Goreng', sku='899001', stok=12)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='kasir', password='x'))
+        with mock.patch('products.views.indeks_sku', IndeksSKU(interval_cek=0)):
+            response = client.get('/api/products/varian-produk/scan/', {'sku': '899001'})
+            self.assertEqual((response.status_code, response.data['stok']), (200, '12.000'))
+            self.assertEqual(client.get('/api/products/varian-produk/scan/', {'sku': '000'}).status_code, 404)
+        self.assertEqual(client.get('/api/products/varian-produk/scan/').status_code, 400)
+
+
+class AutocompleteFuzzyTests(KatalogTestCase):
+
+    def setUp(self):
+        self.indomie = self.buat_varian('Indomie Goreng', 'Bungkus', sku='899001')
+        self.buat_varian('Kapal Api Mocha', 'Sachet', sku='899002')
+        self.mesin = MesinAutocomplete()
+
+    def test_salah_ketik_dalam_batas_jarak_edit_tetap_ketemu(self):
+        # 'gorwng' berjarak 1 dari 'goreng' (kata 6 huruf ditoleransi 1 kesalahan)
+        hasil = self.mesin.cari('indomie gorwng')
+        self.assertEqual([r['id'] for r in hasil], [self.indomie.id])
+        self.assertEqual(hasil[0]['skor'], 1.0)
+        # Kata 7 huruf ditoleransi 2 kesalahan
+        self.assertEqual([r['id'] for r in self.mesin.cari('indimoe')], [self.indomie.id])
+
+    def test_jarak_edit_berhenti_di_batas(self):
+        self.assertEqual(jarak_edit('goreng', 'gorwng', 1), 1)
+        self.assertEqual(jarak_edit('goreng', 'gorneg', 1), 2)
+        self.assertEqual(jarak_edit('goreng', 'gr', 2), 3)
+
+
+class AutocompleteTests(KatalogTestCase):
+
+    def setUp(self):
+        self.goreng = self.buat_varian('Indomie Goreng', 'Bungkus', sku='899001')
+        self.goreng_jumbo = self.buat_varian('Indomie Goreng Jumbo', 'Bungkus', sku='899002')
+        self.soto = self.buat_varian('Indomie Soto', 'Bungkus', sku='899003')
+        self.mesin = MesinAutocomplete()
+
+    def ids(self, teks, **kwargs):
+        return [r['id'] for r in self.mesin.cari(teks, **kwargs)]
+
+    def test_persis_lebih_dulu_dari_awalan_dan_salah_ketik(self):
+        self.assertEqual(self.ids('indomie goreng'), [self.goreng.id, self.goreng_jumbo.id])
+        self.assertEqual(self.ids('indo gor'), [self.goreng.id, self.goreng_jumbo.id])
+        # Skor sama: nama yang lebih pendek lebih dulu
+        self.assertEqual(self.ids('indomie'), [self.soto.id, self.goreng.id, self.goreng_jumbo.id])
+        self.assertEqual(self.ids('indomie', limit=1), [self.soto.id])
+        self.assertEqual(self.ids('indomie gorng'), [self.goreng.id, self.goreng_jumbo.id])
+        self.assertEqual(self.ids('899003'), [self.soto.id])
+        # Skor: persis 0, awalan 0.5, salah ketik sebesar jarak edit
+        self.assertEqual([r['skor'] for r in self.mesin.cari('soto')], [0])
+        self.assertEqual([r['skor'] for r in self.mesin.cari('sot')], [0.5])
+        self.assertEqual([r['skor'] for r in self.mesin.cari('sotp')], [1])
+
+    def test_salah_ketik_di_luar_batas_tidak_dicocokkan(self):
+        # 'goreng' 6 huruf hanya ditoleransi 1 kesalahan
+        self.assertEqual(self.ids('indomie gxrxng'), [])
+        # Token 3 huruf dan angka (SKU) harus persis atau awalan
+        self.assertEqual(self.ids('sotx'), [self.soto.id])
+        self.assertEqual(self.ids('sxt'), [])
+        self.assertEqual(self.ids('899013'), [])
+        # Semua token harus cocok
+        self.assertEqual(self.ids('soto jumbo'), [])
+
+    def test_index_diperbarui_saat_versi_katalog_naik(self):
+        self.assertEqual(self.ids('soto'), [self.soto.id])
+        # Di antara pengecekan versi, jawaban sepenuhnya dari memori
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids('soto'), [self.soto.id])
+
+        self.soto.nama_varian = 'Kardus'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soto.save()
+        self.goreng_jumbo.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.goreng_jumbo.save()
+
+        with mock.patch('products.autocomplete.INTERVAL_CEK_VERSI', 0):
+            self.assertEqual(self.ids('soto kardus'), [self.soto.id])
+            self.assertEqual(self.ids('soto bungkus'), [])
+            self.assertEqual(self.ids('jumbo'), [])
+            # Versi tidak berubah: cukup satu query versi, varian tidak dimuat ulang
+            with self.assertNumQueries(1):
+                self.assertEqual(self.ids('goreng'), [self.goreng.id])
+
+    def test_endpoint_autocomplete(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='kasir', role='kasir'))
+        url = '/api/products/varian-produk/autocomplete/'
+        response = client.get(url, {'q': 'indomi gorng', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['sku'] for r in response.data['results']], ['899001'])
+        self.assertEqual(client.get(url, {'q': 'indomie', 'limit': 'x'}).status_code, 400)
+        self.assertEqual(client.get(url, {'q': ''}).data, {'results': []})
+
+
+class DokumenCariTests(KatalogTestCase):
+
+    def setUp(self):
+        self.bungkus = self.buat_varian('Indomie Goreng', 'Bungkus', sku='899001')
+        self.kardus = self.buat_varian('Indomie Goreng', 'Kardus', sku='899002')
+        self.produk = self.bungkus.produk_induk
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', role='admin'))
+
+    def cari_produk(self, teks):
+        response = self.client.get('/api/products/produk/', {'search': teks})
+        self.assertEqual(response.status_code, 200)
+        return [p['id'] for p in response.data['results']]
+
+    def test_dokumen_cari_ikut_berubah_saat_produk_diganti_nama(self):
+        self.assertEqual(self.cari_produk('goreng'), [self.produk.id])
+
+        self.produk.nama_produk = 'Mie Sedaap Soto'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produk.save()
+
+        for varian in (self.bungkus, self.kardus):
+            varian.refresh_from_db()
+            self.assertEqual(
+                varian.dokumen_cari, buat_dokumen_cari('Mie Sedaap Soto', varian.nama_varian, varian.sku)
+            )
+        self.assertEqual(self.cari_produk('goreng'), [])
+        self.assertEqual(self.cari_produk('sedaap soto'), [self.produk.id])
+        self.assertEqual(self.cari_produk('sedaap kardus'), [self.produk.id])
+
+    def test_simpan_ulang_tanpa_ganti_nama_tidak_mengupdate_varian(self):
+        # Query: UPDATE produk, SELECT varian; tidak ada bulk_update karena dokumennya sama
+        with self.assertNumQueries(2):
+            self.produk.save()
+
+
+def harga_termurah_brute_force(harga_normal, aturan, jumlah):
+    """Harga termurah (rupiah) dengan mencoba setiap banyaknya tiap bundel, tanpa DP tabel."""
+    bundel = [(1, harga_normal), *aturan]
+
+    @lru_cache(maxsize=None)
+    def termurah(q, i):
+        if i == 0:
+            return q * bundel[0][1]
+        ukuran, harga = bundel[i]
+        return min(k * harga + termurah(q - k * ukuran, i - 1) for k in range(q // ukuran + 1))
+
+    return termurah(jumlah, len(bundel) - 1)
+
+
+class TabelHargaTests(TestCase):
+
+    def test_sama_dengan_brute_force_termasuk_di_atas_batas_tabel(self):
+        acak = random.Random(15)
+        for _ in range(40):
+            harga_normal = Decimal(acak.randrange(5, 50) * 100)
+            aturan = [
+                (ukuran, harga_normal * ukuran * acak.randrange(70, 110) / 100)
+                for ukuran in acak.sample(range(2, 9), acak.randrange(1, 4))
+            ]
+            tabel = TabelHarga(harga_normal, aturan=aturan)
+            if tabel.biaya is None:
+                continue
+            with self.subTest(harga_normal=harga_normal, aturan=aturan):
+                self.assertTrue(tabel.lengkap)
+                for jumlah in range(tabel.batas * 2 + 3):
+                    self.assertEqual(
+                        tabel.total(Decimal(jumlah)),
+                        Decimal(harga_termurah_brute_force(harga_normal, tuple(aturan), jumlah)).quantize(Decimal('0.01')),
+                    )
+
+    def test_tabel_diisi_sebatas_jumlah_yang_diminta(self):
+        tabel = TabelHarga(Decimal('1000'), aturan=[(12, Decimal('10000')), (50, Decimal('40000'))])
+        self.assertEqual(tabel.total(Decimal('3')), Decimal('3000.00'))
+        self.assertLess(len(tabel.biaya), 10)
+        # Jumlah jauh di atas batas dihitung dari bundel terbaik tanpa memperpanjang tabel penuh
+        self.assertEqual(tabel.total(Decimal('1000000')), Decimal('800000000.00'))
+        self.assertLessEqual(len(tabel.biaya), tabel.panjang + 1)
+        # Sisa pecahan memakai harga normal
+        self.assertEqual(tabel.total(Decimal('12.5')), Decimal('10500.00'))
+
+    def test_jumlah_di_atas_tabel_terpotong_ditolak(self):
+        aturan = [(7, Decimal('6000')), (9, Decimal('7500'))]
+        with mock.patch('products.mesin_harga.MAKS_TABEL', 40):
+            tabel = TabelHarga(Decimal('1000'), aturan=aturan)
+        self.assertEqual((tabel.lengkap, tabel.batas), (False, 40))
+        # Di dalam tabel tetap termurah
+        self.assertEqual(tabel.total(Decimal('40')), Decimal(harga_termurah_brute_force(Decimal('1000'), tuple(aturan), 40)))
+        with self.assertRaises(JumlahDiLuarTabel):
+            tabel.total(Decimal('41'))
+
+    def test_reseller_memilih_yang_lebih_murah(self):
+        tabel = TabelHarga(Decimal('1000'), Decimal('900'), [(10, Decimal('8000'))])
+        self.assertEqual(tabel.total(Decimal('3'), 'Reseller'), Decimal('2700.00'))
+        self.assertEqual(tabel.total(Decimal('10'), 'Reseller'), Decimal('8000.00'))
+        self.assertEqual(tabel.total(Decimal('3')), Decimal('3000.00'))
+        # Harga reseller 0 berarti tidak ada harga reseller
+        self.assertEqual(TabelHarga(Decimal('1000'), Decimal('0')).total(Decimal('2'), 'Reseller'), Decimal('2000.00'))
+
+
+class MesinHargaTests(KatalogTestCase):
+
+    def setUp(self):
+        self.varian = self.buat_varian('Kopi Sachet', harga_jual_normal=1500, harga_jual_reseller=1300)
+        self.mesin = MesinHarga()
+
+    def test_keranjang_dihitung_per_total_varian(self):
+        self.assertEqual(self.mesin.hitung_keranjang([(self.varian.id, Decimal('3'))])[1], Decimal('4500.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            AturanHargaKuantitas.objects.create(varian_produk=self.varian, jumlah_minimal=3, harga_total_khusus=4000)
+        baris, total = self.mesin.hitung_keranjang([(self.varian.id, Decimal('1')), (self.varian.id, Decimal('2'))])
+        # Dua baris digabung menjadi 3 unit (harga bundel), subtotal dibagi proporsional
+        self.assertEqual([b['subtotal'] for b in baris], [Decimal('1333.33'), Decimal('2666.67')])
+        self.assertEqual(total, Decimal('4000.00'))
+        with self.assertRaises(KeyError):
+            self.mesin.hitung_keranjang([(999999, Decimal('1'))])
+
+    def test_tabel_dikompilasi_ulang_saat_versi_katalog_naik(self):
+        self.assertEqual(self.mesin.hitung_keranjang([(self.varian.id, Decimal('2'))])[1], Decimal('3000.00'))
+        # Versi sama: cukup satu query versi, tabel dari memori
+        with self.assertNumQueries(1):
+            self.mesin.hitung_keranjang([(self.varian.id, Decimal('2'))])
+
+        self.varian.harga_jual_normal = Decimal('1750')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.varian.save()
+        self.assertEqual(self.mesin.hitung_keranjang([(self.varian.id, Decimal('2'))])[1], Decimal('3500.00'))
+        self.assertEqual(self.mesin.hitung_keranjang([(self.varian.id, Decimal('2'))], 'Reseller')[1], Decimal('2600.00'))
+
+
+class KatalogCacheTests(KatalogTestCase):
+    URL = '/api/products/varian-produk/'
+
+    def setUp(self):
+        cache.clear()
+        cache_katalog.kosongkan_lokal()
+        self.varian = [self.buat_varian(f'Produk {i}', sku=f'89900{i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', role='admin'))
+
+    def get(self, params=None, **headers):
+        return self.client.get(self.URL, params or {'page_size': 10}, headers=headers)
+
+    def stok(self, response, varian):
+        return next(r['stok'] for r in response.data['results'] if r['id'] == varian.id)
+
+    def test_if_none_match_diurai_per_entity_tag(self):
+        etag = self.get()['ETag']
+        for header in (etag, f'W/{etag}', f'"lain", {etag}', f'W/"lain",W/{etag}', '*'):
+            with self.subTest(header=header):
+                self.assertEqual(self.get(if_none_match=header).status_code, 304)
+        # ETag hanya sebagai substring dari tag lain tidak dianggap cocok
+        for header in ('"lain"', f'"x{etag}x"', etag[:-2] + '"', ''):
+            with self.subTest(header=header):
+                self.assertEqual(self.get(if_none_match=header).status_code, 200)
+
+    def test_mutasi_stok_tidak_membuang_cache_katalog(self):
+        pertama = self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            ubah_stok({self.varian[0].id: Decimal('-5')})
+        # Query: versi, lalu stok terkini halaman ini; payload katalog dari cache
+        with self.assertNumQueries(2):
+            kedua = self.get()
+        self.assertNotEqual(kedua['ETag'], pertama['ETag'])
+        self.assertEqual(self.get(if_none_match=pertama['ETag']).status_code, 200)
+        self.assertEqual((self.stok(pertama, self.varian[0]), self.stok(kedua, self.varian[0])), ('50.000', '45.000'))
+        self.assertEqual(self.stok(kedua, self.varian[1]), '50.000')
+
+    def test_perubahan_produk_dan_varian_membangun_ulang_payload(self):
+        pertama = self.get()
+        varian = self.varian[1]
+        varian.nama_varian = 'Kardus'
+        with self.captureOnCommitCallbacks(execute=True):
+            varian.save()
+        kedua = self.get()
+        self.assertNotEqual(kedua['ETag'], pertama['ETag'])
+        self.assertEqual(next(r['nama_varian'] for r in kedua.data['results'] if r['id'] == varian.id), 'Kardus')
+
+        produk = self.varian[2].produk_induk
+        produk.nama_produk = 'Produk Baru'
+        with self.captureOnCommitCallbacks(execute=True):
+            produk.save()
+        nama = [r['nama_produk_induk'] for r in self.get().data['results']]
+        self.assertIn('Produk Baru', nama)
+
+    def test_link_halaman_mengikuti_host_request(self):
+        pertama = self.client.get(self.URL, {'page_size': 1}, HTTP_HOST='kasir-1.lan')
+        self.assertTrue(pertama.data['next'].startswith('http://kasir-1.lan/api/products/varian-produk/?'))
+        # Payload dari cache, link dibangun ulang untuk host dan skema request ini
+        kedua = self.client.get(self.URL, {'page_size': 1}, HTTP_HOST='toko.example', secure=True)
+        self.assertEqual(kedua.data['next'], pertama.data['next'].replace('http://kasir-1.lan', 'https://toko.example'))
+        self.assertIsNone(kedua.data['previous'])
+
+    @mock.patch.object(cache_katalog, 'MAKS_LOKAL', 2)
+    def test_lru_lokal_membuang_kunci_terlama(self):
+        cache_katalog.simpan('a', 1)
+        cache_katalog.simpan('b', 2)
+        self.assertEqual(cache_katalog.ambil('a'), 1)
+        cache_katalog.simpan('c', 3)
+        # 'b' yang paling lama tidak dipakai; tanpa cache bersama datanya hilang
+        self.assertEqual([cache_katalog.ambil(k) for k in 'abc'], [1, None, 3])
+
+    @override_settings(KATALOG_CACHE_ALIAS='default')
+    def test_cache_bersama_dipakai_saat_lru_lokal_kosong(self):
+        cache_katalog.simpan('katalog:uji', {'results': []})
+        cache_katalog.kosongkan_lokal()
+        self.assertEqual(cache_katalog.ambil('katalog:uji'), {'results': []})
+        # Worker lain (LRU lokal kosong) mendapat payload dari cache bersama tanpa membangun ulang
+        self.get()
+        cache_katalog.kosongkan_lokal()
+        with self.assertNumQueries(2):
+            self.get()
+
+
+class ImporCSVTests(KatalogTestCase):
+    KOLOM = 'kategori,nama_produk_induk,nama_varian,sku,stok,harga_beli,harga_ecer\n'
+
+    def impor(self, *baris, **kwargs):
+        berkas = io.BytesIO((self.KOLOM + ''.join(f'{b}\n' for b in baris)).encode())
+        return ImporVarianCSV(**kwargs).jalankan(berkas)
+
+    def test_dry_run_tidak_menulis_apa_pun_tapi_laporannya_lengkap(self):
+        self.buat_varian('Gula Pasir', sku='899100', stok=10)
+        jumlah_awal = (VarianProduk.objects.count(), Produk.objects.count(), StockHistory.objects.count())
+
+        laporan = self.impor(
+            'Sembako,Gula Pasir,Biasa,899100,10,2500,3000',
+            'Sembako,Gula Pasir,1 Kg,899101,5,12000,14000',
+            'Minuman,Teh Botol,Kecil,899200,24,3000,4000',
+            'Minuman,Teh Botol,,899201,1,1,1',
+            dry_run=True,
+        )
+
+        self.assertEqual((VarianProduk.objects.count(), Produk.objects.count(), StockHistory.objects.count()), jumlah_awal)
+        self.assertFalse(Kategori.objects.filter(nama_kategori='Minuman').exists())
+        self.assertEqual(
+            {k: laporan[k] for k in ('dry_run', 'dibuat', 'diperbarui', 'tidak_berubah', 'gagal')},
+            {'dry_run': True, 'dibuat': 2, 'diperbarui': 0, 'tidak_berubah': 1, 'gagal': 1},
+        )
+        self.assertEqual((laporan['kategori_baru'], laporan['produk_baru']), (['Minuman'], ['Teh Botol']))
+        self.assertEqual(laporan['errors'][0]['baris'], 5)
+
+    def test_baris_tidak_berubah_dilewati_tanpa_menulis(self):
+        varian = self.buat_varian('Gula Pasir', sku='899100', stok=10)
+        with mock.patch.object(VarianProduk.objects, 'bulk_create') as bulk_create:
+            laporan = self.impor('Sembako,Gula Pasir,Biasa,899100,10.000,2500,3000')
+        bulk_create.assert_not_called()
+        self.assertEqual((laporan['tidak_berubah'], laporan['diperbarui'], laporan['dibuat']), (1, 0, 0))
+        self.assertFalse(StockHistory.objects.filter(product=varian).exists())
+
+    def test_varian_baru_stoknya_tercatat_sebagai_stok_awal_dengan_lapisan_biaya(self):
+        laporan = self.impor(
+            'Sembako,Gula Pasir,1 Kg,899101,5,12000,14000',
+            'Sembako,Gula Pasir,Kosong,899102,0,8000,9000',
+        )
+        self.assertEqual(laporan['dibuat'], 2)
+        baru = VarianProduk.objects.get(sku='899101')
+        self.assertEqual(baru.stok, Decimal('5'))
+
+        riwayat = StockHistory.objects.get(product=baru)
+        self.assertEqual((riwayat.reason, riwayat.quantity_change, riwayat.stock_after), (StockHistory.Reason.AWAL, 5, 5))
+        self.assertTrue(riwayat.notes.startswith('Impor CSV'))
+        lapisan = LapisanBiaya.objects.get(varian=baru)
+        self.assertEqual((lapisan.sisa, lapisan.harga_satuan), (Decimal('5'), Decimal('12000')))
+        self.assertEqual(NilaiPersediaan.objects.get(varian=baru).nilai_fifo, Decimal('60000'))
+
+        # Varian tanpa stok tetap punya posisi persediaan, seperti varian yang dibuat lewat form
+        kosong = VarianProduk.objects.get(sku='899102')
+        self.assertFalse(StockHistory.objects.filter(product=kosong).exists())
+        self.assertEqual(NilaiPersediaan.objects.get(varian=kosong).nilai_rata_rata, 0)
+
+    def test_sku_yang_ada_diperbarui_dan_selisih_stok_lewat_layanan_stok(self):
+        varian = self.buat_varian('Gula Pasir', sku='899100', stok=10)
+        laporan = self.impor(
+            'Sembako,Gula Pasir,Curah,899100,4,2600,3200',
+            'Sembako,Teh Celup,Kotak,,7,4000,5000',
+            'Sembako,Teh Celup,Kotak,,9,4000,5000',
+        )
+        self.assertEqual((laporan['diperbarui'], laporan['dibuat'], laporan['duplikat']), (1, 1, 1))
+
+        varian.refresh_from_db()
+        self.assertEqual((varian.nama_varian, varian.stok, varian.harga_jual_normal), ('Curah', Decimal('4'), Decimal('3200')))
+        riwayat = StockHistory.objects.get(product=varian)
+        self.assertEqual((riwayat.reason, riwayat.quantity_change, riwayat.stock_after), (StockHistory.Reason.OPNAME, -6, 4))
+        self.assertEqual(riwayat.notes, 'Impor CSV. Sistem: 10.000, Fisik: 4.000')
+        # Barang keluar dinilai dari lapisan pembuka varian (harga beli lama 2500)
+        self.assertEqual(NilaiPersediaan.objects.get(varian=varian).nilai_fifo, Decimal('10000'))
+        # Baris duplikat: baris terakhir yang berlaku
+        self.assertEqual(VarianProduk.objects.get(nama_varian='Kotak').stok, Decimal('9'))
+
+    def test_file_diproses_per_chunk_dengan_dimensi_dibuat_sekali(self):
+        baris = [f'Sembako,Kopi Bubuk,Varian {i},8990{i:02d},{i},1000,1500' for i in range(5)]
+        with mock.patch.object(ImporVarianCSV, '_proses_chunk', autospec=True,
+                               side_effect=ImporVarianCSV._proses_chunk) as proses:
+            laporan = self.impor(*baris, ukuran_chunk=2)
+
+        self.assertEqual([len(c.args[1]) for c in proses.call_args_list], [2, 2, 1])
+        self.assertEqual((laporan['dibuat'], laporan['produk_baru']), (5, ['Kopi Bubuk']))
+        self.assertEqual(Produk.objects.filter(nama_produk='Kopi Bubuk').count(), 1)
+        self.assertEqual(
+            list(VarianProduk.objects.filter(produk_induk__nama_produk='Kopi Bubuk').order_by('sku').values_list('stok', flat=True)),
+            [Decimal(i) for i in range(5)],
+        )
+        self.assertEqual(StockHistory.objects.filter(reason=StockHistory.Reason.AWAL).count(), 4)
+
+
+class BarcodeTests(TestCase):
+    DATA_OFF = {
+        'status': 1,
+        'product': {'product_name': 'Teh Botol', 'generic_name': '450 ml', 'categories_tags': ['en:teas'], 'brands': 'Sosro'},
+    }
+
+    def setUp(self):
+        patcher = mock.patch('products.barcode._get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def balas(self, status_code=200, data=None):
+        response = mock.Mock(status_code=status_code)
+        response.json.return_value = data if data is not None else self.DATA_OFF
+        self.session.get.return_value = response
+
+    def kedaluwarsa(self, barcode, umur):
+        BarcodeMetadata.objects.filter(barcode=barcode).update(diperbarui_pada=timezone.now() - umur)
+
+    def test_hasil_api_disimpan_dan_dipakai_selama_ttl(self):
+        self.balas()
+        hasil = cari_barcode('8886008101053')
+        self.assertEqual((hasil['nama_produk_induk'], hasil['kategori'], hasil['pemasok']), ('Teh Botol', 'en:teas', 'Sosro'))
+        self.session.get.assert_called_once_with(
+            'https://world.openfoodfacts.org/api/v2/product/8886008101053.json', timeout=barcode.TIMEOUT
+        )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(cari_barcode('8886008101053'), hasil)
+        self.assertEqual(self.session.get.call_count, 1)
+
+        self.kedaluwarsa('8886008101053', barcode.TTL_DITEMUKAN + timedelta(minutes=1))
+        cari_barcode('8886008101053')
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_barcode_tidak_ada_disimpan_sebagai_cache_negatif(self):
+        self.balas(status_code=404)
+        self.assertIsNone(cari_barcode('000111'))
+        self.assertFalse(BarcodeMetadata.objects.get(barcode='000111').ditemukan)
+
+        self.assertIsNone(cari_barcode('000111'))
+        self.assertEqual(self.session.get.call_count, 1)
+
+        # TTL negatif lebih pendek dari TTL hasil ditemukan
+        self.kedaluwarsa('000111', barcode.TTL_NEGATIF + timedelta(minutes=1))
+        self.balas()
+        self.assertEqual(cari_barcode('000111')['nama_produk_induk'], 'Teh Botol')
+        self.assertTrue(BarcodeMetadata.objects.get(barcode='000111').ditemukan)
+
+    def test_timeout_tanpa_cache_jadi_503(self):
+        self.session.get.side_effect = requests.exceptions.ReadTimeout('read timed out')
+        with self.assertRaises(BarcodeLookupError):
+            cari_barcode('8886008101053')
+        self.assertFalse(BarcodeMetadata.objects.exists())
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='kasir', password='x'))
+        response = client.get('/api/products/lookup-barcode/', {'barcode': '8886008101053'})
+        self.assertEqual(response.status_code, 503)
+
+    def test_timeout_memakai_cache_kedaluwarsa(self):
+        self.balas()
+        cari_barcode('8886008101053')
+        self.kedaluwarsa('8886008101053', barcode.TTL_DITEMUKAN + timedelta(days=1))
+
+        self.session.get.side_effect = requests.exceptions.ConnectTimeout('connect timed out')
+        self.assertEqual(cari_barcode('8886008101053')['nama_produk_induk'], 'Teh Botol')
+
+    def test_muat_dump_jsonl_gz_dan_tsv(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        jsonl = os.path.join(folder, 'produk.jsonl.gz')
+        with gzip.open(jsonl, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'code': '111', **self.DATA_OFF['product']}) + '\n')
+            f.write('bukan json\n\n')
+            f.write(json.dumps({'code': '222', 'product_name': 'Kopi', 'brands': 'Kapal Api'}) + '\n')
+        tsv = os.path.join(folder, 'produk.tsv')
+        with open(tsv, 'w', encoding='utf-8') as f:
+            f.write('code\tproduct_name\tcategories_tags\tbrands\n')
+            f.write('222\tKopi Mocha\ten:coffees,en:drinks\tKapal Api\n')
+            f.write('\tTanpa Barcode\t\t\n')
+
+        keluaran, galat = io.StringIO(), io.StringIO()
+        call_command('load_barcode_metadata', jsonl, batch_size=1, stdout=keluaran, stderr=galat)
+        call_command('load_barcode_metadata', tsv, stdout=keluaran, stderr=galat)
+        self.assertIn('Baris 2 bukan JSON', galat.getvalue())
+
+        self.assertEqual(BarcodeMetadata.objects.count(), 2)
+        # Baris TSV menimpa baris JSONL dengan barcode yang sama
+        kopi = BarcodeMetadata.objects.get(barcode='222')
+        self.assertEqual((kopi.nama_produk_induk, kopi.kategori, kopi.sumber), ('Kopi Mocha', 'en:coffees', 'IMPOR'))
+
+        # Data impor tidak pernah kedaluwarsa: lookup tetap offline
+        self.kedaluwarsa('111', timedelta(days=3650))
+        self.assertEqual(cari_barcode('111')['pemasok'], 'Sosro')
+        self.session.get.assert_not_called()
+
+    def test_dump_tidak_ada_jadi_command_error(self):
+        with self.assertRaises(CommandError):
+            call_command('load_barcode_metadata', '/tidak/ada/produk.jsonl', stdout=io.StringIO())
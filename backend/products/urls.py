@@ -10,6 +10,7 @@ from .views import (
     AturanHargaKuantitasViewSet,
     LowStockReportView,
     LowStockCountView,
+    LowStockChangesView,
     BestSellingProductsView,
     ProductExportCSVView,
     ProductImportCSVView,
@@ -27,6 +28,7 @@ urlpatterns = [
     path('', include(router.urls)),
         path('laporan/stok-rendah/', LowStockReportView.as_view(), name='laporan-stok-rendah'),
         path('laporan/stok-rendah/count/', LowStockCountView.as_view(), name='laporan-stok-rendah-count'),
+        path('laporan/stok-rendah/perubahan/', LowStockChangesView.as_view(), name='laporan-stok-rendah-perubahan'),
         path('laporan/produk-terlaris/', BestSellingProductsView.as_view(), name='laporan-produk-terlaris'),
         path('export-produk-csv/', ProductExportCSVView.as_view(), name='export-produk-csv'),
         path('import-produk-csv/', ProductImportCSVView.as_view(), name='import-produk-csv'),
@@ -1,26 +1,32 @@
 from rest_framework import viewsets, status, generics
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter
-from django.db import transaction
 from rest_framework.response import Response
 from pos_project.pagination import StandardResultsSetPagination
-from django.db.models import F, Sum
+from pos_project.daterange import filter_rentang
+from django.db.models import Sum
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
 from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit
 from transactions.models import DetailTransaksi
 from rest_framework.decorators import action
 import csv
-import io
-import requests 
 from django.http import HttpResponse
 
-from .models import Kategori, Pemasok, Produk, VarianProduk, AturanHargaKuantitas
+from . import cache_katalog
+from .impor_csv import ImporVarianCSV, ImporError
+from .barcode import cari_barcode, BarcodeLookupError
+from .indeks_sku import indeks_sku
+from .autocomplete import autocomplete, MAKS_HASIL
+from .stok_rendah import jumlah_stok_rendah
+from .pencarian import PencarianProdukFilter, PencarianVarianFilter
+from .models import Kategori, Pemasok, Produk, VarianProduk, AturanHargaKuantitas, PerubahanStokRendah
 from .serializers import (
     KategoriSerializer, PemasokSerializer, ProdukSerializer,
     VarianProdukSerializer, ProductCreateSerializer, VarianProdukAddSerializer,
-    VarianUpdateWithRulesSerializer, AturanHargaKuantitasSerializer
+    VarianUpdateWithRulesSerializer, AturanHargaKuantitasSerializer, PerubahanStokRendahSerializer
 )
 
 # ViewSet ini tidak memerlukan perubahan besar
@@ -53,12 +59,12 @@ class ProdukViewSet(viewsets.ModelViewSet):
     API untuk produk induk. Endpoint utama untuk menampilkan data produk
     yang sudah dikelompokkan dan untuk membuat produk baru.
     """
-    queryset = Produk.objects.distinct().prefetch_related('varian__pemasok', 'varian__aturan_harga').select_related('kategori').all().order_by('nama_produk')
+    queryset = Produk.objects.prefetch_related('varian__pemasok', 'varian__aturan_harga').select_related('kategori').all().order_by('nama_produk')
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    # ?search= dicocokkan ke dokumen pencarian varian lewat EXISTS, jadi tidak perlu distinct()
+    filter_backends = [DjangoFilterBackend, PencarianProdukFilter]
     # Filter sekarang dilakukan pada field di model Produk
     filterset_fields = ['kategori']
-    search_fields = ['nama_produk', 'varian__nama_varian', 'varian__sku']
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -75,6 +81,27 @@ class ProdukViewSet(viewsets.ModelViewSet):
         headers = self.get_success_headers(read_serializer.data)
         return Response(read_serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
+def _link_relatif(url):
+    """Link halaman tanpa skema dan host, agar payload yang di-cache tidak terikat host request pertama."""
+    bagian = urlsplit(url)
+    return urlunsplit(('', '', bagian.path, bagian.query, bagian.fragment))
+
+
+def _ganti_link(data, ubah):
+    if not isinstance(data, dict):
+        return data
+    return {**data, **{k: ubah(data[k]) for k in ('next', 'previous') if data.get(k)}}
+
+
+def _dengan_stok_terkini(data):
+    """Salinan payload katalog (yang di-cache tidak diubah) dengan stok terkini, dengan satu query pk."""
+    baris = data['results'] if isinstance(data, dict) else data
+    stok = dict(VarianProduk.objects.filter(id__in=[r['id'] for r in baris]).values_list('id', 'stok'))
+    field = VarianProdukSerializer().fields['stok']
+    baris = [{**r, 'stok': field.to_representation(stok[r['id']])} if r['id'] in stok else r for r in baris]
+    return {**data, 'results': baris} if isinstance(data, dict) else baris
+
+
 # ==============================================================================
 # === VIEWSET VARIAN PRODUK (FOKUS PADA AKSI PER VARIAN) ===
 # ==============================================================================
@@ -83,15 +110,14 @@ class VarianProdukViewSet(viewsets.ModelViewSet):
     API untuk aksi spesifik per varian: update, hapus, dan tambah varian baru.
     Juga digunakan untuk mengambil daftar varian 'flat' untuk kasir.
     """
-    queryset = VarianProduk.objects.select_related('produk_induk__kategori', 'pemasok').all()
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    queryset = VarianProduk.objects.untuk_tampilan().all()
+    filter_backends = [DjangoFilterBackend, PencarianVarianFilter]
     # Filter disesuaikan dengan model baru
     filterset_fields = {
         'produk_induk__kategori': ['exact'],
         'pemasok': ['exact'],
         'is_favorit': ['exact'],
     }
-    search_fields = ['nama_varian', 'sku', 'produk_induk__nama_produk']
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -101,6 +127,29 @@ class VarianProdukViewSet(viewsets.ModelViewSet):
              return queryset.filter(is_active=True)
         return queryset
             
+    def list(self, request, *args, **kwargs):
+        """
+        Daftar katalog kasir dengan cache berversi. Versi dibaca lebih dulu
+        agar data yang dibangun tidak pernah tersimpan di bawah versi yang
+        lebih baru dari datanya. Payload di-cache per versi struktur katalog
+        saja, dengan link halaman relatif; stok ditimpa dari database di setiap
+        request, jadi penjualan tidak membuang cache. ETag ikut versi stok,
+        klien dengan ETag yang sama cukup dapat 304.
+        """
+        versi = cache_katalog.versi_katalog()
+        etag = cache_katalog.etag_katalog(versi, request.query_params)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if cache_katalog.etag_cocok(etag, request.headers.get('If-None-Match')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        kunci = cache_katalog.kunci_katalog(versi[0], request.query_params)
+        data = cache_katalog.ambil(kunci)
+        if data is None:
+            data = _ganti_link(super().list(request, *args, **kwargs).data, _link_relatif)
+            cache_katalog.simpan(kunci, data)
+        data = _ganti_link(_dengan_stok_terkini(data), request.build_absolute_uri)
+        return Response(data, headers=headers)
+
     def get_serializer_class(self):
         if self.action == 'create':
             return VarianProdukAddSerializer
@@ -115,6 +164,35 @@ class VarianProdukViewSet(viewsets.ModelViewSet):
         instance.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
     
+    @action(detail=False, methods=['get'])
+    def scan(self, request):
+        """
+        Lookup varian dari hasil scan barcode/SKU lewat index di memori,
+        tanpa query pencarian `icontains`. Stok ikut disimpan di index dan
+        dibaca ulang hanya setelah versi stok naik (lihat IndeksSKU).
+        """
+        sku = request.query_params.get('sku', '')
+        if not sku.strip():
+            return Response({'error': 'Parameter sku dibutuhkan.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        record = indeks_sku.cari_dengan_stok(sku)
+        if record is None:
+            return Response({'error': 'Produk dengan SKU ini tidak ditemukan.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(record)
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Saran varian untuk kotak pencarian kasir (?q=, ?limit= maks 50),
+        dijawab dari index di memori proses: tahan salah ketik dan awalan,
+        tanpa query ke database kecuali saat katalog berubah.
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), MAKS_HASIL)
+        except ValueError:
+            return Response({'error': 'Parameter limit harus angka.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': autocomplete.cari(request.query_params.get('q', ''), limit)})
+
     # --- ENDPOINT BARU UNTUK MENGAKTIFKAN KEMBALI ---
     @action(detail=True, methods=['post'])
     def reactivate(self, request, pk=None):
@@ -134,33 +212,66 @@ class AturanHargaKuantitasViewSet(viewsets.ModelViewSet):
 # ==============================================================================
 class LowStockReportView(generics.ListAPIView):
     """
-    API untuk laporan stok rendah, sekarang memfilter VarianProduk.
+    API untuk laporan stok rendah. Membaca kolom `stok_rendah` yang dijaga
+    jalur mutasi stok lewat index parsial, dan jumlah barisnya dari cache.
     """
     serializer_class = VarianProdukSerializer
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
-        # Logika filter diperbarui untuk model baru
-        return VarianProduk.objects.filter(
-            stok__lte=F('peringatan_stok_rendah'),
-            lacak_stok=True,
-            is_active=True
-        ).select_related('produk_induk', 'pemasok')
+        return VarianProduk.objects.untuk_tampilan().filter(stok_rendah=True).order_by('stok', 'id')
+
+    def list(self, request, *args, **kwargs):
+        self.paginator.jumlah_diketahui = jumlah_stok_rendah()
+        return super().list(request, *args, **kwargs)
 
 class LowStockCountView(APIView):
     """
-    API untuk jumlah stok rendah, sekarang menghitung VarianProduk.
+    API untuk jumlah stok rendah, dari cache yang hanya kedaluwarsa saat ada
+    varian yang melewati batas.
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        # Logika filter diperbarui untuk model baru
-        count = VarianProduk.objects.filter(
-            stok__lte=F('peringatan_stok_rendah'),
-            lacak_stok=True,
-            is_active=True
-        ).count()
-        return Response({'count': count})
+        return Response({'count': jumlah_stok_rendah()})
+
+class LowStockChangesView(APIView):
+    """
+    Feed perpindahan batas stok rendah agar UI tidak perlu mem-poll laporan
+    penuh. `?setelah=<id>` mengembalikan perubahan sesudah id itu (urut naik,
+    maks `limit`) beserta `terakhir` untuk panggilan berikutnya dan jumlah
+    stok rendah terkini; tanpa `setelah` dikembalikan perubahan terbaru.
+    Baris yang lebih muda dari JEDA_FEED ditahan sebentar agar baris dari
+    transaksi yang commit belakangan (id lebih kecil) tidak terlewat.
+    """
+    permission_classes = [IsAuthenticated]
+    JEDA_FEED = timedelta(seconds=2)
+    MAKS_LIMIT = 500
+
+    def get(self, request, *args, **kwargs):
+        try:
+            setelah = request.query_params.get('setelah')
+            setelah = int(setelah) if setelah not in (None, '') else None
+            limit = min(max(int(request.query_params.get('limit', 100)), 1), self.MAKS_LIMIT)
+        except ValueError:
+            return Response({'error': 'Parameter setelah dan limit harus angka.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = PerubahanStokRendah.objects.select_related('varian__produk_induk').filter(
+            created_at__lte=timezone.now() - self.JEDA_FEED
+        )
+        if setelah is None:
+            perubahan = list(queryset.order_by('-id')[:limit])[::-1]
+            ada_lagi = False
+        else:
+            perubahan = list(queryset.filter(id__gt=setelah).order_by('id')[:limit + 1])
+            ada_lagi = len(perubahan) > limit
+            perubahan = perubahan[:limit]
+        return Response({
+            'results': PerubahanStokRendahSerializer(perubahan, many=True).data,
+            'terakhir': perubahan[-1].id if perubahan else setelah,
+            'ada_lagi': ada_lagi,
+            'count': jumlah_stok_rendah(),
+        })
 
 # View ini tidak terpengaruh oleh perubahan model produk
 class BestSellingProductsView(generics.ListAPIView):
@@ -175,7 +286,7 @@ class BestSellingProductsView(generics.ListAPIView):
         
         # Ambil ID varian terlaris dari transaksi
         top_variant_ids = DetailTransaksi.objects.filter(
-            transaksi__created_at__date__gte=seven_days_ago,
+            **filter_rentang('transaksi__created_at', seven_days_ago),
             # PERBAIKAN: Pastikan varian yang dijual masih aktif
             varian_produk_terjual__is_active=True 
         ).values(
@@ -185,7 +296,7 @@ class BestSellingProductsView(generics.ListAPIView):
         ).order_by('-total_sold').values_list('varian_produk_terjual_id', flat=True)[:5]
         
         # Ambil objek VarianProduk berdasarkan ID terlaris
-        return VarianProduk.objects.filter(id__in=top_variant_ids)
+        return VarianProduk.objects.untuk_tampilan().filter(id__in=top_variant_ids)
 
 class ProductExportCSVView(APIView):
     permission_classes = [IsAuthenticated]
@@ -222,66 +333,32 @@ class ProductExportCSVView(APIView):
         return response
     
 class ProductImportCSVView(APIView):
+    """
+    Impor produk dari CSV. Tambahkan `?dry_run=1` untuk melihat laporan
+    dibuat/diperbarui/tidak berubah/gagal tanpa menulis apa pun.
+    """
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
         csv_file = request.FILES.get('file')
         if not csv_file:
             return Response({"error": "File tidak ditemukan."}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
 
         try:
-            decoded_file = csv_file.read().decode('utf-8')
-            io_string = io.StringIO(decoded_file)
-            reader = csv.DictReader(io_string)
-
-            for row in reader:
-                # Get or create Kategori dan Pemasok
-                kategori, _ = Kategori.objects.get_or_create(nama_kategori=row['kategori'])
-                pemasok = None
-                if row.get('pemasok'):
-                    pemasok, _ = Pemasok.objects.get_or_create(nama_pemasok=row['pemasok'])
-
-                # Get or create Produk Induk
-                produk_induk, _ = Produk.objects.get_or_create(
-                    nama_produk=row['nama_produk_induk'],
-                    defaults={'kategori': kategori}
-                )
-
-                # Siapkan data untuk VarianProduk
-                varian_defaults = {
-                    'produk_induk': produk_induk,
-                    'pemasok': pemasok,
-                    'stok': row.get('stok', 0),
-                    'satuan': row.get('satuan', 'pcs'),
-                    'purchase_price': row.get('harga_beli', 0),
-                    'harga_jual_normal': row.get('harga_ecer', 0),
-                    'harga_jual_reseller': row.get('harga_grosir') or None,
-                    'lacak_stok': row.get('lacak_stok', 'True').lower() == 'true',
-                }
-
-                # Update atau buat VarianProduk berdasarkan SKU jika ada, jika tidak, berdasarkan nama
-                if row.get('sku'):
-                    VarianProduk.objects.update_or_create(
-                        sku=row['sku'],
-                        defaults={**varian_defaults, 'nama_varian': row['nama_varian']}
-                    )
-                else:
-                    VarianProduk.objects.update_or_create(
-                        produk_induk=produk_induk,
-                        nama_varian=row['nama_varian'],
-                        defaults=varian_defaults
-                    )
-
-        except Exception as e:
+            laporan = ImporVarianCSV(dry_run=dry_run, user=request.user).jalankan(csv_file.file)
+        except (ImporError, UnicodeDecodeError, csv.Error) as e:
             return Response({"error": f"Terjadi kesalahan saat memproses file: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"success": "Produk berhasil diimpor."}, status=status.HTTP_201_CREATED)
-    
+        if dry_run:
+            return Response({"success": "Simulasi impor selesai.", "laporan": laporan}, status=status.HTTP_200_OK)
+        return Response({"success": "Produk berhasil diimpor.", "laporan": laporan}, status=status.HTTP_201_CREATED)
+
 class BarcodeLookupView(APIView):
     """
-    API untuk mencari detail produk berdasarkan barcode
-    menggunakan database Open Food Facts.
+    API untuk mencari detail produk berdasarkan barcode. Hasil dari database
+    Open Food Facts disimpan di tabel BarcodeMetadata (termasuk hasil negatif),
+    jadi scan berulang tidak lagi memanggil layanan eksternal.
     """
     permission_classes = [IsAuthenticated]
 
@@ -290,30 +367,11 @@ class BarcodeLookupView(APIView):
         if not barcode:
             return Response({"error": "Parameter barcode dibutuhkan."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # URL API Open Food Facts
-        url = f"https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
-        
         try:
-            response = requests.get(url)
-            response.raise_for_status()  # Akan error jika status bukan 2xx
-            data = response.json()
-
-            if data.get('status') == 1 and data.get('product'):
-                product_data = data['product']
-                
-                # Format data agar sesuai dengan form frontend kita
-                formatted_data = {
-                    'nama_produk_induk': product_data.get('product_name_id', '') or product_data.get('product_name', ''),
-                    'nama_varian': product_data.get('generic_name_id', '') or product_data.get('generic_name', 'Eceran'),
-                    'sku': barcode,
-                    'kategori': product_data.get('categories_tags', [None])[0],
-                    'pemasok': product_data.get('brands', None)
-                }
-                return Response(formatted_data)
-            else:
-                return Response({"error": "Produk tidak ditemukan di database Open Food Facts."}, status=status.HTTP_404_NOT_FOUND)
-
-        except requests.exceptions.RequestException as e:
+            formatted_data = cari_barcode(barcode.strip())
+        except BarcodeLookupError as e:
             return Response({"error": f"Gagal menghubungi layanan eksternal: {str(e)}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-        except Exception as e:
-            return Response({"error": f"Terjadi kesalahan: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+
+        if formatted_data is None:
+            return Response({"error": "Produk tidak ditemukan di database Open Food Facts."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(formatted_data)
@@ -0,0 +1,82 @@
+# transactions/aktivitas.py
+
+from products.models import VarianProduk
+from .models import LogAktivitas, StockHistory
+
+
+def _rupiah(angka):
+    return f"Rp {angka:,.0f}"
+
+
+def _jumlah(angka):
+    return format(angka.normalize(), '+f')
+
+
+def _username(user):
+    return user.username if user else ''
+
+
+def log_transaksi(transaksi, kasir=None):
+    """Log penjualan yang sudah selesai."""
+    kasir = kasir or transaksi.kasir
+    return LogAktivitas(
+        tipe=LogAktivitas.Tipe.TRANSAKSI,
+        judul=f"Transaksi #{transaksi.nomor_transaksi.split('-')[1]}",
+        keterangan=f"sebesar {_rupiah(transaksi.total_setelah_diskon)}",
+        user=kasir, username=_username(kasir),
+        objek_id=transaksi.id, created_at=transaksi.created_at,
+    )
+
+
+def log_riwayat_stok(riwayat, nama_varian):
+    """
+    Log untuk riwayat stok di luar penjualan (penjualan sudah tercatat
+    sebagai transaksi). `nama_varian` adalah {varian_id: nama tampilan}.
+    """
+    return [
+        LogAktivitas(
+            tipe=LogAktivitas.Tipe.STOK, sub_tipe=h.reason,
+            judul=h.get_reason_display(),
+            keterangan=f"{_jumlah(h.quantity_change)} pada {nama_varian.get(h.product_id, '-')}",
+            user=h.user, username=_username(h.user),
+            objek_id=h.id, created_at=h.created_at,
+        )
+        for h in riwayat if h.reason != StockHistory.Reason.PENJUALAN
+    ]
+
+
+def nama_varian(varian_ids):
+    """{varian_id: 'Produk Varian'} dengan satu query."""
+    return {
+        varian_id: f"{nama_produk} {nama}"
+        for varian_id, nama_produk, nama in VarianProduk.objects.filter(id__in=set(varian_ids)).values_list(
+            'id', 'produk_induk__nama_produk', 'nama_varian'
+        )
+    }
+
+
+def log_pembayaran(pembayaran, hutang_piutang):
+    pihak = hutang_piutang.pelanggan_nama or (hutang_piutang.supplier.nama_pemasok if hutang_piutang.supplier else '-')
+    return LogAktivitas(
+        tipe=LogAktivitas.Tipe.PEMBAYARAN, sub_tipe=hutang_piutang.tipe,
+        judul=f"Pembayaran {hutang_piutang.get_tipe_display()}",
+        keterangan=f"{_rupiah(pembayaran.jumlah_bayar)} - {pihak}",
+        user=pembayaran.dicatat_oleh, username=_username(pembayaran.dicatat_oleh),
+        objek_id=pembayaran.id, created_at=pembayaran.tanggal_bayar,
+    )
+
+
+def log_simpanan(riwayat, pelanggan):
+    return LogAktivitas(
+        tipe=LogAktivitas.Tipe.SIMPANAN, sub_tipe=riwayat.tipe,
+        judul=riwayat.get_tipe_display(),
+        keterangan=f"{_rupiah(riwayat.jumlah)} - {pelanggan.nama_pelanggan}",
+        user=riwayat.dicatat_oleh, username=_username(riwayat.dicatat_oleh),
+        objek_id=riwayat.id, created_at=riwayat.created_at,
+    )
+
+
+def catat(*log):
+    """Menyimpan log aktivitas (sudah dibangun dengan fungsi log_*) dengan satu insert."""
+    log = [entri for entri in log if entri is not None]
+    return LogAktivitas.objects.bulk_create(log) if log else []
@@ -0,0 +1,42 @@
+# transactions/management/commands/backfill_harga_pokok.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from products.models import VarianProduk
+from transactions.models import DetailTransaksi
+
+
+class Command(BaseCommand):
+    help = (
+        "Mengisi harga_pokok DetailTransaksi lama yang masih kosong secara bertahap. "
+        "Harga beli historis tidak tersimpan, jadi dipakai purchase_price varian saat ini."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        harga_beli = VarianProduk.objects.filter(
+            id=OuterRef('varian_produk_terjual_id')
+        ).values('purchase_price')[:1]
+
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(
+                DetailTransaksi.objects.filter(id__gt=last_id, harga_pokok__isnull=True)
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            # Satu UPDATE per batch dengan transaksi pendek agar tidak menahan lock lama
+            with transaction.atomic():
+                total += DetailTransaksi.objects.filter(id__in=ids, harga_pokok__isnull=True).update(
+                    harga_pokok=Subquery(harga_beli)
+                )
+            self.stdout.write(f"  {total} baris diisi...")
+
+        self.stdout.write(self.style.SUCCESS(f"{total} detail transaksi diisi harga_pokok."))
@@ -0,0 +1,121 @@
+# transactions/management/commands/benchmark_laporan.py
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.utils import timezone
+
+from pos_project import benchmark
+from pos_project.daterange import filter_rentang
+from pos_project.pagination import RiwayatPagination
+from transactions.models import DetailTransaksi, Transaksi
+from transactions.views import CashFlowReportView, DashboardStatsView, ProfitLossReportView
+
+METODE = ['Tunai', 'Tunai', 'Tunai', 'QRIS', 'Debit']
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark laporan dan daftar transaksi di atas data sintetis (default 1 juta transaksi): "
+        "rencana query filter tanggal lama (created_at__date) vs setengah terbuka, waktu endpoint "
+        "dashboard, arus kas dan laba rugi, serta halaman OFFSET vs keyset. Data dibuat di dalam "
+        "transaksi database yang di-rollback di akhir, jadi aman dijalankan di database sungguhan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jumlah', type=int, default=1_000_000, help="Jumlah transaksi sintetis.")
+        parser.add_argument('--hari', type=int, default=365, help="Rentang hari transaksi disebar ke belakang.")
+        parser.add_argument('--ulang', type=int, default=5, help="Pengulangan per pengukuran.")
+        parser.add_argument('--page-size', type=int, default=50)
+
+    def _isi_data(self, kasir, jumlah, hari):
+        varian_list = benchmark.buat_katalog(200)
+        acak = random.Random(jumlah)
+        akhir = timezone.now()
+        jarak = timedelta(days=hari) / jumlah
+        kode = benchmark.kode_acak()
+        for i in range(0, jumlah, benchmark.BATCH_SIZE):
+            transaksi_list, baris = [], []
+            for n in range(i, min(i + benchmark.BATCH_SIZE, jumlah)):
+                varian = varian_list[acak.randrange(len(varian_list))]
+                qty = Decimal(acak.randrange(1, 6))
+                total = varian.harga_jual_normal * qty
+                transaksi_list.append(Transaksi(
+                    nomor_transaksi=f'BENCH-{kode}-{n:08d}', kasir=kasir,
+                    total_harga=total, total_setelah_diskon=total, jumlah_bayar=total, kembalian=0,
+                    metode_pembayaran=METODE[n % len(METODE)],
+                    status='Dibatalkan' if n % 50 == 0 else 'Selesai',
+                    created_at=akhir - jarak * (jumlah - n),
+                ))
+                baris.append((varian, qty, total))
+            transaksi_list = Transaksi.objects.bulk_create(transaksi_list)
+            DetailTransaksi.objects.bulk_create([
+                DetailTransaksi(
+                    transaksi=trx, varian_produk_terjual=varian, jumlah=qty,
+                    harga_saat_transaksi=varian.harga_jual_normal, subtotal=total, harga_pokok=varian.purchase_price,
+                )
+                for trx, (varian, qty, total) in zip(transaksi_list, baris)
+            ])
+            self.stdout.write(f"\r  {min(i + benchmark.BATCH_SIZE, jumlah):,} transaksi", ending='')
+        self.stdout.write('')
+        call_command('rebuild_ringkasan_penjualan', stdout=StringIO())
+
+    def _rencana_filter_tanggal(self, dari, sampai, ulang):
+        lama = Transaksi.objects.filter(status='Selesai', created_at__date__range=(dari, sampai))
+        baru = Transaksi.objects.filter(status='Selesai', **filter_rentang('created_at', dari, sampai))
+        for judul, queryset in (('created_at__date__range (lama)', lama), ('rentang setengah terbuka', baru)):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Rencana query {judul}:"))
+            self.stdout.write(benchmark.rencana_query(queryset.values('total_setelah_diskon')))
+            hasil = benchmark.ukur(lambda: queryset.aggregate(total=Sum('total_setelah_diskon')), ulang)
+            self.stdout.write(f"  SUM 30 hari: {benchmark.format_waktu(hasil)}")
+
+    def _endpoint(self, user, dari, sampai, ulang):
+        self.stdout.write(self.style.MIGRATE_HEADING("Endpoint laporan:"))
+        endpoint = [
+            ('dashboard (bulan)', DashboardStatsView.as_view(), {'range': 'month'}),
+            ('arus kas 30 hari', CashFlowReportView.as_view(), {'start_date': dari, 'end_date': sampai}),
+            ('laba rugi 30 hari', ProfitLossReportView.as_view(), {'start_date': dari, 'end_date': sampai}),
+        ]
+        for nama, view, params in endpoint:
+            hasil = benchmark.ukur(lambda: benchmark.panggil_view(view, user, **params), ulang)
+            self.stdout.write(f"  {nama:<20} {benchmark.format_waktu(hasil)}")
+
+    def _halaman(self, ukuran, ulang):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Paginator daftar transaksi, {ukuran} per halaman:"))
+        queryset = Transaksi.objects.select_related('kasir').order_by('-created_at', '-id')
+        jumlah = queryset.count()
+        dalam = max(jumlah // ukuran // 2, 1)
+        # Kursor keyset tepat di posisi yang sama dengan halaman OFFSET `dalam`
+        sebelum = queryset[(dalam - 1) * ukuran - 1] if dalam > 1 else None
+        kursor = RiwayatPagination()._tulis_kursor(sebelum, mundur=False) if sebelum else ''
+        percobaan = [
+            ('OFFSET halaman 1', {'page': 1}),
+            (f'OFFSET halaman {dalam:,}', {'page': dalam}),
+            ('keyset halaman 1', {'cursor': ''}),
+            (f'keyset halaman {dalam:,}', {'cursor': kursor}),
+        ]
+        for nama, params in percobaan:
+            request = benchmark.buat_request(page_size=ukuran, **params)
+            halaman = RiwayatPagination().paginate_queryset(queryset, request)
+            assert len(halaman) == ukuran, (nama, len(halaman))
+            hasil = benchmark.ukur(lambda: list(RiwayatPagination().paginate_queryset(queryset, request)), ulang)
+            self.stdout.write(f"  {nama:<24} {benchmark.format_waktu(hasil)}")
+
+    def handle(self, *args, **options):
+        ulang = options['ulang']
+        sampai = timezone.localdate()
+        dari = sampai - timedelta(days=29)
+        with benchmark.data_sementara():
+            user = get_user_model().objects.create(username=f'benchmark-{benchmark.kode_acak()}', role='admin')
+            self.stdout.write(f"Mengisi {options['jumlah']:,} transaksi sintetis...")
+            self._isi_data(user, options['jumlah'], options['hari'])
+            self._rencana_filter_tanggal(dari.isoformat(), sampai.isoformat(), ulang)
+            self._endpoint(user, dari.isoformat(), sampai.isoformat(), ulang)
+            self._halaman(options['page_size'], ulang)
+        self.stdout.write(self.style.SUCCESS("Selesai; data benchmark sudah di-rollback."))
@@ -0,0 +1,33 @@
+# transactions/management/commands/lepas_reservasi_kedaluwarsa.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from transactions.models import ReservasiStok
+
+
+class Command(BaseCommand):
+    help = (
+        "Menghapus reservasi stok transaksi ditahan yang sudah kedaluwarsa. "
+        "Jalankan berkala (mis. cron tiap 5 menit); reservasi kedaluwarsa "
+        "sudah tidak dihitung saat checkout, perintah ini hanya membersihkan tabel."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batas = timezone.now()
+        total = 0
+        while True:
+            ids = list(
+                ReservasiStok.objects.filter(kedaluwarsa__lte=batas)
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                total += ReservasiStok.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f"{total} reservasi kedaluwarsa dilepas."))
@@ -0,0 +1,58 @@
+# transactions/management/commands/rebuild_log_aktivitas.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from transactions import aktivitas
+from transactions.models import LogAktivitas, Pembayaran, RiwayatSimpanan, StockHistory, Transaksi
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Membangun ulang LogAktivitas dari transaksi selesai, riwayat stok (di luar penjualan), "
+        "pembayaran hutang/piutang dan riwayat simpanan."
+    )
+
+    def _bangun(self, queryset, ke_log):
+        """Membaca `queryset` per batch dan menyimpan log dari `ke_log(batch)`."""
+        jumlah = 0
+        batch = []
+        for obj in queryset.order_by('id').iterator(chunk_size=BATCH_SIZE):
+            batch.append(obj)
+            if len(batch) >= BATCH_SIZE:
+                jumlah += len(LogAktivitas.objects.bulk_create(ke_log(batch)))
+                batch = []
+        if batch:
+            jumlah += len(LogAktivitas.objects.bulk_create(ke_log(batch)))
+        return jumlah
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        LogAktivitas.objects.all().delete()
+
+        jumlah = {
+            'transaksi': self._bangun(
+                Transaksi.objects.filter(status='Selesai').select_related('kasir'),
+                lambda batch: [aktivitas.log_transaksi(trx) for trx in batch],
+            ),
+            'stok': self._bangun(
+                StockHistory.objects.exclude(reason=StockHistory.Reason.PENJUALAN).select_related(
+                    'user', 'product__produk_induk'
+                ),
+                lambda batch: aktivitas.log_riwayat_stok(batch, {
+                    h.product_id: f"{h.product.produk_induk.nama_produk} {h.product.nama_varian}" for h in batch
+                }),
+            ),
+            'pembayaran': self._bangun(
+                Pembayaran.objects.select_related('dicatat_oleh', 'hutang_piutang__supplier'),
+                lambda batch: [aktivitas.log_pembayaran(p, p.hutang_piutang) for p in batch],
+            ),
+            'simpanan': self._bangun(
+                RiwayatSimpanan.objects.select_related('dicatat_oleh', 'pelanggan'),
+                lambda batch: [aktivitas.log_simpanan(r, r.pelanggan) for r in batch],
+            ),
+        }
+        self.stdout.write(self.style.SUCCESS(
+            "Log aktivitas dibangun ulang: " + ", ".join(f"{n} {sumber}" for sumber, n in jumlah.items()) + "."
+        ))
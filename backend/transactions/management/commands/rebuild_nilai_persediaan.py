@@ -0,0 +1,76 @@
+# transactions/management/commands/rebuild_nilai_persediaan.py
+
+from itertools import groupby
+from operator import attrgetter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from products.models import VarianProduk
+from transactions.models import LapisanBiaya, NilaiPersediaan, StockHistory
+from transactions.persediaan import BukuPersediaan, harga_masuk
+
+
+class Command(BaseCommand):
+    help = (
+        "Menghitung ulang lapisan biaya, nilai persediaan (rata-rata bergerak dan FIFO) "
+        "dan snapshot valuasi di setiap StockHistory dengan memutar ulang riwayat stok secara kronologis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        chunk_size = self.chunk_size = options['chunk_size']
+        harga_beli = dict(VarianProduk.objects.values_list('id', 'purchase_price'))
+
+        LapisanBiaya.objects.all().delete()
+        NilaiPersediaan.objects.all().delete()
+
+        # Satu query streaming, diputar ulang per varian dalam urutan kejadian
+        # (created_at, id); id saja tidak menjamin urutan kronologis
+        riwayat = StockHistory.objects.order_by('product_id', 'created_at', 'id').only(
+            'id', 'product_id', 'quantity_change', 'stock_after', 'reason', 'biaya_satuan', 'created_at'
+        ).iterator(chunk_size=chunk_size)
+
+        total = 0
+        diputar = set()
+        for varian_id, riwayat_varian in groupby(riwayat, key=attrgetter('product_id')):
+            buku = BukuPersediaan()
+            batch = []
+            for h in riwayat_varian:
+                # Harga pembelian yang tercatat dipakai lagi; riwayat lama tanpa harga memakai harga beli saat ini
+                eksplisit = h.biaya_satuan if h.reason == StockHistory.Reason.PEMBELIAN else None
+                h.biaya_satuan, h.nilai_setelah, h.nilai_fifo_setelah = buku.catat(
+                    h.product_id, h.quantity_change, h.stock_after, harga_beli.get(h.product_id, 0), h.created_at,
+                    harga_masuk(h.reason, eksplisit, harga_beli.get(h.product_id, 0)),
+                )
+                batch.append(h)
+                if len(batch) >= chunk_size:
+                    total = self._simpan_riwayat(batch, total)
+                    batch = []
+            total = self._simpan_riwayat(batch, total)
+            # Lapisan biaya dan nilai akhir varian ini ditulis sekaligus
+            buku.simpan()
+            diputar.add(varian_id)
+
+        # Varian yang stoknya belum pernah bergerak: saldo awal dengan harga beli
+        buku = BukuPersediaan()
+        sekarang = timezone.now()
+        for varian_id, stok in VarianProduk.objects.values_list('id', 'stok').iterator(chunk_size=chunk_size):
+            if varian_id not in diputar:
+                buku.buka_saldo_awal(varian_id, stok, harga_beli[varian_id], sekarang)
+        buku.simpan()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} riwayat dihitung ulang, nilai persediaan {len(diputar) + len(buku.posisi)} varian disimpan."
+        ))
+
+    def _simpan_riwayat(self, batch, total):
+        if not batch:
+            return total
+        StockHistory.objects.bulk_update(batch, ['biaya_satuan', 'nilai_setelah', 'nilai_fifo_setelah'], batch_size=1000)
+        if (total + len(batch)) // self.chunk_size > total // self.chunk_size:
+            self.stdout.write(f"  {total + len(batch)} riwayat diproses...")
+        return total + len(batch)
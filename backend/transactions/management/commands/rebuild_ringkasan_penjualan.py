@@ -0,0 +1,79 @@
+# transactions/management/commands/rebuild_ringkasan_penjualan.py
+
+from datetime import date
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Sum, Count, Value, DecimalField
+from django.db.models.functions import Coalesce, TruncDate
+from transactions.models import Transaksi, DetailTransaksi, RingkasanPenjualanHarian, RingkasanVarianHarian
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Membangun ulang rekap penjualan harian dari tabel Transaksi dan DetailTransaksi."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dari', type=date.fromisoformat, help="Tanggal awal (YYYY-MM-DD), default semua data.")
+        parser.add_argument('--sampai', type=date.fromisoformat, help="Tanggal akhir (YYYY-MM-DD), default semua data.")
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        dari, sampai = options['dari'], options['sampai']
+
+        rentang = Q()
+        if dari:
+            rentang &= Q(tanggal__gte=dari)
+        if sampai:
+            rentang &= Q(tanggal__lte=sampai)
+
+        RingkasanPenjualanHarian.objects.filter(rentang).delete()
+        RingkasanVarianHarian.objects.filter(rentang).delete()
+
+        nol = Value(0, output_field=DecimalField())
+        per_metode = {
+            kolom: Coalesce(Sum('total_setelah_diskon', filter=Q(metode_pembayaran=metode)), nol)
+            for metode, kolom in RingkasanPenjualanHarian.KOLOM_METODE.items()
+        }
+        harian = Transaksi.objects.filter(status='Selesai').annotate(
+            tanggal=TruncDate('created_at')
+        ).filter(rentang).values('tanggal').annotate(
+            pendapatan=Coalesce(Sum('total_setelah_diskon'), nol),
+            jumlah_transaksi=Count('id'),
+            **per_metode
+        ).order_by('tanggal')
+
+        item_per_hari = dict(DetailTransaksi.objects.filter(transaksi__status='Selesai').annotate(
+            tanggal=TruncDate('transaksi__created_at')
+        ).filter(rentang).values('tanggal').annotate(
+            total=Sum('jumlah')
+        ).values_list('tanggal', 'total'))
+
+        rows = [
+            RingkasanPenjualanHarian(item_terjual=item_per_hari.get(row['tanggal'], 0), **row)
+            for row in harian
+        ]
+        RingkasanPenjualanHarian.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+        per_varian = DetailTransaksi.objects.filter(transaksi__status='Selesai').annotate(
+            tanggal=TruncDate('transaksi__created_at')
+        ).filter(rentang).values('tanggal', 'varian_produk_terjual_id').annotate(
+            jumlah_terjual=Sum('jumlah'), total_pendapatan=Sum('subtotal')
+        ).order_by('tanggal')
+
+        batch, jumlah_varian = [], 0
+        for row in per_varian.iterator(chunk_size=BATCH_SIZE):
+            batch.append(RingkasanVarianHarian(
+                tanggal=row['tanggal'], varian_id=row['varian_produk_terjual_id'],
+                jumlah_terjual=row['jumlah_terjual'], pendapatan=row['total_pendapatan']
+            ))
+            if len(batch) >= BATCH_SIZE:
+                RingkasanVarianHarian.objects.bulk_create(batch)
+                jumlah_varian += len(batch)
+                batch = []
+        RingkasanVarianHarian.objects.bulk_create(batch)
+        jumlah_varian += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(rows)} rekap harian dan {jumlah_varian} rekap varian dibangun ulang."
+        ))
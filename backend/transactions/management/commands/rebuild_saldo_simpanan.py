@@ -0,0 +1,45 @@
+# transactions/management/commands/rebuild_saldo_simpanan.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q, Sum, Value, DecimalField
+from django.db.models.functions import Coalesce
+from transactions.models import Pelanggan, RiwayatSimpanan
+
+
+class Command(BaseCommand):
+    help = "Menghitung ulang saldo simpanan pelanggan dari riwayat simpanan dan memperbaiki yang selisih."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Hanya verifikasi; keluar dengan error jika ada saldo yang selisih."
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        nol = Value(0, output_field=DecimalField())
+        ledger = {
+            row['pelanggan_id']: row['masuk'] - row['keluar']
+            for row in RiwayatSimpanan.objects.values('pelanggan_id').annotate(
+                masuk=Coalesce(Sum('jumlah', filter=Q(tipe=RiwayatSimpanan.Tipe.MASUK)), nol),
+                keluar=Coalesce(Sum('jumlah', filter=Q(tipe=RiwayatSimpanan.Tipe.KELUAR)), nol),
+            )
+        }
+
+        selisih = []
+        for pelanggan in Pelanggan.objects.select_for_update().only('id', 'nama_pelanggan', 'saldo'):
+            saldo_ledger = ledger.get(pelanggan.id, 0)
+            if pelanggan.saldo != saldo_ledger:
+                self.stdout.write(f"{pelanggan.nama_pelanggan}: tersimpan {pelanggan.saldo}, riwayat {saldo_ledger}")
+                pelanggan.saldo = saldo_ledger
+                selisih.append(pelanggan)
+
+        if options['check']:
+            if selisih:
+                raise CommandError(f"{len(selisih)} saldo pelanggan tidak sesuai dengan riwayat.")
+            self.stdout.write(self.style.SUCCESS("Semua saldo sesuai dengan riwayat."))
+            return
+
+        Pelanggan.objects.bulk_update(selisih, ['saldo'], batch_size=500)
+        self.stdout.write(self.style.SUCCESS(f"{len(selisih)} saldo pelanggan diperbaiki."))
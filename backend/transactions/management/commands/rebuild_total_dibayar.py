@@ -0,0 +1,41 @@
+# transactions/management/commands/rebuild_total_dibayar.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from transactions.models import HutangPiutang, Pembayaran
+
+
+class Command(BaseCommand):
+    help = "Mencocokkan total_dibayar dan status lunas hutang/piutang dengan tabel pembayaran dan memperbaiki yang selisih."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Hanya verifikasi; keluar dengan error jika ada data yang selisih."
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        pembayaran = dict(
+            Pembayaran.objects.values('hutang_piutang_id').annotate(total=Sum('jumlah_bayar')).values_list('hutang_piutang_id', 'total')
+        )
+
+        selisih = []
+        for item in HutangPiutang.objects.select_for_update().only('id', 'total_awal', 'total_dibayar', 'lunas'):
+            total_dibayar = pembayaran.get(item.id, 0)
+            lunas = item.total_awal - total_dibayar <= 0
+            if item.total_dibayar != total_dibayar or item.lunas != lunas:
+                self.stdout.write(f"#{item.id}: tersimpan {item.total_dibayar} (lunas={item.lunas}), pembayaran {total_dibayar} (lunas={lunas})")
+                item.total_dibayar = total_dibayar
+                item.lunas = lunas
+                selisih.append(item)
+
+        if options['check']:
+            if selisih:
+                raise CommandError(f"{len(selisih)} hutang/piutang tidak sesuai dengan pembayaran.")
+            self.stdout.write(self.style.SUCCESS("Semua hutang/piutang sesuai dengan pembayaran."))
+            return
+
+        HutangPiutang.objects.bulk_update(selisih, ['total_dibayar', 'lunas'], batch_size=500)
+        self.stdout.write(self.style.SUCCESS(f"{len(selisih)} hutang/piutang diperbaiki."))
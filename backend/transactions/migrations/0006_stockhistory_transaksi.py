@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0005_transaksi_notes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockhistory',
+            name='transaksi',
+            field=models.ForeignKey(blank=True, help_text='Transaksi penjualan yang menyebabkan pergerakan ini', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_history', to='transactions.transaksi'),
+        ),
+    ]
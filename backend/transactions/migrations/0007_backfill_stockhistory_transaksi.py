@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:25
+
+from datetime import timedelta
+from django.db import migrations
+
+PREFIX_NOTES = 'Transaksi No: '
+BATCH_SIZE = 1000
+# Riwayat penjualan dibuat di request yang sama dengan transaksinya (atau saat
+# transaksi ditahan dilanjutkan). Baris yang jauh lebih tua dari transaksinya
+# adalah korban backfill notes lama yang salah, jadi tidak ditautkan.
+TOLERANSI = timedelta(minutes=1)
+
+
+def tautkan_riwayat(apps, schema_editor):
+    StockHistory = apps.get_model('transactions', 'StockHistory')
+    Transaksi = apps.get_model('transactions', 'Transaksi')
+    DetailTransaksi = apps.get_model('transactions', 'DetailTransaksi')
+
+    kandidat = StockHistory.objects.filter(
+        reason='PENJUALAN', transaksi__isnull=True, notes__startswith=PREFIX_NOTES
+    ).order_by('id')
+
+    last_id = 0
+    while True:
+        batch = list(kandidat.filter(id__gt=last_id).values('id', 'product_id', 'notes', 'created_at')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1]['id']
+
+        nomor_list = {row['notes'][len(PREFIX_NOTES):].strip() for row in batch}
+        transaksi_map = {
+            t['nomor_transaksi']: t
+            for t in Transaksi.objects.filter(nomor_transaksi__in=nomor_list).values('id', 'nomor_transaksi', 'created_at')
+        }
+        produk_per_transaksi = set(DetailTransaksi.objects.filter(
+            transaksi_id__in=[t['id'] for t in transaksi_map.values()]
+        ).values_list('transaksi_id', 'varian_produk_terjual_id'))
+
+        ids_per_transaksi = {}
+        for row in batch:
+            trx = transaksi_map.get(row['notes'][len(PREFIX_NOTES):].strip())
+            if trx is None or (trx['id'], row['product_id']) not in produk_per_transaksi:
+                continue
+            if row['created_at'] < trx['created_at'] - TOLERANSI:
+                continue
+            ids_per_transaksi.setdefault(trx['id'], []).append(row['id'])
+
+        for transaksi_id, ids in ids_per_transaksi.items():
+            StockHistory.objects.filter(id__in=ids).update(transaksi_id=transaksi_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_stockhistory_transaksi'),
+    ]
+
+    operations = [
+        migrations.RunPython(tautkan_riwayat, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:22
+
+from django.db import migrations, models
+from django.db.models import Q, Sum, Value, DecimalField
+from django.db.models.functions import Coalesce
+
+
+def isi_saldo(apps, schema_editor):
+    Pelanggan = apps.get_model('transactions', 'Pelanggan')
+    RiwayatSimpanan = apps.get_model('transactions', 'RiwayatSimpanan')
+    nol = Value(0, output_field=DecimalField())
+    ledger = RiwayatSimpanan.objects.values('pelanggan_id').annotate(
+        masuk=Coalesce(Sum('jumlah', filter=Q(tipe='MASUK')), nol),
+        keluar=Coalesce(Sum('jumlah', filter=Q(tipe='KELUAR')), nol),
+    )
+    for row in ledger.iterator():
+        Pelanggan.objects.filter(id=row['pelanggan_id']).update(saldo=row['masuk'] - row['keluar'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0007_backfill_stockhistory_transaksi'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pelanggan',
+            name='saldo',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Saldo tersimpan, diperbarui setiap ada riwayat simpanan baru', max_digits=12),
+        ),
+        migrations.RunPython(isi_saldo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:23
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def isi_total_dibayar(apps, schema_editor):
+    HutangPiutang = apps.get_model('transactions', 'HutangPiutang')
+    Pembayaran = apps.get_model('transactions', 'Pembayaran')
+    totals = Pembayaran.objects.values('hutang_piutang_id').annotate(total=Sum('jumlah_bayar'))
+    for row in totals.iterator():
+        HutangPiutang.objects.filter(id=row['hutang_piutang_id']).update(total_dibayar=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0008_pelanggan_saldo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hutangpiutang',
+            name='total_dibayar',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Jumlah semua pembayaran, diperbarui setiap ada pembayaran', max_digits=12),
+        ),
+        migrations.RunPython(isi_total_dibayar, migrations.RunPython.noop),
+    ]
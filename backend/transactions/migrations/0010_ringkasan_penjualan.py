@@ -0,0 +1,89 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q, Sum, Count, Value, DecimalField
+from django.db.models.functions import Coalesce, TruncDate
+
+KOLOM_METODE = {'Tunai': 'pendapatan_tunai', 'QRIS': 'pendapatan_qris', 'Debit': 'pendapatan_debit'}
+
+
+def isi_ringkasan(apps, schema_editor):
+    Transaksi = apps.get_model('transactions', 'Transaksi')
+    DetailTransaksi = apps.get_model('transactions', 'DetailTransaksi')
+    RingkasanPenjualanHarian = apps.get_model('transactions', 'RingkasanPenjualanHarian')
+    RingkasanVarianHarian = apps.get_model('transactions', 'RingkasanVarianHarian')
+
+    nol = Value(0, output_field=DecimalField())
+    item_per_hari = dict(DetailTransaksi.objects.filter(transaksi__status='Selesai').annotate(
+        tanggal=TruncDate('transaksi__created_at')
+    ).values('tanggal').annotate(total=Sum('jumlah')).values_list('tanggal', 'total'))
+    harian = Transaksi.objects.filter(status='Selesai').annotate(
+        tanggal=TruncDate('created_at')
+    ).values('tanggal').annotate(
+        pendapatan=Coalesce(Sum('total_setelah_diskon'), nol),
+        jumlah_transaksi=Count('id'),
+        **{
+            kolom: Coalesce(Sum('total_setelah_diskon', filter=Q(metode_pembayaran=metode)), nol)
+            for metode, kolom in KOLOM_METODE.items()
+        }
+    ).order_by('tanggal')
+    RingkasanPenjualanHarian.objects.bulk_create([
+        RingkasanPenjualanHarian(item_terjual=item_per_hari.get(row['tanggal'], 0), **row)
+        for row in harian
+    ], batch_size=1000)
+
+    per_varian = DetailTransaksi.objects.filter(transaksi__status='Selesai').annotate(
+        tanggal=TruncDate('transaksi__created_at')
+    ).values('tanggal', 'varian_produk_terjual_id').annotate(
+        jumlah_terjual=Sum('jumlah'), total_pendapatan=Sum('subtotal')
+    ).order_by('tanggal')
+    RingkasanVarianHarian.objects.bulk_create((
+        RingkasanVarianHarian(
+            tanggal=row['tanggal'], varian_id=row['varian_produk_terjual_id'],
+            jumlah_terjual=row['jumlah_terjual'], pendapatan=row['total_pendapatan']
+        )
+        for row in per_varian.iterator(chunk_size=1000)
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_alter_varianproduk_options_and_more'),
+        ('transactions', '0009_hutangpiutang_total_dibayar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RingkasanPenjualanHarian',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tanggal', models.DateField(unique=True)),
+                ('pendapatan', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('jumlah_transaksi', models.PositiveIntegerField(default=0)),
+                ('item_terjual', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('pendapatan_tunai', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pendapatan_qris', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pendapatan_debit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name_plural': 'Ringkasan Penjualan Harian',
+            },
+        ),
+        migrations.CreateModel(
+            name='RingkasanVarianHarian',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tanggal', models.DateField()),
+                ('jumlah_terjual', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('pendapatan', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('varian', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ringkasan_harian', to='products.varianproduk')),
+            ],
+            options={
+                'verbose_name_plural': 'Ringkasan Varian Harian',
+                'unique_together': {('tanggal', 'varian')},
+            },
+        ),
+        migrations.RunPython(isi_ringkasan, migrations.RunPython.noop),
+    ]
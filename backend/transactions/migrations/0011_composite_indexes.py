@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_alter_varianproduk_options_and_more'),
+        ('transactions', '0010_ringkasan_penjualan'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pembayaran',
+            index=models.Index(fields=['hutang_piutang', 'tanggal_bayar'], name='transaction_hutang__48af14_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockhistory',
+            index=models.Index(fields=['product', 'created_at'], name='transaction_product_d330f6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockhistory',
+            index=models.Index(fields=['reason', 'created_at'], name='transaction_reason_d8ecf9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaksi',
+            index=models.Index(fields=['status', 'created_at'], name='transaction_status_72d764_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaksi',
+            index=models.Index(fields=['kasir', 'created_at'], name='transaction_kasir_i_65f515_idx'),
+        ),
+    ]
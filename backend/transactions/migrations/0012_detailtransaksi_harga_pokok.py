@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0011_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detailtransaksi',
+            name='harga_pokok',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_barcodemetadata'),
+        ('transactions', '0012_detailtransaksi_harga_pokok'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NilaiPersediaan',
+            fields=[
+                ('varian', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='nilai_persediaan', serialize=False, to='products.varianproduk')),
+                ('nilai_rata_rata', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('nilai_fifo', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'verbose_name_plural': 'Nilai Persediaan',
+            },
+        ),
+        migrations.AddField(
+            model_name='stockhistory',
+            name='biaya_satuan',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Biaya per unit pergerakan ini (harga beli untuk barang masuk, rata-rata untuk barang keluar)', max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='stockhistory',
+            name='nilai_fifo_setelah',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Nilai persediaan metode FIFO setelah perubahan', max_digits=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='stockhistory',
+            name='nilai_setelah',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Nilai persediaan metode rata-rata bergerak setelah perubahan', max_digits=16, null=True),
+        ),
+        migrations.CreateModel(
+            name='LapisanBiaya',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tanggal', models.DateTimeField()),
+                ('jumlah_awal', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('sisa', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('harga_satuan', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('varian', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lapisan_biaya', to='products.varianproduk')),
+            ],
+            options={
+                'verbose_name_plural': 'Lapisan Biaya',
+                'indexes': [models.Index(fields=['varian', 'tanggal'], name='transaction_varian__29babf_idx')],
+            },
+        ),
+    ]
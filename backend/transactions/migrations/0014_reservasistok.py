@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_barcodemetadata'),
+        ('transactions', '0013_lapisan_biaya'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservasiStok',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jumlah', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('kedaluwarsa', models.DateTimeField()),
+                ('transaksi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservasi_stok', to='transactions.transaksi')),
+                ('varian', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservasi_stok', to='products.varianproduk')),
+            ],
+            options={
+                'verbose_name_plural': 'Reservasi Stok',
+                'indexes': [models.Index(fields=['varian', 'kedaluwarsa'], name='transaction_varian__2ef05b_idx'), models.Index(fields=['kedaluwarsa'], name='transaction_kedaluw_0dab98_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_barcodemetadata'),
+        ('transactions', '0014_reservasistok'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SesiOpname',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('DIBUKA', 'Dibuka'), ('SELESAI', 'Selesai'), ('DIBATALKAN', 'Dibatalkan')], default='DIBUKA', max_length=20)),
+                ('catatan', models.CharField(blank=True, max_length=255, null=True)),
+                ('dibuka_pada', models.DateTimeField(auto_now_add=True)),
+                ('selesai_pada', models.DateTimeField(blank=True, null=True)),
+                ('dibuat_oleh', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sesi_opname', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Sesi Opname',
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemOpname',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stok_awal', models.DecimalField(decimal_places=3, help_text='Stok sistem saat sesi dibuka', max_digits=10)),
+                ('stok_saat_hitung', models.DecimalField(blank=True, decimal_places=3, max_digits=10, null=True)),
+                ('jumlah_fisik', models.DecimalField(blank=True, decimal_places=3, max_digits=10, null=True)),
+                ('dihitung_pada', models.DateTimeField(blank=True, null=True)),
+                ('varian', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_opname', to='products.varianproduk')),
+                ('sesi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='transactions.sesiopname')),
+            ],
+            options={
+                'verbose_name_plural': 'Item Opname',
+                'unique_together': {('sesi', 'varian')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0015_sesi_opname'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockhistory',
+            name='reason',
+            field=models.CharField(choices=[('PEMBELIAN', 'Pembelian dari Supplier'), ('AWAL', 'Stok Awal'), ('RETUR', 'Retur Pelanggan'), ('RUSAK', 'Barang Rusak/Kadaluwarsa'), ('HILANG', 'Barang Hilang'), ('INTERNAL', 'Keperluan Toko'), ('OPNAME', 'Penyesuaian Opname'), ('PENJUALAN', 'Penjualan Kasir'), ('OTHER', 'Lainnya')], default='PEMBELIAN', max_length=20),
+        ),
+    ]
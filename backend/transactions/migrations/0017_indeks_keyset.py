@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_barcodemetadata'),
+        ('transactions', '0016_alasan_lainnya'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockhistory',
+            index=models.Index(fields=['created_at', 'id'], name='transaction_created_d5fcd9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaksi',
+            index=models.Index(fields=['created_at', 'id'], name='transaction_created_c94fb1_idx'),
+        ),
+    ]
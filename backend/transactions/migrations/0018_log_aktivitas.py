@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0017_indeks_keyset'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogAktivitas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipe', models.CharField(choices=[('TRANSAKSI', 'Penjualan'), ('STOK', 'Pergerakan Stok'), ('PEMBAYARAN', 'Pembayaran Hutang/Piutang'), ('SIMPANAN', 'Simpanan')], max_length=20)),
+                ('sub_tipe', models.CharField(blank=True, default='', max_length=20)),
+                ('judul', models.CharField(max_length=255)),
+                ('keterangan', models.CharField(blank=True, default='', max_length=255)),
+                ('username', models.CharField(blank=True, default='', max_length=150)),
+                ('objek_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Log Aktivitas',
+                'indexes': [models.Index(fields=['created_at', 'id'], name='transaction_created_4d52e5_idx'), models.Index(fields=['tipe', 'created_at', 'id'], name='transaction_tipe_ce2892_idx')],
+            },
+        ),
+    ]
@@ -2,7 +2,7 @@ import uuid
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import BooleanField, Case, Value, When
 
 class StoreInfo(models.Model):
     nama_toko = models.CharField(max_length=100, default='Toko Bu Ning')
@@ -37,6 +37,11 @@ class Transaksi(models.Model):
 
     class Meta:
         verbose_name_plural = "Transaksi"
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['kasir', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
+        ]
         
     def __str__(self):
         return self.nomor_transaksi
@@ -50,6 +55,8 @@ class DetailTransaksi(models.Model):
     jumlah = models.DecimalField(max_digits=10, decimal_places=3)
     harga_saat_transaksi = models.DecimalField(max_digits=12, decimal_places=2)
     subtotal = models.DecimalField(max_digits=12, decimal_places=2)
+    # Harga pokok per unit saat barang terjual (null = data lama yang belum di-backfill)
+    harga_pokok = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
 
     class Meta:
         verbose_name_plural = "Detail Transaksi"
@@ -73,22 +80,33 @@ class HutangPiutang(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     tanggal_jatuh_tempo = models.DateField(null=True, blank=True)
     dicatat_oleh = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
-
-    @property
-    def total_dibayar(self):
-        return self.pembayaran_set.aggregate(total=Sum('jumlah_bayar'))['total'] or 0
+    total_dibayar = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, help_text="Jumlah semua pembayaran, diperbarui setiap ada pembayaran")
 
     @property
     def sisa_tagihan(self):
         return self.total_awal - self.total_dibayar
 
     def save(self, *args, **kwargs):
-        if self.pk is not None: # Hanya cek jika objek sudah ada di DB
-            if self.sisa_tagihan <= 0:
-                self.lunas = True
-            else:
-                self.lunas = False
+        if self.pk is None:
+            return super().save(*args, **kwargs)
+        # total_dibayar hanya diubah lewat update atomik saat ada pembayaran,
+        # jadi jangan ditimpa dengan nilai lama dari instance ini
+        if kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'total_dibayar'
+            ]
+        if 'lunas' not in kwargs['update_fields']:
+            return super().save(*args, **kwargs)
+        # Status lunas dihitung di UPDATE yang sama dari total_dibayar di database,
+        # bukan dari nilai instance yang bisa basi karena pembayaran lain
+        self.lunas = Case(
+            When(total_dibayar__gte=self.total_awal, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        )
         super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['total_dibayar', 'lunas'])
 
 class Pembayaran(models.Model):
     """
@@ -100,6 +118,11 @@ class Pembayaran(models.Model):
     dicatat_oleh = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     catatan = models.CharField(max_length=255, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['hutang_piutang', 'tanggal_bayar']),
+        ]
+
 class StockHistory(models.Model):
     """
     Model untuk mencatat setiap pergerakan stok (masuk, keluar, penjualan, opname).
@@ -113,6 +136,7 @@ class StockHistory(models.Model):
         INTERNAL = 'INTERNAL', 'Keperluan Toko'
         OPNAME = 'OPNAME', 'Penyesuaian Opname'
         PENJUALAN = 'PENJUALAN', 'Penjualan Kasir'
+        LAINNYA = 'OTHER', 'Lainnya'
 
     product = models.ForeignKey('products.VarianProduk', on_delete=models.CASCADE, related_name="stock_history")
     quantity_change = models.DecimalField(max_digits=10, decimal_places=3, help_text="Positif untuk stok masuk, negatif untuk stok keluar")
@@ -120,7 +144,103 @@ class StockHistory(models.Model):
     reason = models.CharField(max_length=20, choices=Reason.choices, default=Reason.PEMBELIAN)
     notes = models.TextField(blank=True, null=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    transaksi = models.ForeignKey(Transaksi, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_history', help_text="Transaksi penjualan yang menyebabkan pergerakan ini")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Snapshot valuasi (lihat transactions/persediaan.py); null = belum dihitung ulang
+    biaya_satuan = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True, help_text="Biaya per unit pergerakan ini (harga beli untuk barang masuk, rata-rata untuk barang keluar)")
+    nilai_setelah = models.DecimalField(max_digits=16, decimal_places=2, null=True, blank=True, help_text="Nilai persediaan metode rata-rata bergerak setelah perubahan")
+    nilai_fifo_setelah = models.DecimalField(max_digits=16, decimal_places=2, null=True, blank=True, help_text="Nilai persediaan metode FIFO setelah perubahan")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at']),
+            models.Index(fields=['reason', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
+        ]
+
+class LapisanBiaya(models.Model):
+    """
+    Lapisan biaya persediaan untuk valuasi FIFO: satu baris per barang masuk,
+    `sisa` berkurang saat barang keluar (penjualan, rusak, opname, dll).
+    """
+    varian = models.ForeignKey('products.VarianProduk', on_delete=models.CASCADE, related_name='lapisan_biaya')
+    tanggal = models.DateTimeField()
+    jumlah_awal = models.DecimalField(max_digits=10, decimal_places=3)
+    sisa = models.DecimalField(max_digits=10, decimal_places=3)
+    harga_satuan = models.DecimalField(max_digits=14, decimal_places=4)
+
+    class Meta:
+        verbose_name_plural = "Lapisan Biaya"
+        indexes = [
+            models.Index(fields=['varian', 'tanggal']),
+        ]
+
+class NilaiPersediaan(models.Model):
+    """Nilai persediaan terkini per varian untuk kedua metode valuasi."""
+    varian = models.OneToOneField('products.VarianProduk', on_delete=models.CASCADE, primary_key=True, related_name='nilai_persediaan')
+    nilai_rata_rata = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    nilai_fifo = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = "Nilai Persediaan"
+
+class ReservasiStok(models.Model):
+    """
+    Reservasi stok lunak untuk keranjang yang ditahan. Stok fisik tidak
+    berubah; checkout lain hanya boleh memakai stok dikurangi reservasi yang
+    belum kedaluwarsa. Dihapus saat transaksi dilanjutkan atau oleh
+    `lepas_reservasi_kedaluwarsa`.
+    """
+    transaksi = models.ForeignKey(Transaksi, on_delete=models.CASCADE, related_name='reservasi_stok')
+    varian = models.ForeignKey('products.VarianProduk', on_delete=models.CASCADE, related_name='reservasi_stok')
+    jumlah = models.DecimalField(max_digits=10, decimal_places=3)
+    kedaluwarsa = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "Reservasi Stok"
+        indexes = [
+            models.Index(fields=['varian', 'kedaluwarsa']),
+            models.Index(fields=['kedaluwarsa']),
+        ]
+
+class SesiOpname(models.Model):
+    """
+    Sesi stok opname bertahap: stok disnapshot saat sesi dibuka, hasil hitung
+    diunggah per chunk ke ItemOpname, lalu selisihnya diterapkan sekaligus.
+    """
+    class Status(models.TextChoices):
+        DIBUKA = 'DIBUKA', 'Dibuka'
+        SELESAI = 'SELESAI', 'Selesai'
+        DIBATALKAN = 'DIBATALKAN', 'Dibatalkan'
+
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.DIBUKA)
+    catatan = models.CharField(max_length=255, blank=True, null=True)
+    dibuat_oleh = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='sesi_opname')
+    dibuka_pada = models.DateTimeField(auto_now_add=True)
+    selesai_pada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Sesi Opname"
+
+    def __str__(self):
+        return f"Opname #{self.id} ({self.status})"
+
+class ItemOpname(models.Model):
+    """
+    Satu varian di sesi opname. Selisih dihitung terhadap `stok_saat_hitung`
+    (stok sistem saat hitungan diunggah), jadi penjualan sebelum maupun
+    sesudah barang dihitung tetap benar saat sesi dikomit.
+    """
+    sesi = models.ForeignKey(SesiOpname, on_delete=models.CASCADE, related_name='items')
+    varian = models.ForeignKey('products.VarianProduk', on_delete=models.CASCADE, related_name='item_opname')
+    stok_awal = models.DecimalField(max_digits=10, decimal_places=3, help_text="Stok sistem saat sesi dibuka")
+    stok_saat_hitung = models.DecimalField(max_digits=10, decimal_places=3, null=True, blank=True)
+    jumlah_fisik = models.DecimalField(max_digits=10, decimal_places=3, null=True, blank=True)
+    dihitung_pada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Item Opname"
+        unique_together = ('sesi', 'varian')
 
 class Expense(models.Model):
     keterangan = models.CharField(max_length=255)
@@ -138,13 +258,12 @@ class Pelanggan(models.Model):
     nama_pelanggan = models.CharField(max_length=200, unique=True)
     nomor_telepon = models.CharField(max_length=20, blank=True, null=True)
     alamat = models.TextField(blank=True, null=True)
-    
+    saldo = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, help_text="Saldo tersimpan, diperbarui setiap ada riwayat simpanan baru")
+
     @property
     def saldo_simpanan(self):
-        """Menghitung saldo simpanan saat ini secara dinamis."""
-        total_masuk = self.riwayat_simpanan.filter(tipe='MASUK').aggregate(total=Sum('jumlah'))['total'] or 0
-        total_keluar = self.riwayat_simpanan.filter(tipe='KELUAR').aggregate(total=Sum('jumlah'))['total'] or 0
-        return total_masuk - total_keluar
+        """Saldo simpanan saat ini (kolom tersimpan, tanpa query tambahan)."""
+        return self.saldo
 
     def __str__(self):
         return self.nama_pelanggan
@@ -167,3 +286,79 @@ class RiwayatSimpanan(models.Model):
 
     def __str__(self):
         return f"{self.tipe} - {self.pelanggan.nama_pelanggan} - {self.jumlah}"
+
+class RingkasanPenjualanHarian(models.Model):
+    """
+    Rekap penjualan per hari (hanya transaksi 'Selesai'), diperbarui setiap kali
+    transaksi selesai dan bisa dibangun ulang dengan `rebuild_ringkasan_penjualan`.
+    """
+    tanggal = models.DateField(unique=True)
+    pendapatan = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    jumlah_transaksi = models.PositiveIntegerField(default=0)
+    item_terjual = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    pendapatan_tunai = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pendapatan_qris = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pendapatan_debit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    # Nama kolom pendapatan untuk setiap metode pembayaran
+    KOLOM_METODE = {
+        'Tunai': 'pendapatan_tunai',
+        'QRIS': 'pendapatan_qris',
+        'Debit': 'pendapatan_debit',
+    }
+
+    class Meta:
+        verbose_name_plural = "Ringkasan Penjualan Harian"
+
+    def __str__(self):
+        return f"{self.tanggal}: {self.pendapatan}"
+
+class RingkasanVarianHarian(models.Model):
+    """
+    Rekap jumlah terjual per varian per hari, dipakai untuk produk terlaris.
+    """
+    tanggal = models.DateField()
+    varian = models.ForeignKey('products.VarianProduk', on_delete=models.CASCADE, related_name='ringkasan_harian')
+    jumlah_terjual = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    pendapatan = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('tanggal', 'varian')
+        verbose_name_plural = "Ringkasan Varian Harian"
+
+    def __str__(self):
+        return f"{self.tanggal}: {self.varian_id} x {self.jumlah_terjual}"
+
+class LogAktivitas(models.Model):
+    """
+    Log aktivitas toko (penjualan, pergerakan stok, pembayaran hutang/piutang,
+    simpanan), hanya ditambah di titik setiap operasi terjadi. Teks dan nama
+    user disimpan saat ditulis, jadi satu halaman feed cukup satu query
+    berindex tanpa join. Bisa dibangun ulang dengan `rebuild_log_aktivitas`.
+    """
+    class Tipe(models.TextChoices):
+        TRANSAKSI = 'TRANSAKSI', 'Penjualan'
+        STOK = 'STOK', 'Pergerakan Stok'
+        PEMBAYARAN = 'PEMBAYARAN', 'Pembayaran Hutang/Piutang'
+        SIMPANAN = 'SIMPANAN', 'Simpanan'
+
+    tipe = models.CharField(max_length=20, choices=Tipe.choices)
+    # Rincian tipe: alasan StockHistory, tipe HutangPiutang atau tipe RiwayatSimpanan
+    sub_tipe = models.CharField(max_length=20, blank=True, default='')
+    judul = models.CharField(max_length=255)
+    keterangan = models.CharField(max_length=255, blank=True, default='')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    username = models.CharField(max_length=150, blank=True, default='')
+    # id baris sumber (transaksi, riwayat stok, pembayaran, riwayat simpanan)
+    objek_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = "Log Aktivitas"
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['tipe', 'created_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.tipe}: {self.judul}"
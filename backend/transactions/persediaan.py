@@ -0,0 +1,186 @@
+# transactions/persediaan.py
+
+from collections import deque
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.utils import timezone
+from products.models import VarianProduk
+from .models import LapisanBiaya, NilaiPersediaan, StockHistory
+
+NOL = Decimal('0')
+PRESISI_NILAI = Decimal('0.01')
+PRESISI_BIAYA = Decimal('0.0001')
+
+
+def _nilai(angka):
+    return angka.quantize(PRESISI_NILAI, ROUND_HALF_UP)
+
+
+def _biaya(angka):
+    return angka.quantize(PRESISI_BIAYA, ROUND_HALF_UP)
+
+
+class _Lapisan:
+    __slots__ = ('harga', 'sisa', 'obj')
+
+    def __init__(self, harga, sisa, obj):
+        self.harga = harga
+        self.sisa = sisa
+        self.obj = obj
+
+
+class _Posisi:
+    """Posisi satu varian: nilai rata-rata bergerak dan antrean lapisan FIFO."""
+    __slots__ = ('nilai_rata_rata', 'nilai_fifo', 'lapisan')
+
+    def __init__(self, nilai_rata_rata=NOL, nilai_fifo=NOL, lapisan=None):
+        self.nilai_rata_rata = nilai_rata_rata
+        self.nilai_fifo = nilai_fifo
+        self.lapisan = lapisan if lapisan is not None else deque()
+
+
+class BukuPersediaan:
+    """
+    Mesin valuasi persediaan yang dipakai bersama oleh pencatatan per mutasi
+    (`catat_valuasi`) dan rebuild kronologis (`rebuild_nilai_persediaan`).
+    Barang masuk menambah lapisan baru; barang keluar dinilai dengan biaya
+    rata-rata bergerak dan mengonsumsi lapisan tertua untuk nilai FIFO.
+    """
+
+    def __init__(self):
+        self.posisi = {}
+        self.lapisan_baru = []
+        self.lapisan_berubah = {}
+
+    def buka_saldo_awal(self, varian_id, stok_sebelum, harga_beli, tanggal):
+        """Saldo awal untuk varian yang belum punya posisi: stok yang ada dinilai dengan harga beli."""
+        posisi = _Posisi()
+        if stok_sebelum > 0:
+            posisi.nilai_rata_rata = posisi.nilai_fifo = stok_sebelum * harga_beli
+            self._tambah_lapisan(varian_id, posisi, stok_sebelum, harga_beli, tanggal)
+        self.posisi[varian_id] = posisi
+        return posisi
+
+    def _tambah_lapisan(self, varian_id, posisi, jumlah, harga, tanggal):
+        lapisan = _Lapisan(harga, jumlah, LapisanBiaya(
+            varian_id=varian_id, tanggal=tanggal, jumlah_awal=jumlah, sisa=jumlah, harga_satuan=harga
+        ))
+        posisi.lapisan.append(lapisan)
+        self.lapisan_baru.append(lapisan)
+
+    def catat(self, varian_id, quantity_change, stock_after, harga_beli, tanggal, harga_masuk=None):
+        """
+        Menerapkan satu pergerakan stok. Mengembalikan
+        (biaya_satuan, nilai_setelah, nilai_fifo_setelah).
+        """
+        stok_sebelum = stock_after - quantity_change
+        posisi = self.posisi.get(varian_id) or self.buka_saldo_awal(varian_id, stok_sebelum, harga_beli, tanggal)
+        rata_rata = posisi.nilai_rata_rata / stok_sebelum if stok_sebelum > 0 and posisi.nilai_rata_rata > 0 else harga_beli
+
+        if quantity_change > 0:
+            biaya = _biaya(harga_masuk if harga_masuk is not None else rata_rata)
+            posisi.nilai_rata_rata += quantity_change * biaya
+            posisi.nilai_fifo += quantity_change * biaya
+            self._tambah_lapisan(varian_id, posisi, quantity_change, biaya, tanggal)
+        else:
+            biaya = _biaya(rata_rata)
+            posisi.nilai_rata_rata = max(posisi.nilai_rata_rata + quantity_change * biaya, NOL) if stock_after > 0 else NOL
+            butuh = -quantity_change
+            while butuh > 0 and posisi.lapisan:
+                lapisan = posisi.lapisan[0]
+                ambil = min(lapisan.sisa, butuh)
+                lapisan.sisa -= ambil
+                posisi.nilai_fifo -= ambil * lapisan.harga
+                butuh -= ambil
+                self.lapisan_berubah[id(lapisan)] = lapisan
+                if lapisan.sisa <= 0:
+                    posisi.lapisan.popleft()
+            if not posisi.lapisan:
+                posisi.nilai_fifo = NOL
+
+        return biaya, _nilai(posisi.nilai_rata_rata), _nilai(posisi.nilai_fifo)
+
+    def simpan(self):
+        """Menulis lapisan baru, sisa lapisan yang berubah, dan nilai terkini per varian."""
+        baru = {id(lapisan) for lapisan in self.lapisan_baru}
+        for lapisan in self.lapisan_baru:
+            lapisan.obj.sisa = lapisan.sisa
+        if self.lapisan_baru:
+            LapisanBiaya.objects.bulk_create([lapisan.obj for lapisan in self.lapisan_baru], batch_size=1000)
+        berubah = []
+        for key, lapisan in self.lapisan_berubah.items():
+            if key not in baru:
+                lapisan.obj.sisa = lapisan.sisa
+                berubah.append(lapisan.obj)
+        if berubah:
+            LapisanBiaya.objects.bulk_update(berubah, ['sisa'], batch_size=1000)
+        if self.posisi:
+            NilaiPersediaan.objects.bulk_create([
+                NilaiPersediaan(varian_id=varian_id, nilai_rata_rata=_nilai(p.nilai_rata_rata), nilai_fifo=_nilai(p.nilai_fifo))
+                for varian_id, p in self.posisi.items()
+            ], update_conflicts=True, unique_fields=['varian'], update_fields=['nilai_rata_rata', 'nilai_fifo'], batch_size=1000)
+        self.lapisan_baru = []
+        self.lapisan_berubah = {}
+
+
+def harga_masuk(reason, harga_eksplisit, harga_beli):
+    """
+    Biaya per unit barang masuk: harga yang diberikan, atau harga beli varian
+    untuk pembelian/stok awal. None berarti dinilai dengan biaya rata-rata
+    saat itu (retur, opname lebih, dll).
+    """
+    if harga_eksplisit is not None:
+        return harga_eksplisit
+    if reason in (StockHistory.Reason.PEMBELIAN, StockHistory.Reason.AWAL):
+        return harga_beli
+    return None
+
+
+def catat_valuasi(histories, harga_list=None):
+    """
+    Dipanggil `mutasi_stok` sebelum riwayat disimpan: mengisi biaya_satuan,
+    nilai_setelah dan nilai_fifo_setelah setiap StockHistory (urut kronologis)
+    dan memperbarui lapisan biaya serta NilaiPersediaan. `harga_list` sejajar
+    dengan `histories` dan berisi harga beli barang masuk jika diketahui.
+    Jumlah query tetap, berapa pun banyaknya riwayat.
+    """
+    if not histories:
+        return
+    harga_list = harga_list or [None] * len(histories)
+    ids = {h.product_id for h in histories}
+    buku = BukuPersediaan()
+
+    harga_beli = {}
+    for varian_id, purchase_price, ada, nilai_rata_rata, nilai_fifo in VarianProduk.objects.filter(id__in=ids).values_list(
+        'id', 'purchase_price', 'nilai_persediaan__varian_id', 'nilai_persediaan__nilai_rata_rata', 'nilai_persediaan__nilai_fifo'
+    ):
+        harga_beli[varian_id] = purchase_price
+        if ada is not None:
+            buku.posisi[varian_id] = _Posisi(nilai_rata_rata, nilai_fifo)
+
+    keluar = {h.product_id for h in histories if h.quantity_change < 0 and h.product_id in buku.posisi}
+    if keluar:
+        for obj in LapisanBiaya.objects.filter(varian_id__in=keluar, sisa__gt=0).order_by('tanggal', 'id'):
+            buku.posisi[obj.varian_id].lapisan.append(_Lapisan(obj.harga_satuan, obj.sisa, obj))
+
+    sekarang = timezone.now()
+    for h, harga in zip(histories, harga_list):
+        h.biaya_satuan, h.nilai_setelah, h.nilai_fifo_setelah = buku.catat(
+            h.product_id, h.quantity_change, h.stock_after, harga_beli[h.product_id], sekarang,
+            harga_masuk(h.reason, harga, harga_beli[h.product_id]),
+        )
+    buku.simpan()
+
+
+def buka_persediaan(*daftar_varian):
+    """
+    Saldo awal varian yang baru dibuat: NilaiPersediaan dan lapisan biaya
+    pembukanya dari stok dan harga beli awal, agar varian yang stoknya belum
+    pernah bergerak tetap ikut dinilai. Impor CSV membuka banyak varian
+    sekaligus karena bulk_create tidak memicu signal post_save.
+    """
+    buku = BukuPersediaan()
+    sekarang = timezone.now()
+    for varian in daftar_varian:
+        buku.buka_saldo_awal(varian.id, Decimal(str(varian.stok)), Decimal(str(varian.purchase_price)), sekarang)
+    buku.simpan()
@@ -1,5 +1,7 @@
+from decimal import Decimal
 from rest_framework import serializers
-from .models import Transaksi, DetailTransaksi, HutangPiutang, Pembayaran, StockHistory, StoreInfo, Expense, Pelanggan, RiwayatSimpanan
+from django.utils.html import format_html
+from .models import Transaksi, DetailTransaksi, HutangPiutang, Pembayaran, StockHistory, StoreInfo, Expense, Pelanggan, RiwayatSimpanan, SesiOpname, LogAktivitas
 from products.models import VarianProduk, Pemasok
 from users.serializers import UserSerializer
 from products.serializers import VarianProdukSerializer
@@ -10,7 +12,7 @@ from products.serializers import VarianProdukSerializer
 class DetailTransaksiCreateSerializer(serializers.Serializer):
     """Menerima data item saat membuat transaksi baru."""
     varian_produk_id = serializers.IntegerField()
-    jumlah = serializers.DecimalField(max_digits=10, decimal_places=3)
+    jumlah = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=Decimal('0.001'))
 
 class TransaksiCreateSerializer(serializers.Serializer):
     """Menerima data utama saat membuat transaksi baru."""
@@ -36,6 +38,18 @@ class TransaksiReadSerializer(serializers.ModelSerializer):
         model = Transaksi
         fields = '__all__'
 
+class DetailTransaksiRingkasSerializer(serializers.ModelSerializer):
+    """Detail item versi ringkas untuk daftar riwayat transaksi."""
+    nama_produk_induk = serializers.CharField(source='varian_produk_terjual.produk_induk.nama_produk', read_only=True)
+    nama_varian = serializers.CharField(source='varian_produk_terjual.nama_varian', read_only=True)
+    class Meta:
+        model = DetailTransaksi
+        fields = ['id', 'varian_produk_terjual', 'nama_produk_induk', 'nama_varian', 'jumlah', 'harga_saat_transaksi', 'subtotal']
+
+class TransaksiRingkasSerializer(TransaksiReadSerializer):
+    """Menampilkan transaksi dengan detail item ringkas (?ringkas=1)."""
+    detail_items = DetailTransaksiRingkasSerializer(many=True, read_only=True)
+
 # ==============================================================================
 # === SERIALIZER UNTUK HUTANG & PIUTANG ===
 # ==============================================================================
@@ -95,10 +109,80 @@ class StockHistorySerializer(serializers.ModelSerializer):
         model = StockHistory
         fields = '__all__'
 
+class LogAktivitasSerializer(serializers.ModelSerializer):
+    """
+    Satu baris feed aktivitas. `type`, `timestamp`, `user` dan `description`
+    mengikuti format widget aktivitas terbaru; `description` berupa HTML yang
+    sudah di-escape.
+    """
+    type = serializers.SerializerMethodField()
+    timestamp = serializers.DateTimeField(source='created_at', read_only=True)
+    user = serializers.SerializerMethodField()
+    description = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LogAktivitas
+        fields = [
+            'id', 'tipe', 'sub_tipe', 'judul', 'keterangan', 'objek_id',
+            'type', 'timestamp', 'user', 'description',
+        ]
+
+    def get_type(self, obj):
+        # Ikon widget dibedakan per alasan stok; penjualan tetap 'TRANSAKSI'
+        return obj.sub_tipe or obj.tipe
+
+    def get_user(self, obj):
+        return obj.username or 'System'
+
+    def get_description(self, obj):
+        return format_html('<strong>{}</strong> {}', obj.judul, obj.keterangan)
+
 class StockOpnameItemSerializer(serializers.Serializer):
     """Serializer untuk memvalidasi data saat proses stok opname."""
     varian_id = serializers.IntegerField()
-    physical_count = serializers.DecimalField(max_digits=10, decimal_places=3)
+    physical_count = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=Decimal('0'))
+
+class ManageStockItemSerializer(serializers.Serializer):
+    """Satu baris stok masuk/keluar manual."""
+    varian_id = serializers.IntegerField()
+    quantity = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=Decimal('0.001'))
+    purchase_price = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0'), required=False, allow_null=True)
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def to_internal_value(self, data):
+        # Form stok masuk mengirim string kosong untuk harga yang tidak diisi
+        if isinstance(data, dict) and data.get('purchase_price') == '':
+            data = {**data, 'purchase_price': None}
+        return super().to_internal_value(data)
+
+class ManageStockSerializer(serializers.Serializer):
+    """Validasi payload stok masuk/keluar manual (penjualan dan opname punya endpoint sendiri)."""
+    reason = serializers.ChoiceField(choices=[
+        c for c in StockHistory.Reason.choices
+        if c[0] not in (StockHistory.Reason.PENJUALAN, StockHistory.Reason.OPNAME)
+    ])
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    items = ManageStockItemSerializer(many=True, allow_empty=False, max_length=5000)
+
+class SesiOpnameSerializer(serializers.ModelSerializer):
+    """Sesi opname beserta progres hitungnya."""
+    dibuat_oleh_username = serializers.CharField(source='dibuat_oleh.username', read_only=True, default='')
+    jumlah_item = serializers.IntegerField(read_only=True)
+    jumlah_dihitung = serializers.IntegerField(read_only=True)
+    kategori = serializers.IntegerField(write_only=True, required=False, help_text="Batasi snapshot ke satu kategori")
+
+    class Meta:
+        model = SesiOpname
+        fields = [
+            'id', 'status', 'catatan', 'kategori', 'dibuat_oleh', 'dibuat_oleh_username',
+            'dibuka_pada', 'selesai_pada', 'jumlah_item', 'jumlah_dihitung'
+        ]
+        read_only_fields = ['status', 'dibuat_oleh', 'dibuka_pada', 'selesai_pada']
+
+class HitunganOpnameSerializer(serializers.Serializer):
+    """Satu chunk hasil hitung untuk sesi opname."""
+    items = StockOpnameItemSerializer(many=True, allow_empty=False, max_length=5000)
+    tambah = serializers.BooleanField(default=False)
 
 class StoreInfoSerializer(serializers.ModelSerializer):
     """Mengelola informasi toko."""
@@ -114,7 +198,7 @@ class ExpenseSerializer(serializers.ModelSerializer):
 
 class PelangganSerializer(serializers.ModelSerializer):
     """Serializer untuk menampilkan data pelanggan beserta saldonya."""
-    saldo_simpanan = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    saldo_simpanan = serializers.DecimalField(source='saldo', max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = Pelanggan
@@ -0,0 +1,805 @@
+# transactions/services.py
+
+import time
+from collections import deque
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from django.db import connection, transaction, OperationalError
+from products.models import VarianProduk, Produk
+from products.cache_katalog import naikkan_versi
+from products.mesin_harga import JumlahDiLuarTabel, mesin_harga
+from products.stok_rendah import catat_perubahan as catat_perubahan_stok_rendah, sql_stok_rendah
+from .persediaan import catat_valuasi
+from . import aktivitas
+from django.db.models import F, Q, Sum, Case, When, Value, BooleanField, DecimalField
+from django.utils import timezone
+from .models import (
+    Transaksi, DetailTransaksi, StockHistory, Pelanggan, RiwayatSimpanan, HutangPiutang,
+    RingkasanPenjualanHarian, RingkasanVarianHarian, ReservasiStok, SesiOpname, ItemOpname
+)
+
+# Kode SQLSTATE Postgres untuk konflik yang aman untuk diulang
+# (serialization_failure dan deadlock_detected).
+KODE_KONFLIK_SERIALISASI = ('40001', '40P01')
+MAKS_PERCOBAAN = 3
+
+NOL = Decimal('0')
+PRESISI_STOK = Decimal('0.001')
+
+
+class CheckoutError(Exception):
+    """Kesalahan validasi saat checkout (varian tidak ada, stok kurang, dll)."""
+    pass
+
+
+class StokTidakCukupError(CheckoutError):
+    """Dilempar saat UPDATE bersyarat menolak pengurangan stok."""
+    def __init__(self, varian_ids):
+        self.varian_ids = list(varian_ids)
+        super().__init__(f"Stok tidak mencukupi untuk varian ID {', '.join(map(str, self.varian_ids))}.")
+
+
+class SaldoTidakCukupError(Exception):
+    """Dilempar saat penarikan melebihi saldo simpanan pelanggan."""
+    pass
+
+
+class VarianTidakValidError(Exception):
+    """Sebagian varian di payload tidak ada atau tidak aktif; `errors` berisi detail per baris."""
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('Sebagian varian tidak valid.')
+
+
+class OpnameError(Exception):
+    """Operasi pada sesi opname yang sudah selesai atau dibatalkan."""
+    pass
+
+
+def _konflik_serialisasi(error):
+    return getattr(error.__cause__, 'pgcode', None) in KODE_KONFLIK_SERIALISASI
+
+
+def jalankan_dengan_retry(fungsi, *args, **kwargs):
+    """
+    Menjalankan `fungsi` di dalam transaction.atomic dan mengulanginya
+    (maksimal MAKS_PERCOBAAN kali) jika database membatalkan transaksi karena
+    konflik serialisasi atau deadlock. Hanya mengulang di transaksi terluar.
+    """
+    for percobaan in range(1, MAKS_PERCOBAAN + 1):
+        try:
+            with transaction.atomic():
+                return fungsi(*args, **kwargs)
+        except OperationalError as e:
+            if (not _konflik_serialisasi(e) or percobaan == MAKS_PERCOBAAN
+                    or connection.in_atomic_block):
+                raise
+            time.sleep(0.05 * percobaan)
+
+
+def kunci_varian(varian_ids):
+    """
+    Mengambil semua varian dalam satu query dan mengunci barisnya
+    (SELECT ... FOR UPDATE) dengan urutan id, supaya dua kasir yang menjual
+    barang yang sama tidak saling deadlock.
+    """
+    varian_list = VarianProduk.objects.select_for_update().select_related(
+        'produk_induk'
+    ).filter(id__in=set(varian_ids)).order_by('id')
+    return {varian.id: varian for varian in varian_list}
+
+
+def _ke_decimal(nilai):
+    # SQLite mengembalikan angka biasa dari RETURNING, Postgres sudah Decimal
+    return Decimal(str(nilai)).quantize(PRESISI_STOK)
+
+
+def _returning_stok(tabel):
+    return (
+        f" RETURNING {tabel}.id, {tabel}.stok, {tabel}.stok_rendah, {tabel}.peringatan_stok_rendah, "
+        f"({tabel}.lacak_stok AND {tabel}.is_active)"
+    )
+
+
+def _hasil_update_stok(rows, perubahan):
+    """
+    {varian_id: stok_setelah} dari baris `_returning_stok`. Varian yang
+    melewati batas stok rendah (status sebelum dihitung dari stok - delta)
+    dicatat ke feed perubahan stok rendah.
+    """
+    stok_setelah, lintas = {}, []
+    for varian_id, stok, rendah, batas, dipantau in rows:
+        stok = stok_setelah[varian_id] = _ke_decimal(stok)
+        batas = _ke_decimal(batas)
+        sebelum = bool(dipantau) and stok - perubahan[varian_id] <= batas
+        if bool(rendah) != sebelum:
+            lintas.append((varian_id, bool(rendah), stok, batas))
+    catat_perubahan_stok_rendah(lintas)
+    return stok_setelah
+
+
+def ubah_stok(perubahan, cek_cukup=True):
+    """
+    Menerapkan perubahan stok {varian_id: delta} dengan satu statement
+    `UPDATE ... SET stok = stok + delta WHERE stok >= jumlah_keluar RETURNING`.
+    Tidak ada read-modify-write, jadi aman dari lost update antar kasir.
+    Status `stok_rendah` ikut dihitung di statement yang sama.
+    Mengembalikan {varian_id: stok_setelah}.
+    """
+    perubahan = {varian_id: delta for varian_id, delta in perubahan.items() if delta}
+    if not perubahan:
+        return {}
+
+    tabel = connection.ops.quote_name(VarianProduk._meta.db_table)
+    ids = list(perubahan.keys())
+    kasus_delta = ' '.join(['WHEN %s THEN %s'] * len(ids))
+    stok_baru = f"stok + CASE id {kasus_delta} END"
+    params_delta = [p for varian_id in ids for p in (varian_id, perubahan[varian_id])]
+    sql = (
+        f"UPDATE {tabel} SET stok = {stok_baru}, stok_rendah = {sql_stok_rendah(stok_baru)} "
+        f"WHERE id IN ({', '.join(['%s'] * len(ids))})"
+    )
+    params = params_delta + params_delta + ids
+
+    keluar = {varian_id: -delta for varian_id, delta in perubahan.items() if delta < 0}
+    if cek_cukup and keluar:
+        kasus_keluar = ' '.join(['WHEN %s THEN %s'] * len(keluar))
+        sql += f" AND stok >= CASE id {kasus_keluar} ELSE 0 END"
+        params += [p for varian_id, jumlah in keluar.items() for p in (varian_id, jumlah)]
+    sql += _returning_stok(tabel)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        stok_setelah = _hasil_update_stok(cursor.fetchall(), perubahan)
+
+    ditolak = [varian_id for varian_id in ids if varian_id not in stok_setelah]
+    if ditolak:
+        # Batalkan seluruh transaksi; sebagian baris mungkin sudah terupdate
+        raise StokTidakCukupError(ditolak)
+    naikkan_versi(stok=True)
+    return stok_setelah
+
+
+def mutasi_stok(entri, reason, user, cek_cukup=True, transaksi=None):
+    """
+    Layanan tunggal untuk semua pergerakan stok relatif (penjualan, pembelian,
+    barang rusak, dll). `entri` adalah list dict berisi `varian_id`,
+    `quantity_change` (positif masuk, negatif keluar), serta `notes` dan
+    `harga_satuan` (harga beli barang masuk) opsional. Stok diupdate dengan
+    `ubah_stok`, valuasi persediaan dicatat dengan `catat_valuasi`, lalu
+    riwayatnya dibuat dengan bulk_create, langsung tertaut ke `transaksi` jika ada.
+    """
+    perubahan = {}
+    for e in entri:
+        perubahan[e['varian_id']] = perubahan.get(e['varian_id'], NOL) + e['quantity_change']
+    stok_setelah = ubah_stok(perubahan, cek_cukup=cek_cukup)
+    return _catat_riwayat(entri, stok_setelah, reason, user, transaksi)
+
+
+def _catat_riwayat(entri, stok_setelah, reason, user, transaksi=None):
+    """
+    Membuat StockHistory untuk `entri` yang stoknya sudah diupdate, dengan
+    `stok_setelah` {varian_id: stok akhir} hasil RETURNING.
+    """
+    # Hitung mundur stock_after per entri dari stok akhir hasil RETURNING
+    berjalan = dict(stok_setelah)
+    histories = []
+    harga_list = []
+    for e in reversed(entri):
+        varian_id = e['varian_id']
+        if varian_id not in berjalan:
+            continue
+        histories.append(StockHistory(
+            product_id=varian_id,
+            quantity_change=e['quantity_change'],
+            stock_after=berjalan[varian_id],
+            reason=reason,
+            notes=e.get('notes'),
+            user=user,
+            transaksi=transaksi
+        ))
+        harga_list.append(e.get('harga_satuan'))
+        berjalan[varian_id] -= e['quantity_change']
+    histories.reverse()
+    harga_list.reverse()
+    catat_valuasi(histories, harga_list)
+    histories = StockHistory.objects.bulk_create(histories)
+    if reason != StockHistory.Reason.PENJUALAN and histories:
+        aktivitas.catat(*aktivitas.log_riwayat_stok(histories, aktivitas.nama_varian(h.product_id for h in histories)))
+    return histories
+
+
+ALASAN_MASUK = (StockHistory.Reason.PEMBELIAN, StockHistory.Reason.AWAL, StockHistory.Reason.RETUR)
+
+
+def mutasi_manual(items, reason, user, notes=''):
+    """
+    Stok masuk/keluar manual (penerimaan barang, barang rusak, dll) untuk
+    `items` yang sudah divalidasi serializer. Varian dicek dengan satu query;
+    jika ada yang tidak ada/tidak aktif, VarianTidakValidError dilempar dan
+    tidak ada yang diubah. Stok dan riwayat lewat `mutasi_stok`, purchase_price
+    pembelian diupdate dengan satu UPDATE ... CASE.
+    """
+    status_aktif = dict(VarianProduk.objects.filter(
+        id__in={item['varian_id'] for item in items}
+    ).values_list('id', 'is_active'))
+    errors = []
+    for index, item in enumerate(items):
+        aktif = status_aktif.get(item['varian_id'])
+        if not aktif:
+            errors.append({
+                'index': index, 'varian_id': item['varian_id'],
+                'error': 'Varian tidak ditemukan.' if aktif is None else 'Varian tidak aktif.',
+            })
+    if errors:
+        raise VarianTidakValidError(errors)
+
+    arah = 1 if reason in ALASAN_MASUK else -1
+    pembelian = reason == StockHistory.Reason.PEMBELIAN
+    entri = [{
+        'varian_id': item['varian_id'],
+        'quantity_change': arah * item['quantity'],
+        'notes': item.get('notes') or notes or '',
+        'harga_satuan': item.get('purchase_price') if pembelian else None,
+    } for item in items]
+    riwayat = mutasi_stok(entri, reason, user)
+
+    # purchase_price = harga beli terakhir; basis biaya lama tetap ada di lapisan biaya.
+    # Diupdate setelah mutasi agar saldo awal varian dinilai dengan harga beli lama.
+    harga = {e['varian_id']: e['harga_satuan'] for e in entri if e['harga_satuan']}
+    if harga:
+        VarianProduk.objects.filter(id__in=harga.keys()).update(
+            purchase_price=_case_per('id', harga, DecimalField(max_digits=12, decimal_places=2))
+        )
+        naikkan_versi()
+    return riwayat
+
+
+def setel_stok(hitungan, user, reason=StockHistory.Reason.OPNAME, catatan=None):
+    """
+    Menyetel stok ke jumlah fisik hasil opname {varian_id: jumlah_fisik}.
+    Baris dikunci berurutan, stok sistem dibaca sekali, lalu selisihnya
+    diterapkan lewat `mutasi_stok` agar jalurnya sama dengan mutasi lain.
+    Impor CSV memakai jalur yang sama dengan `reason`/`catatan` sendiri.
+    """
+    awalan = f"{catatan}. " if catatan else ''
+    varian_map = kunci_varian(hitungan.keys())
+    entri = []
+    for varian_id, physical_count in hitungan.items():
+        varian = varian_map.get(varian_id)
+        if varian is None:
+            continue
+        discrepancy = physical_count - varian.stok
+        if discrepancy != 0:
+            entri.append({
+                'varian_id': varian_id,
+                'quantity_change': discrepancy,
+                'notes': f"{awalan}Sistem: {varian.stok}, Fisik: {physical_count}",
+            })
+    return mutasi_stok(entri, reason, user, cek_cukup=False)
+
+
+def buka_sesi_opname(user, catatan=None, kategori_id=None):
+    """
+    Membuka sesi opname dan menyalin stok semua varian aktif yang dilacak
+    (opsional satu kategori) ke ItemOpname dengan satu INSERT ... SELECT.
+    """
+    sesi = SesiOpname.objects.create(dibuat_oleh=user, catatan=catatan)
+    qn = connection.ops.quote_name
+    tabel_item = qn(ItemOpname._meta.db_table)
+    tabel_varian = qn(VarianProduk._meta.db_table)
+    sql = (
+        f"INSERT INTO {tabel_item} (sesi_id, varian_id, stok_awal) "
+        f"SELECT %s, v.id, v.stok FROM {tabel_varian} v WHERE v.is_active = %s AND v.lacak_stok = %s"
+    )
+    params = [sesi.id, True, True]
+    if kategori_id is not None:
+        tabel_produk = qn(Produk._meta.db_table)
+        sql += f" AND v.produk_induk_id IN (SELECT id FROM {tabel_produk} WHERE kategori_id = %s)"
+        params.append(kategori_id)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+    return sesi
+
+
+def catat_hitungan_opname(sesi_id, hitungan, tambah=False):
+    """
+    Menyimpan satu chunk hasil hitung {varian_id: jumlah_fisik} ke sesi yang
+    masih dibuka. Stok sistem saat itu ikut disimpan sebagai `stok_saat_hitung`.
+    Varian yang belum ada di snapshot (mis. baru dibuat) ditambahkan; dengan
+    `tambah=True` hitungan dijumlahkan ke hitungan sebelumnya (dihitung di
+    beberapa rak). Mengembalikan list varian_id yang tidak dikenal.
+    """
+    sesi = SesiOpname.objects.select_for_update().get(id=sesi_id)
+    if sesi.status != SesiOpname.Status.DIBUKA:
+        raise OpnameError('Sesi opname sudah ditutup.')
+
+    items = {
+        item.varian_id: item for item in
+        ItemOpname.objects.filter(sesi=sesi, varian_id__in=hitungan.keys()).annotate(stok_kini=F('varian__stok'))
+    }
+    hilang = [varian_id for varian_id in hitungan if varian_id not in items]
+    if hilang:
+        baru = [
+            ItemOpname(sesi=sesi, varian_id=varian_id, stok_awal=stok)
+            for varian_id, stok in VarianProduk.objects.filter(id__in=hilang).values_list('id', 'stok')
+        ]
+        for item in ItemOpname.objects.bulk_create(baru):
+            item.stok_kini = item.stok_awal
+            items[item.varian_id] = item
+
+    sekarang = timezone.now()
+    for varian_id, jumlah_fisik in hitungan.items():
+        item = items.get(varian_id)
+        if item is None:
+            continue
+        if tambah and item.jumlah_fisik is not None:
+            jumlah_fisik += item.jumlah_fisik
+        item.jumlah_fisik = jumlah_fisik
+        item.stok_saat_hitung = item.stok_kini
+        item.dihitung_pada = sekarang
+    ItemOpname.objects.bulk_update(
+        [item for varian_id, item in items.items() if varian_id in hitungan],
+        ['jumlah_fisik', 'stok_saat_hitung', 'dihitung_pada'], batch_size=1000
+    )
+    return [varian_id for varian_id in hitungan if varian_id not in items]
+
+
+def komit_sesi_opname(sesi_id, user):
+    """
+    Menerapkan selisih sesi opname: stok += jumlah_fisik - stok_saat_hitung
+    untuk semua item yang sudah dihitung, dengan satu UPDATE ... FROM tabel
+    item, lalu riwayat OPNAME dibuat secara bulk lewat jalur yang sama dengan
+    `mutasi_stok` (termasuk valuasi). Item yang belum dihitung tidak diubah.
+    """
+    sesi = SesiOpname.objects.select_for_update().get(id=sesi_id)
+    if sesi.status != SesiOpname.Status.DIBUKA:
+        raise OpnameError('Sesi opname sudah ditutup.')
+
+    selisih = list(
+        ItemOpname.objects.filter(sesi=sesi, jumlah_fisik__isnull=False)
+        .exclude(jumlah_fisik=F('stok_saat_hitung'))
+        .order_by('varian_id').values_list('varian_id', 'stok_saat_hitung', 'jumlah_fisik')
+    )
+    riwayat = []
+    if selisih:
+        # Kunci baris varian berurutan id seperti checkout agar tidak deadlock
+        list(VarianProduk.objects.select_for_update().filter(
+            id__in=[varian_id for varian_id, _, _ in selisih]
+        ).order_by('id').values_list('id', flat=True))
+
+        qn = connection.ops.quote_name
+        tabel_item = qn(ItemOpname._meta.db_table)
+        tabel_varian = qn(VarianProduk._meta.db_table)
+        stok_baru = f"{tabel_varian}.stok + (i.jumlah_fisik - i.stok_saat_hitung)"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {tabel_varian} SET stok = {stok_baru}, stok_rendah = {sql_stok_rendah(stok_baru, tabel_varian)} "
+                f"FROM {tabel_item} i WHERE i.varian_id = {tabel_varian}.id AND i.sesi_id = %s "
+                f"AND i.jumlah_fisik IS NOT NULL AND i.jumlah_fisik <> i.stok_saat_hitung"
+                + _returning_stok(tabel_varian),
+                [sesi.id]
+            )
+            stok_setelah = _hasil_update_stok(cursor.fetchall(), {
+                varian_id: jumlah_fisik - stok_saat_hitung for varian_id, stok_saat_hitung, jumlah_fisik in selisih
+            })
+        naikkan_versi(stok=True)
+
+        riwayat = _catat_riwayat([{
+            'varian_id': varian_id,
+            'quantity_change': jumlah_fisik - stok_saat_hitung,
+            'notes': f"Opname #{sesi.id}. Sistem: {stok_saat_hitung}, Fisik: {jumlah_fisik}",
+        } for varian_id, stok_saat_hitung, jumlah_fisik in selisih], stok_setelah, StockHistory.Reason.OPNAME, user)
+
+    sesi.status = SesiOpname.Status.SELESAI
+    sesi.selesai_pada = timezone.now()
+    sesi.save(update_fields=['status', 'selesai_pada'])
+    return riwayat
+
+
+def _biaya_per_varian(riwayat):
+    return {h.product_id: h.biaya_satuan for h in riwayat if h.biaya_satuan is not None}
+
+
+def _harga_pokok(biaya_per_varian, varian):
+    """
+    Harga pokok per unit untuk baris penjualan: biaya rata-rata bergerak dari
+    riwayat mutasinya, atau purchase_price untuk varian yang stoknya tidak dilacak.
+    """
+    biaya = biaya_per_varian.get(varian.id)
+    if biaya is None:
+        return varian.purchase_price
+    return biaya.quantize(Decimal('0.01'), ROUND_HALF_UP)
+
+
+def hitung_harga_keranjang(detail_items_data, customer_type='Biasa'):
+    """
+    Harga keranjang dari mesin harga (aturan harga kuantitas dan harga reseller).
+    Mengembalikan (baris, total_harga) sesuai urutan `detail_items_data`.
+    """
+    try:
+        return mesin_harga.hitung_keranjang(
+            [(item['varian_produk_id'], item['jumlah']) for item in detail_items_data], customer_type
+        )
+    except KeyError as e:
+        raise CheckoutError(f"Varian produk dengan ID {e.args[0]} tidak ditemukan.")
+    except JumlahDiLuarTabel as e:
+        raise CheckoutError(
+            f"Jumlah varian produk dengan ID {e.varian_id} melebihi {e.batas} untuk aturan harga kuantitasnya."
+        )
+
+
+def stok_direservasi(varian_ids, kecuali=None):
+    """
+    {varian_id: jumlah} stok yang sedang direservasi keranjang ditahan dan
+    belum kedaluwarsa, tanpa reservasi milik transaksi `kecuali`. Tanpa query
+    jika fitur reservasi tidak aktif.
+    """
+    if not settings.RESERVASI_DITAHAN_MENIT:
+        return {}
+    queryset = ReservasiStok.objects.filter(varian_id__in=set(varian_ids), kedaluwarsa__gt=timezone.now())
+    if kecuali is not None:
+        queryset = queryset.exclude(transaksi_id=kecuali)
+    return dict(queryset.values('varian_id').annotate(total=Sum('jumlah')).values_list('varian_id', 'total'))
+
+
+def _pesan_stok_kurang(varian, dipesan=None):
+    if dipesan:
+        return f"Stok untuk '{varian}' tidak mencukupi. Sisa: {varian.stok} ({dipesan} direservasi transaksi ditahan)"
+    return f"Stok untuk '{varian}' tidak mencukupi. Sisa: {varian.stok}"
+
+
+def _reservasi_stok(transaksi, baris):
+    """
+    Membuat reservasi lunak untuk baris keranjang yang ditahan. Hanya stok
+    yang masih tersedia (stok dikurangi reservasi lain) yang direservasi;
+    menahan keranjang tidak pernah gagal karena stok.
+    """
+    menit = settings.RESERVASI_DITAHAN_MENIT
+    if not menit:
+        return
+    jumlah_per_varian = {}
+    for b in baris:
+        jumlah_per_varian[b['varian_id']] = jumlah_per_varian.get(b['varian_id'], NOL) + b['jumlah']
+    varian_map = kunci_varian(jumlah_per_varian.keys())
+    dipesan = stok_direservasi(jumlah_per_varian.keys(), kecuali=transaksi.id)
+
+    kedaluwarsa = timezone.now() + timedelta(minutes=menit)
+    reservasi = []
+    for varian_id, jumlah in jumlah_per_varian.items():
+        varian = varian_map.get(varian_id)
+        if varian is None or not varian.lacak_stok:
+            continue
+        jumlah = min(jumlah, varian.stok - dipesan.get(varian_id, NOL))
+        if jumlah > 0:
+            reservasi.append(ReservasiStok(transaksi=transaksi, varian_id=varian_id, jumlah=jumlah, kedaluwarsa=kedaluwarsa))
+    ReservasiStok.objects.bulk_create(reservasi)
+
+
+def _detail_ditahan(transaksi, b):
+    return DetailTransaksi(
+        transaksi=transaksi,
+        varian_produk_terjual_id=b['varian_id'],
+        jumlah=b['jumlah'],
+        harga_saat_transaksi=b['harga_satuan'],
+        subtotal=b['subtotal']
+    )
+
+
+def tahan_transaksi(kasir, data, detail_items_data):
+    """
+    Menyimpan keranjang sebagai transaksi 'Ditahan' tanpa mengurangi stok.
+    Harga dihitung sekali untuk seluruh keranjang dan baris dibuat dengan
+    bulk_create. Harus dipanggil di dalam transaction.atomic.
+    """
+    customer_type = data.get('customer_type', 'Biasa')
+    baris, total_harga = hitung_harga_keranjang(detail_items_data, customer_type)
+
+    transaksi_ditahan = Transaksi.objects.create(
+        kasir=kasir,
+        total_harga=total_harga,
+        total_setelah_diskon=total_harga,
+        jumlah_bayar=0,
+        kembalian=0,
+        customer_type=customer_type,
+        status='Ditahan',
+        notes=data.get('notes', None)
+    )
+    DetailTransaksi.objects.bulk_create([_detail_ditahan(transaksi_ditahan, b) for b in baris])
+    _reservasi_stok(transaksi_ditahan, baris)
+    return transaksi_ditahan
+
+
+def perbarui_transaksi_ditahan(instance, data, detail_items_data):
+    """
+    Mengganti isi transaksi 'Ditahan' dengan keranjang baru. Baris lama
+    dipasangkan dengan baris baru per varian sesuai urutan; hanya baris yang
+    berubah yang diupdate, sisanya dihapus atau dibuat secara bulk.
+    Harus dipanggil di dalam transaction.atomic.
+    """
+    customer_type = data.get('customer_type', instance.customer_type)
+    baris, total_harga = hitung_harga_keranjang(detail_items_data, customer_type)
+
+    lama_per_varian = {}
+    for detail in instance.detail_items.order_by('id'):
+        lama_per_varian.setdefault(detail.varian_produk_terjual_id, deque()).append(detail)
+
+    diubah, dibuat = [], []
+    for b in baris:
+        antrean = lama_per_varian.get(b['varian_id'])
+        if not antrean:
+            dibuat.append(_detail_ditahan(instance, b))
+            continue
+        detail = antrean.popleft()
+        baru = (b['jumlah'], b['harga_satuan'], b['subtotal'])
+        if (detail.jumlah, detail.harga_saat_transaksi, detail.subtotal) != baru:
+            detail.jumlah, detail.harga_saat_transaksi, detail.subtotal = baru
+            diubah.append(detail)
+    dihapus = [detail.id for antrean in lama_per_varian.values() for detail in antrean]
+
+    if dihapus:
+        DetailTransaksi.objects.filter(id__in=dihapus).delete()
+    if diubah:
+        DetailTransaksi.objects.bulk_update(diubah, ['jumlah', 'harga_saat_transaksi', 'subtotal'])
+    if dibuat:
+        DetailTransaksi.objects.bulk_create(dibuat)
+
+    instance.total_harga = total_harga
+    instance.total_setelah_diskon = total_harga  # Asumsi diskon direset
+    instance.customer_type = customer_type
+    instance.save(update_fields=['total_harga', 'total_setelah_diskon', 'customer_type'])
+
+    if settings.RESERVASI_DITAHAN_MENIT:
+        instance.reservasi_stok.all().delete()
+        _reservasi_stok(instance, baris)
+    return instance
+
+
+def proses_checkout(kasir, data, detail_items_data):
+    """
+    Membuat transaksi penjualan dengan jumlah query yang tetap,
+    berapapun banyaknya item di keranjang. Harus dipanggil di dalam transaction.atomic.
+    """
+    # Gabungkan item dengan varian yang sama agar stok dicek terhadap total jumlahnya
+    jumlah_per_varian = {}
+    for item_data in detail_items_data:
+        varian_id = item_data['varian_produk_id']
+        jumlah_per_varian[varian_id] = jumlah_per_varian.get(varian_id, NOL) + item_data['jumlah']
+
+    varian_map = kunci_varian(jumlah_per_varian.keys())
+    dipesan = stok_direservasi(jumlah_per_varian.keys())
+
+    for varian_id, jumlah in jumlah_per_varian.items():
+        varian = varian_map.get(varian_id)
+        if varian is None:
+            raise CheckoutError(f"Varian produk dengan ID {varian_id} tidak ditemukan.")
+        if varian.lacak_stok and varian.stok - dipesan.get(varian_id, NOL) < jumlah:
+            raise CheckoutError(_pesan_stok_kurang(varian, dipesan.get(varian_id)))
+
+    baris, total_harga = hitung_harga_keranjang(detail_items_data, data.get('customer_type', 'Biasa'))
+    items_to_create = [{
+        'varian': varian_map[b['varian_id']], 'jumlah': b['jumlah'],
+        'harga_saat_transaksi': b['harga_satuan'], 'subtotal': b['subtotal']
+    } for b in baris]
+
+    diskon = data.get('diskon_nominal', Decimal('0.0'))
+    total_setelah_diskon = total_harga - diskon
+    jumlah_bayar = data['jumlah_bayar']
+    kembalian = jumlah_bayar - total_setelah_diskon
+
+    if kembalian < 0:
+        raise CheckoutError('Jumlah bayar tidak mencukupi.')
+
+    transaksi_baru = Transaksi.objects.create(
+        kasir=kasir,
+        total_harga=total_harga,
+        diskon_nominal=diskon,
+        total_setelah_diskon=total_setelah_diskon,
+        jumlah_bayar=jumlah_bayar,
+        kembalian=kembalian,
+        metode_pembayaran=data['metode_pembayaran'],
+        customer_type=data.get('customer_type', 'Biasa'),
+        status='Selesai'
+    )
+
+    notes = f"Transaksi No: {transaksi_baru.nomor_transaksi}"
+    biaya = _biaya_per_varian(mutasi_stok([
+        {'varian_id': varian_id, 'quantity_change': -jumlah, 'notes': notes}
+        for varian_id, jumlah in jumlah_per_varian.items()
+        if varian_map[varian_id].lacak_stok
+    ], StockHistory.Reason.PENJUALAN, kasir, transaksi=transaksi_baru))
+
+    DetailTransaksi.objects.bulk_create([
+        DetailTransaksi(
+            transaksi=transaksi_baru,
+            varian_produk_terjual=item['varian'],
+            jumlah=item['jumlah'],
+            harga_saat_transaksi=item['harga_saat_transaksi'],
+            subtotal=item['subtotal'],
+            harga_pokok=_harga_pokok(biaya, item['varian'])
+        )
+        for item in items_to_create
+    ])
+
+    catat_ringkasan_penjualan(transaksi_baru, [
+        (item['varian'].id, item['jumlah'], item['subtotal']) for item in items_to_create
+    ])
+    aktivitas.catat(aktivitas.log_transaksi(transaksi_baru, kasir))
+    return transaksi_baru
+
+
+def selesaikan_transaksi_ditahan(instance, user, payment_data):
+    """
+    Melanjutkan transaksi berstatus 'Ditahan': stok dikurangi lewat
+    `mutasi_stok` dan data pembayaran disimpan.
+    """
+    details = list(instance.detail_items.all())
+    varian_map = kunci_varian([detail.varian_produk_terjual_id for detail in details])
+
+    jumlah_per_varian = {}
+    for detail in details:
+        if varian_map[detail.varian_produk_terjual_id].lacak_stok:
+            varian_id = detail.varian_produk_terjual_id
+            jumlah_per_varian[varian_id] = jumlah_per_varian.get(varian_id, NOL) + detail.jumlah
+
+    # Reservasi milik transaksi ini sendiri boleh dipakai
+    dipesan = stok_direservasi(jumlah_per_varian.keys(), kecuali=instance.id)
+    for varian_id, jumlah in jumlah_per_varian.items():
+        if varian_map[varian_id].stok - dipesan.get(varian_id, NOL) < jumlah:
+            raise CheckoutError(_pesan_stok_kurang(varian_map[varian_id], dipesan.get(varian_id)))
+
+    biaya = _biaya_per_varian(mutasi_stok([
+        {'varian_id': varian_id, 'quantity_change': -jumlah, 'notes': f"Transaksi No: {instance.nomor_transaksi}"}
+        for varian_id, jumlah in jumlah_per_varian.items()
+    ], StockHistory.Reason.PENJUALAN, user, transaksi=instance))
+
+    # Harga pokok dicatat saat barang benar-benar terjual, bukan saat ditahan
+    for detail in details:
+        detail.harga_pokok = _harga_pokok(biaya, varian_map[detail.varian_produk_terjual_id])
+    DetailTransaksi.objects.bulk_update(details, ['harga_pokok'])
+
+    total_harga_final = sum((detail.subtotal for detail in details), Decimal('0.0'))  # Gunakan subtotal yang sudah tersimpan
+
+    instance.total_harga = total_harga_final
+    instance.diskon_nominal = payment_data.get('diskon_nominal', 0)
+    instance.total_setelah_diskon = total_harga_final - instance.diskon_nominal
+    instance.jumlah_bayar = payment_data['jumlah_bayar']
+    instance.kembalian = instance.jumlah_bayar - instance.total_setelah_diskon
+    instance.metode_pembayaran = payment_data['metode_pembayaran']
+    instance.status = 'Selesai'
+    instance.save()
+    instance.reservasi_stok.all().delete()
+
+    catat_ringkasan_penjualan(instance, [
+        (detail.varian_produk_terjual_id, detail.jumlah, detail.subtotal) for detail in details
+    ])
+    aktivitas.catat(aktivitas.log_transaksi(instance, user))
+    return instance
+
+
+def catat_simpanan(pelanggan_id, tipe, jumlah, keterangan, user):
+    """
+    Mencatat setoran/penarikan simpanan. Baris pelanggan dikunci, saldo
+    tersimpan diperbarui dengan F() dan `saldo_setelah` diambil dari saldo
+    tersebut, semuanya di transaksi yang sama dengan insert riwayatnya.
+    """
+    pelanggan = Pelanggan.objects.select_for_update().get(id=pelanggan_id)
+    delta = jumlah if tipe == RiwayatSimpanan.Tipe.MASUK else -jumlah
+
+    if delta < 0 and pelanggan.saldo < jumlah:
+        raise SaldoTidakCukupError('Saldo simpanan tidak mencukupi.')
+
+    Pelanggan.objects.filter(id=pelanggan.id).update(saldo=F('saldo') + delta)
+    pelanggan.saldo += delta
+
+    riwayat = RiwayatSimpanan.objects.create(
+        pelanggan=pelanggan,
+        tipe=tipe,
+        jumlah=jumlah,
+        saldo_setelah=pelanggan.saldo,
+        keterangan=keterangan,
+        dicatat_oleh=user
+    )
+    aktivitas.catat(aktivitas.log_simpanan(riwayat, pelanggan))
+    return riwayat
+
+
+def sesuaikan_hutang_piutang(hutang_piutang_id, delta_dibayar=NOL, delta_total=NOL):
+    """
+    Memperbarui total_dibayar/total_awal dan status lunas sebuah hutang/piutang
+    dalam satu UPDATE atomik, tanpa mengagregasi ulang tabel pembayaran.
+    """
+    HutangPiutang.objects.filter(id=hutang_piutang_id).update(
+        total_dibayar=F('total_dibayar') + delta_dibayar,
+        total_awal=F('total_awal') + delta_total,
+        lunas=Case(
+            When(Q(total_awal__lte=F('total_dibayar') + delta_dibayar - delta_total), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        )
+    )
+
+
+def _case_per(kolom, nilai_per_kunci, output_field):
+    return Case(
+        *[When(**{kolom: kunci}, then=Value(nilai)) for kunci, nilai in nilai_per_kunci.items()],
+        output_field=output_field,
+    )
+
+
+def catat_ringkasan_penjualan(transaksi, items, arah=1):
+    """
+    Menambahkan transaksi yang baru selesai ke rekap harian. `items` adalah list
+    (varian_id, jumlah, subtotal). Baris rekap dibuat bila belum ada
+    (ignore_conflicts agar aman dari kasir lain) lalu dinaikkan dengan F(),
+    jadi jumlah query tetap berapapun jumlah item. Dengan `arah=-1`
+    kontribusinya dikeluarkan lagi dan baris yang jadi kosong dihapus.
+    """
+    tanggal = timezone.localdate(transaksi.created_at)
+    kolom_metode = RingkasanPenjualanHarian.KOLOM_METODE[transaksi.metode_pembayaran]
+    total = arah * transaksi.total_setelah_diskon
+
+    RingkasanPenjualanHarian.objects.bulk_create(
+        [RingkasanPenjualanHarian(tanggal=tanggal)], ignore_conflicts=True
+    )
+    RingkasanPenjualanHarian.objects.filter(tanggal=tanggal).update(**{
+        'pendapatan': F('pendapatan') + total,
+        'jumlah_transaksi': F('jumlah_transaksi') + arah,
+        'item_terjual': F('item_terjual') + arah * sum((jumlah for _, jumlah, _ in items), NOL),
+        kolom_metode: F(kolom_metode) + total,
+    })
+    if arah < 0:
+        RingkasanPenjualanHarian.objects.filter(tanggal=tanggal, jumlah_transaksi__lte=0).delete()
+
+    per_varian = {}
+    for varian_id, jumlah, subtotal in items:
+        total_jumlah, total_subtotal = per_varian.get(varian_id, (NOL, NOL))
+        per_varian[varian_id] = (total_jumlah + arah * jumlah, total_subtotal + arah * subtotal)
+    if not per_varian:
+        return
+
+    RingkasanVarianHarian.objects.bulk_create(
+        [RingkasanVarianHarian(tanggal=tanggal, varian_id=varian_id) for varian_id in per_varian],
+        ignore_conflicts=True
+    )
+    RingkasanVarianHarian.objects.filter(tanggal=tanggal, varian_id__in=per_varian.keys()).update(
+        jumlah_terjual=F('jumlah_terjual') + _case_per(
+            'varian_id', {v: j for v, (j, _) in per_varian.items()}, DecimalField(max_digits=14, decimal_places=3)
+        ),
+        pendapatan=F('pendapatan') + _case_per(
+            'varian_id', {v: p for v, (_, p) in per_varian.items()}, DecimalField(max_digits=14, decimal_places=2)
+        ),
+    )
+    if arah < 0:
+        RingkasanVarianHarian.objects.filter(
+            tanggal=tanggal, varian_id__in=per_varian.keys(), jumlah_terjual__lte=0
+        ).delete()
+
+
+def _kunci_ringkasan(transaksi):
+    return (
+        transaksi.status, timezone.localdate(transaksi.created_at),
+        transaksi.metode_pembayaran, transaksi.total_setelah_diskon,
+    )
+
+
+def sesuaikan_ringkasan_penjualan(lama, baru=None):
+    """
+    Menyamakan rekap harian setelah transaksi diubah atau dihapus lewat API.
+    `lama` adalah salinan transaksi sebelum diubah, `baru` hasilnya (None
+    untuk hapus). Kontribusi lama dikeluarkan jika statusnya Selesai, lalu
+    yang baru dimasukkan jika Selesai; perubahan yang tidak menyentuh rekap
+    (mis. notes) tidak menjalankan query.
+    """
+    if baru is not None and _kunci_ringkasan(lama) == _kunci_ringkasan(baru):
+        return
+    if lama.status != 'Selesai' and (baru is None or baru.status != 'Selesai'):
+        return
+    items = list(DetailTransaksi.objects.filter(transaksi_id=lama.pk).values_list(
+        'varian_produk_terjual_id', 'jumlah', 'subtotal'
+    ))
+    if lama.status == 'Selesai':
+        catat_ringkasan_penjualan(lama, items, arah=-1)
+    if baru is not None and baru.status == 'Selesai':
+        catat_ringkasan_penjualan(baru, items)
\ No newline at end of file
@@ -0,0 +1,14 @@
+# transactions/signals.py
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from products.models import VarianProduk
+from .persediaan import buka_persediaan
+
+
+@receiver(post_save, sender=VarianProduk)
+def varian_dibuat(sender, instance, created, raw=False, **kwargs):
+    """Varian baru langsung punya saldo awal persediaan (lihat transactions/persediaan.py)."""
+    if created and not raw:
+        buka_persediaan(instance)
@@ -1,3 +1,1302 @@
-from django.test import TestCase
+import copy
+import csv
+import gzip
+import importlib
+import io
+import math
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.test import APIClient
+
+from pos_project.benchmark import buat_request
+from pos_project.pagination import MAKS_HALAMAN, RiwayatPagination
+from products import cache_katalog
+from products.mesin_harga import MesinHarga
+from products.models import AturanHargaKuantitas, Kategori, PerubahanStokRendah, Produk, VarianProduk
+from products.views import LowStockChangesView
+from users.models import User
+from .models import (
+    DetailTransaksi, HutangPiutang, LogAktivitas, NilaiPersediaan, Pelanggan, ReservasiStok, RiwayatSimpanan,
+    RingkasanPenjualanHarian, RingkasanVarianHarian, StockHistory, Transaksi,
+)
+from . import aktivitas
+from .services import jalankan_dengan_retry, mutasi_stok, sesuaikan_hutang_piutang, sesuaikan_ringkasan_penjualan
+from .views import TransactionCSVExportView
+
+
+def buat_varian(jumlah=1, stok=100, purchase_price=600, harga_jual_normal=1000, **kwargs):
+    """Varian uji dengan produk induk masing-masing (lewat save(), jadi signal ikut jalan)."""
+    kategori, _ = Kategori.objects.get_or_create(nama_kategori='Uji')
+    awal = Produk.objects.count()
+    varian = []
+    for i in range(awal, awal + jumlah):
+        produk = Produk.objects.create(nama_produk=f'Produk {i}', kategori=kategori)
+        varian.append(VarianProduk.objects.create(
+            produk_induk=produk, nama_varian='Biasa', sku=f'SKU{i:05d}', stok=stok, satuan='pcs',
+            purchase_price=purchase_price, harga_jual_normal=harga_jual_normal, **kwargs
+        ))
+    return varian
+
+
+def jumlah_batch_insert(model, jumlah):
+    """Banyaknya INSERT yang dipakai bulk_create untuk `jumlah` baris (SQLite membatasi jumlah parameter)."""
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    return math.ceil(jumlah / connection.ops.bulk_batch_size(fields, [None] * jumlah))
+
+
+class ApiTestCase(TestCase):
+    """TestCase dengan admin yang sudah login lewat APIClient."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin', role='admin')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def checkout(self, varian_list, jumlah=1, **data):
+        """Checkout tunai `jumlah` unit setiap varian; mengembalikan data transaksi dari response."""
+        response = self.client.post('/api/transactions/transaksi/', {
+            'detail_items': [{'varian_produk_id': v.id, 'jumlah': jumlah} for v in varian_list],
+            'jumlah_bayar': sum(v.harga_jual_normal for v in varian_list) * jumlah,
+            'metode_pembayaran': 'Tunai', **data,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+
+class NilaiPersediaanTests(ApiTestCase):
+    URL = '/api/transactions/laporan/nilai-persediaan/'
+
+    def nilai(self, **params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return Decimal(str(response.data['nilai_persediaan']))
+
+    def test_varian_yang_belum_pernah_bergerak_ikut_dinilai(self):
+        buat_varian(20, stok=1000, purchase_price=2000)
+        self.assertEqual(self.nilai(), Decimal('40000000'))
+        self.assertEqual(self.nilai(metode='fifo'), Decimal('40000000'))
+
+    def test_varian_tanpa_baris_nilai_persediaan_memakai_stok_kali_harga_beli(self):
+        varian = buat_varian(stok=10, purchase_price=500)[0]
+        # Varian hasil impor (bulk_create) tidak punya baris NilaiPersediaan
+        varian.nilai_persediaan.delete()
+        self.assertEqual(self.nilai(), Decimal('5000'))
+
+    def test_tanggal_sebelum_pergerakan_pertama_memakai_saldo_awal(self):
+        varian = buat_varian(stok=10, purchase_price=500)[0]
+        mutasi_stok([{'varian_id': varian.id, 'quantity_change': Decimal('-4')}], StockHistory.Reason.RUSAK, self.admin)
+        kemarin = (timezone.localdate() - timedelta(days=1)).isoformat()
+        self.assertEqual(self.nilai(tanggal=kemarin), Decimal('5000'))
+        self.assertEqual(self.nilai(), Decimal('3000'))
+
+    def test_saldo_awal_varian_baru_punya_lapisan_fifo(self):
+        varian = buat_varian(stok=10, purchase_price=500)[0]
+        mutasi_stok([{'varian_id': varian.id, 'quantity_change': Decimal('-4')}], StockHistory.Reason.RUSAK, self.admin)
+        self.assertEqual(self.nilai(metode='fifo'), Decimal('3000'))
+
+    def test_rebuild_memutar_ulang_riwayat_per_varian_menurut_waktu_kejadian(self):
+        varian, lain, diam = buat_varian(3, stok=0, purchase_price=600)
+        sekarang = timezone.now()
+        # Id riwayat tidak searah waktu kejadian (mis. hasil impor data lama)
+        rusak = StockHistory.objects.create(product=varian, quantity_change=-5, stock_after=5, reason=StockHistory.Reason.RUSAK)
+        beli = StockHistory.objects.create(
+            product=varian, quantity_change=10, stock_after=10, reason=StockHistory.Reason.PEMBELIAN, biaya_satuan=1000
+        )
+        StockHistory.objects.filter(pk=beli.pk).update(created_at=sekarang - timedelta(hours=2))
+        StockHistory.objects.filter(pk=rusak.pk).update(created_at=sekarang - timedelta(hours=1))
+        StockHistory.objects.create(product=lain, quantity_change=3, stock_after=3, reason=StockHistory.Reason.AWAL)
+        VarianProduk.objects.filter(pk=varian.pk).update(stok=5)
+        VarianProduk.objects.filter(pk=lain.pk).update(stok=3)
+        VarianProduk.objects.filter(pk=diam.pk).update(stok=2)
+
+        call_command('rebuild_nilai_persediaan', chunk_size=1, stdout=io.StringIO())
+
+        # Pembelian 10 @1000 lebih dulu, lalu 5 rusak: sisa satu lapisan 5 @1000
+        rusak.refresh_from_db()
+        self.assertEqual((rusak.biaya_satuan, rusak.nilai_setelah, rusak.nilai_fifo_setelah), (1000, 5000, 5000))
+        self.assertEqual(list(varian.lapisan_biaya.values_list('sisa', 'harga_satuan')), [(5, 1000)])
+        nilai = dict(NilaiPersediaan.objects.values_list('varian_id', 'nilai_fifo'))
+        self.assertEqual(nilai, {varian.id: 5000, lain.id: 1800, diam.id: 1200})
+
+
+class CheckoutQueryTests(ApiTestCase):
+    """Checkout memakai jumlah query yang tetap, berapapun banyaknya item di keranjang."""
+    URL = '/api/transactions/transaksi/'
+    # Termasuk savepoint transaction.atomic dan query serializer respons
+    QUERY_CHECKOUT = 23
+
+    def test_jumlah_query_tidak_bergantung_pada_banyaknya_item(self):
+        for jumlah in (1, 10, 100):
+            with self.subTest(jumlah_item=jumlah):
+                varian = buat_varian(jumlah, stok=5)
+                payload = {
+                    'detail_items': [{'varian_produk_id': v.id, 'jumlah': 2} for v in varian],
+                    'jumlah_bayar': 2000 * jumlah, 'metode_pembayaran': 'Tunai',
+                }
+                with self.assertNumQueries(self.QUERY_CHECKOUT + jumlah_batch_insert(StockHistory, jumlah) - 1):
+                    response = self.client.post(self.URL, payload, format='json')
+                self.assertEqual(response.status_code, 201, response.data)
+                self.assertEqual(len(response.data['detail_items']), jumlah)
+                self.assertEqual(
+                    set(VarianProduk.objects.filter(id__in=[v.id for v in varian]).values_list('stok', flat=True)),
+                    {Decimal('3')},
+                )
+
+
+
+class DaftarTransaksiQueryTests(ApiTestCase):
+    """Daftar transaksi berhalaman memakai jumlah query yang tetap, berapapun isi halamannya."""
+    URL = '/api/transactions/transaksi/'
+    # Ringkasan (agregat yang juga menggantikan COUNT), transaksi, detail, varian,
+    # lalu aturan harga (lengkap) atau produk induk (ringkas)
+    QUERY_DAFTAR = 5
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.varian = buat_varian(4, stok=1000)
+
+    def _checkout(self, jumlah):
+        for i in range(jumlah):
+            self.checkout(self.varian[:1 + i % 4])
+
+    def _daftar(self, query, jumlah_query):
+        with self.assertNumQueries(jumlah_query):
+            response = self.client.get(self.URL + query)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_jumlah_query_tetap_dengan_dan_tanpa_ringkas(self):
+        for jumlah_transaksi in (2, 20):
+            self._checkout(jumlah_transaksi - Transaksi.objects.count())
+            for query in ('?page_size=20', '?page_size=20&ringkas=1'):
+                with self.subTest(jumlah_transaksi=jumlah_transaksi, query=query):
+                    data = self._daftar(query, self.QUERY_DAFTAR)
+                    self.assertEqual(len(data['results']), jumlah_transaksi)
+                    self.assertEqual(data['summary']['jumlah_transaksi'], jumlah_transaksi)
+
+    def test_halaman_berikutnya_memakai_ringkasan_dari_cache(self):
+        self._checkout(12)
+        for query in ('', '&ringkas=1'):
+            with self.subTest(query=query):
+                pertama = self._daftar('?page_size=5' + query, self.QUERY_DAFTAR)
+                # Ringkasan dari cache, tapi paginator perlu COUNT(*) sendiri
+                kedua = self._daftar('?page_size=5&page=2' + query, self.QUERY_DAFTAR)
+                self.assertEqual(kedua['summary'], pertama['summary'])
+                self.assertEqual(len(kedua['results']), 5)
+
+    def test_struk_dicetak_dari_detail_lengkap_bukan_daftar_ringkas(self):
+        trx = self.checkout(self.varian[:2])
+        ringkas = self._daftar('?ringkas=1', self.QUERY_DAFTAR)['results'][0]
+        self.assertIsInstance(ringkas['detail_items'][0]['varian_produk_terjual'], int)
+
+        # Field yang dibaca PrintableReceipt; `ringkas` diabaikan di luar daftar
+        for query in ('', '?ringkas=1'):
+            with self.subTest(query=query):
+                response = self.client.get(f"{self.URL}{trx['id']}/{query}")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['kasir']['username'], 'admin')
+                for item, varian in zip(response.data['detail_items'], self.varian):
+                    self.assertEqual(
+                        (item['varian_produk_terjual']['nama_produk_induk'], item['varian_produk_terjual']['nama_varian']),
+                        (varian.produk_induk.nama_produk, varian.nama_varian),
+                    )
+                    self.assertIn('harga_saat_transaksi', item)
+
+
+
+class RiwayatPaginationTests(TestCase):
+    """Kursor keyset (created_at, id) menurun di pos_project/pagination.py."""
+
+    @classmethod
+    def setUpTestData(cls):
+        kasir = User.objects.create(username='kasir', role='kasir')
+        awal = timezone.now().replace(microsecond=0)
+        # Tiga transaksi per detik, jadi batas halaman sering jatuh di antara created_at yang sama
+        Transaksi.objects.bulk_create([
+            Transaksi(
+                nomor_transaksi=f'INV-{i:03d}', kasir=kasir, jumlah_bayar=0, kembalian=0,
+                created_at=awal - timedelta(seconds=i // 3),
+            )
+            for i in range(11)
+        ])
+        cls.urut = list(Transaksi.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def halaman(self, cursor='', page_size=4):
+        paginator = RiwayatPagination()
+        baris = paginator.paginate_queryset(
+            Transaksi.objects.all(), buat_request(cursor=cursor, page_size=page_size)
+        )
+        return [t.id for t in baris], paginator.kursor_berikut, paginator.kursor_sebelum
+
+    def test_kursor_bisa_dibaca_kembali(self):
+        transaksi = Transaksi.objects.order_by('id').first()
+        paginator = RiwayatPagination()
+        for mundur in (False, True):
+            kursor = paginator._tulis_kursor(transaksi, mundur=mundur)
+            self.assertNotIn('=', kursor)
+            self.assertEqual(paginator._baca_kursor(kursor), (mundur, (transaksi.created_at, transaksi.id)))
+        self.assertEqual(paginator._baca_kursor(''), (False, None))
+
+    def test_kursor_rusak_ditolak(self):
+        paginator = RiwayatPagination()
+        for kursor in ('bukan-kursor', RiwayatPagination._kode({'t': 'kemarin', 'i': 1}), RiwayatPagination._kode({'i': 1})):
+            with self.subTest(kursor=kursor), self.assertRaises(NotFound):
+                paginator._baca_kursor(kursor)
+
+    def test_maju_sampai_habis_tanpa_duplikat_atau_terlewat(self):
+        dilihat, kursor, jumlah_halaman = [], '', 0
+        while True:
+            ids, kursor, sebelum = self.halaman(kursor)
+            jumlah_halaman += 1
+            self.assertEqual(sebelum is None, jumlah_halaman == 1)
+            dilihat += ids
+            if kursor is None:
+                break
+        self.assertEqual(dilihat, self.urut)
+        self.assertEqual(jumlah_halaman, 3)
+        self.assertEqual(len(ids), 3)
+
+    def test_mundur_mengembalikan_halaman_sebelumnya(self):
+        pertama, kursor, _ = self.halaman()
+        kedua, kursor, sebelum = self.halaman(kursor)
+        ketiga, kursor_habis, sebelum_ketiga = self.halaman(kursor)
+        self.assertIsNone(kursor_habis)
+        self.assertEqual(self.halaman(sebelum_ketiga)[0], kedua)
+        ids, berikut, sebelum_pertama = self.halaman(sebelum)
+        self.assertEqual(ids, pertama)
+        # Halaman paling atas dicapai dari belakang: tidak ada halaman sebelumnya lagi
+        self.assertIsNone(sebelum_pertama)
+        self.assertEqual(self.halaman(berikut)[0], kedua)
+
+    def test_halaman_pas_di_akhir_data(self):
+        ids, berikut, _ = self.halaman(page_size=11)
+        self.assertEqual(ids, self.urut)
+        self.assertIsNone(berikut)
+        ids, berikut, _ = self.halaman(page_size=10)
+        self.assertEqual(self.halaman(berikut, page_size=10)[0], self.urut[10:])
+
+
+
+class EksporCSVTests(ApiTestCase):
+    URL = '/api/transactions/export-transaksi-csv/'
+
+    def setUp(self):
+        super().setUp()
+        self.varian = buat_varian(3)
+        for i in range(3):
+            self.checkout(self.varian[:i + 1])
+
+    def unduh(self, jumlah_query=1, **params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        # Satu query (cursor server-side) dijalankan saat isi response dibaca
+        with self.assertNumQueries(jumlah_query):
+            isi = b''.join(response.streaming_content)
+        return response, isi
+
+    def baris(self, isi):
+        return list(csv.reader(io.StringIO(isi.decode('utf-8'))))
+
+    def test_satu_baris_per_transaksi_dengan_kasir_dari_join(self):
+        response, isi = self.unduh()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        baris = self.baris(isi)
+        self.assertEqual(baris[0], TransactionCSVExportView.KOLOM_TRANSAKSI)
+        self.assertEqual(len(baris), 4)
+        self.assertEqual({b[2] for b in baris[1:]}, {'admin'})
+        self.assertEqual(sorted(Decimal(b[3]) for b in baris[1:]), [Decimal('1000'), Decimal('2000'), Decimal('3000')])
+
+    def test_mode_item_satu_baris_per_detail(self):
+        _, isi = self.unduh(mode='item')
+        baris = self.baris(isi)
+        self.assertEqual(baris[0], TransactionCSVExportView.KOLOM_ITEM)
+        self.assertEqual(len(baris), 1 + 6)
+        self.assertEqual({b[3] for b in baris[1:]}, {v.sku for v in self.varian})
+
+    def test_gzip_sama_dengan_csv_biasa(self):
+        _, biasa = self.unduh()
+        response, terkompres = self.unduh(gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(terkompres), biasa)
+
+    def test_rentang_tanggal_dan_format_salah(self):
+        besok = (timezone.localdate() + timedelta(days=1)).isoformat()
+        _, isi = self.unduh(created_at__gte=besok)
+        self.assertEqual(len(self.baris(isi)), 1)
+        self.assertEqual(self.client.get(self.URL, {'created_at__gte': '18-10-2026'}).status_code, 400)
+
+
+
+@override_settings(RESERVASI_DITAHAN_MENIT=15)
+class TransaksiDitahanTests(ApiTestCase):
+    URL = '/api/transactions/transaksi/'
+
+    def setUp(self):
+        super().setUp()
+        self.varian = buat_varian(4, stok=10)
+
+    def keranjang(self, *isi):
+        return {'detail_items': [{'varian_produk_id': self.varian[i].id, 'jumlah': jumlah} for i, jumlah in isi]}
+
+    def tahan(self, *isi):
+        response = self.client.post(self.URL + 'hold_transaction/', {**self.keranjang(*isi), 'notes': 'Bu Ani'}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def detail(self, transaksi_id):
+        return {
+            d.varian_produk_terjual_id: (d.id, d.jumlah)
+            for d in DetailTransaksi.objects.filter(transaksi_id=transaksi_id)
+        }
+
+    def test_update_hanya_menyentuh_baris_yang_berubah(self):
+        transaksi_id = self.tahan((0, 1), (1, 2), (2, 3))
+        lama = self.detail(transaksi_id)
+
+        response = self.client.patch(f'{self.URL}{transaksi_id}/update_held_transaction/', self.keranjang((0, 1), (1, 5), (3, 1)), format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        baru = self.detail(transaksi_id)
+
+        v = [varian.id for varian in self.varian]
+        self.assertEqual(baru[v[0]], lama[v[0]])
+        self.assertEqual(baru[v[1]], (lama[v[1]][0], Decimal('5')))
+        self.assertNotIn(v[2], baru)
+        self.assertNotIn(baru[v[3]][0], [i for i, _ in lama.values()])
+        self.assertEqual(Decimal(response.data['total_harga']), Decimal('7000'))
+
+    def test_reservasi_menahan_stok_dari_kasir_lain(self):
+        transaksi_id = self.tahan((0, 8))
+        response = self.client.post(self.URL, {
+            **self.keranjang((0, 5)), 'jumlah_bayar': 5000, 'metode_pembayaran': 'Tunai',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('direservasi', response.data['error'])
+        self.checkout([self.varian[0]], jumlah=2)
+
+        # Transaksi ditahan tetap bisa dilanjutkan dengan stok yang direservasinya
+        response = self.client.post(f'{self.URL}{transaksi_id}/resume_transaction/', {
+            **self.keranjang((0, 8)), 'jumlah_bayar': 8000, 'metode_pembayaran': 'Tunai',
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.varian[0].refresh_from_db()
+        self.assertEqual(self.varian[0].stok, Decimal('0'))
+        self.assertFalse(ReservasiStok.objects.exists())
+
+    def test_reservasi_kedaluwarsa_tidak_dihitung_lalu_dibersihkan(self):
+        self.tahan((0, 8))
+        ReservasiStok.objects.update(kedaluwarsa=timezone.now() - timedelta(minutes=1))
+        self.checkout([self.varian[0]], jumlah=5)
+
+        call_command('lepas_reservasi_kedaluwarsa', stdout=io.StringIO())
+        self.assertFalse(ReservasiStok.objects.exists())
+
+    @override_settings(RESERVASI_DITAHAN_MENIT=0)
+    def test_tanpa_reservasi_menahan_keranjang_tidak_memesan_stok(self):
+        self.tahan((0, 8))
+        self.assertFalse(ReservasiStok.objects.exists())
+        self.checkout([self.varian[0]], jumlah=5)
+
+
+
+class StockOpnameTests(ApiTestCase):
+    URL = '/api/transactions/stock-opname/'
+
+    def setUp(self):
+        super().setUp()
+        self.varian = buat_varian(2, stok=10, purchase_price=500)
+
+    def test_hitungan_disetel_lewat_layanan_stok(self):
+        response = self.client.post(self.URL, {'items': [
+            {'varian_id': self.varian[0].id, 'physical_count': '7.5'},
+            {'varian_id': self.varian[1].id, 'physical_count': 10},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        riwayat = StockHistory.objects.get()
+        self.assertEqual(
+            (riwayat.product_id, riwayat.reason, riwayat.quantity_change, riwayat.stock_after),
+            (self.varian[0].id, StockHistory.Reason.OPNAME, Decimal('-2.5'), Decimal('7.5')),
+        )
+
+    def test_input_tidak_valid_ditolak_400_tanpa_mengubah_stok(self):
+        v = self.varian[0].id
+        for items in (
+            [{'varian_id': v, 'physical_count': 'abc'}],
+            [{'varian_id': v}],
+            [{'varian_id': v, 'physical_count': '-1'}],
+            [{'varian_id': 'x', 'physical_count': 5}],
+            [{'varian_id': v, 'physical_count': 5}, {'physical_count': 5}],
+            {'varian_id': v, 'physical_count': 5},
+        ):
+            with self.subTest(items=items):
+                response = self.client.post(self.URL, {'items': items}, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(StockHistory.objects.exists())
+        self.assertEqual(VarianProduk.objects.get(pk=v).stok, Decimal('10'))
+
+
+class SesiOpnameTests(ApiTestCase):
+    URL = '/api/transactions/sesi-opname/'
+
+    def setUp(self):
+        super().setUp()
+        self.varian = buat_varian(3, stok=10, purchase_price=500)
+
+    def hitung(self, sesi_id, *isi, tambah=False):
+        response = self.client.post(f'{self.URL}{sesi_id}/hitungan/', {
+            'items': [{'varian_id': self.varian[i].id, 'physical_count': jumlah} for i, jumlah in isi], 'tambah': tambah,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def stok(self):
+        return [v.stok for v in VarianProduk.objects.filter(id__in=[v.id for v in self.varian]).order_by('id')]
+
+    def test_penjualan_selama_sesi_tidak_terhapus_saat_komit(self):
+        response = self.client.post(self.URL, {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['jumlah_item'], 3)
+        sesi_id = response.data['id']
+
+        # Terjual sebelum dihitung: hitungan sudah mencerminkan penjualan itu
+        self.checkout([self.varian[2]], jumlah=2)
+        self.hitung(sesi_id, (0, 8), (1, 3), (2, 8))
+        # Rak kedua untuk varian yang sama dijumlahkan
+        self.hitung(sesi_id, (1, 4), tambah=True)
+        # Terjual setelah dihitung: tetap harus mengurangi stok setelah komit
+        self.checkout([self.varian[0]], jumlah=3)
+
+        response = self.client.get(f'{self.URL}{sesi_id}/selisih/')
+        self.assertEqual(response.status_code, 200)
+        ringkasan = response.data['ringkasan']
+        self.assertEqual(ringkasan['item_dihitung'], 3)
+        self.assertEqual(ringkasan['item_selisih'], 2)
+        self.assertEqual(ringkasan['total_kurang'], Decimal('-5'))
+        self.assertEqual(ringkasan['nilai_kurang'], Decimal('-2500'))
+        self.assertEqual([r['varian_id'] for r in response.data['results']], [self.varian[1].id, self.varian[0].id])
+
+        response = self.client.post(f'{self.URL}{sesi_id}/komit/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['varian_disesuaikan'], 2)
+        self.assertEqual(self.stok(), [Decimal('5'), Decimal('7'), Decimal('8')])
+        self.assertEqual(
+            sorted(StockHistory.objects.filter(reason=StockHistory.Reason.OPNAME).values_list('quantity_change', flat=True)),
+            [Decimal('-3'), Decimal('-2')],
+        )
+
+    def test_sesi_yang_sudah_ditutup_tidak_bisa_diubah(self):
+        sesi_id = self.client.post(self.URL, {}, format='json').data['id']
+        self.hitung(sesi_id, (0, 9))
+        self.assertEqual(self.client.post(f'{self.URL}{sesi_id}/batalkan/').status_code, 200)
+
+        self.assertEqual(self.client.post(f'{self.URL}{sesi_id}/komit/').status_code, 400)
+        self.assertEqual(self.client.post(f'{self.URL}{sesi_id}/batalkan/').status_code, 400)
+        response = self.client.post(f'{self.URL}{sesi_id}/hitungan/', {
+            'items': [{'varian_id': self.varian[0].id, 'physical_count': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stok(), [Decimal('10')] * 3)
+
+    def test_varian_tidak_dikenal_dilaporkan(self):
+        sesi_id = self.client.post(self.URL, {}, format='json').data['id']
+        response = self.client.post(f'{self.URL}{sesi_id}/hitungan/', {
+            'items': [{'varian_id': self.varian[0].id, 'physical_count': 1}, {'varian_id': 999999, 'physical_count': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'disimpan': 1, 'varian_tidak_dikenal': [999999]})
+
+
+
+class ManageStockTests(ApiTestCase):
+    URL = '/api/transactions/manage-stock/'
+    # Savepoint (2), validasi varian, UPDATE stok, valuasi (3), riwayat, nama varian + log aktivitas (2), purchase_price
+    QUERY_PEMBELIAN = 11
+
+    def setUp(self):
+        super().setUp()
+        # Batas stok rendah di bawah stok awal: tidak ada varian yang melewati batas
+        self.varian = buat_varian(30, stok=10, purchase_price=500, peringatan_stok_rendah=2)
+
+    def kirim(self, reason, *isi, **kwargs):
+        return self.client.post(self.URL, {'reason': reason, 'items': [
+            {'varian_id': v.id, 'quantity': jumlah, **kwargs} for v, jumlah in isi
+        ]}, format='json')
+
+    def test_pembelian_massal_dengan_jumlah_query_tetap(self):
+        for jumlah_baris in (3, 30):
+            with self.subTest(jumlah_baris=jumlah_baris):
+                isi = [(v, 5) for v in self.varian[:jumlah_baris]]
+                with self.assertNumQueries(self.QUERY_PEMBELIAN + jumlah_batch_insert(StockHistory, jumlah_baris) - 1):
+                    response = self.kirim('PEMBELIAN', *isi, purchase_price='700')
+                self.assertEqual(response.status_code, 200, response.data)
+                self.assertEqual(response.data['jumlah_baris'], jumlah_baris)
+        varian = VarianProduk.objects.get(pk=self.varian[0].pk)
+        self.assertEqual((varian.stok, varian.purchase_price), (Decimal('20'), Decimal('700')))
+        self.assertEqual(StockHistory.objects.filter(product=varian, reason='PEMBELIAN').count(), 2)
+
+    def test_varian_tidak_dikenal_atau_nonaktif_menolak_seluruh_permintaan(self):
+        nonaktif = self.varian[1]
+        nonaktif.is_active = False
+        nonaktif.save()
+        response = self.client.post(self.URL, {'reason': 'RUSAK', 'items': [
+            {'varian_id': self.varian[0].id, 'quantity': 1},
+            {'varian_id': nonaktif.id, 'quantity': 1},
+            {'varian_id': 999999, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['items'], [
+            {'index': 1, 'varian_id': nonaktif.id, 'error': 'Varian tidak aktif.'},
+            {'index': 2, 'varian_id': 999999, 'error': 'Varian tidak ditemukan.'},
+        ])
+        self.assertEqual(VarianProduk.objects.get(pk=self.varian[0].pk).stok, Decimal('10'))
+        self.assertFalse(StockHistory.objects.exists())
+
+    def test_payload_tidak_valid_ditolak_serializer(self):
+        v = self.varian[0]
+        for payload in (
+            {'reason': 'RUSAK', 'items': [{'varian_id': v.id, 'quantity': 0}]},
+            {'reason': 'RUSAK', 'items': [{'varian_id': v.id, 'quantity': 'dua'}]},
+            {'reason': 'PENJUALAN', 'items': [{'varian_id': v.id, 'quantity': 1}]},
+            {'reason': 'OPNAME', 'items': [{'varian_id': v.id, 'quantity': 1}]},
+            {'reason': 'RUSAK', 'items': []},
+        ):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.client.post(self.URL, payload, format='json').status_code, 400)
+
+    def test_stok_keluar_melebihi_stok_ditolak(self):
+        response = self.kirim('RUSAK', (self.varian[0], 4), (self.varian[1], 11))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(VarianProduk.objects.get(pk=self.varian[0].pk).stok, Decimal('10'))
+        self.assertEqual(self.kirim('RUSAK', (self.varian[0], 4), purchase_price='').status_code, 200)
+        self.assertEqual(VarianProduk.objects.get(pk=self.varian[0].pk).stok, Decimal('6'))
+
+
+
+class KursorRiwayatTests(ApiTestCase):
+    """Mode `?cursor=` di endpoint riwayat stok dan daftar transaksi."""
+    URL_RIWAYAT = '/api/transactions/stock-history/'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.varian = buat_varian(stok=0)[0]
+        for _ in range(7):
+            self.masuk()
+
+    def masuk(self):
+        return mutasi_stok(
+            [{'varian_id': self.varian.id, 'quantity_change': Decimal('1'), 'harga_satuan': Decimal('600')}],
+            StockHistory.Reason.PEMBELIAN, self.admin,
+        )[0]
+
+    def get(self, url, params=None, jumlah_query=None):
+        if jumlah_query is None:
+            response = self.client.get(url, params)
+        else:
+            with self.assertNumQueries(jumlah_query):
+                response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, getattr(response, 'data', None))
+        return response.data
+
+    def test_satu_query_per_halaman_tanpa_count(self):
+        halaman = self.get(self.URL_RIWAYAT, {'cursor': '', 'page_size': 3}, jumlah_query=1)
+        self.assertNotIn('count', halaman)
+        self.assertIsNone(halaman['previous'])
+        self.get(halaman['next'], jumlah_query=1)
+
+        halaman = self.get(self.URL_RIWAYAT, {'cursor': '', 'page_size': 3, 'hitung': 'tepat'}, jumlah_query=2)
+        self.assertEqual(halaman['count'], 7)
+
+    def test_baris_baru_tidak_menggeser_halaman_berikutnya(self):
+        lama = list(StockHistory.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        halaman = self.get(self.URL_RIWAYAT, {'cursor': '', 'page_size': 3})
+        dilihat = [r['id'] for r in halaman['results']]
+        baru = self.masuk()
+        while halaman['next']:
+            halaman = self.get(halaman['next'])
+            dilihat += [r['id'] for r in halaman['results']]
+        self.assertEqual(dilihat, lama)
+        self.assertEqual(self.get(self.URL_RIWAYAT, {'cursor': '', 'page_size': 3})['results'][0]['id'], baru.id)
+
+    def test_kursor_rusak_404(self):
+        response = self.client.get(self.URL_RIWAYAT, {'cursor': 'xyz'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_size_dibatasi_dan_diberitahukan(self):
+        halaman = self.get(self.URL_RIWAYAT, {'cursor': '', 'page_size': MAKS_HALAMAN + 500})
+        self.assertEqual((halaman['page_size'], halaman['max_page_size']), (MAKS_HALAMAN, MAKS_HALAMAN))
+
+    def test_ringkasan_transaksi_dihitung_di_halaman_pertama_saja(self):
+        for _ in range(5):
+            self.checkout([self.varian])
+        url = '/api/transactions/transaksi/'
+        pertama = self.get(url, {'cursor': '', 'page_size': 2, 'ringkas': 1})
+        self.assertEqual(pertama['summary']['jumlah_transaksi'], 5)
+        # Jumlah baris ikut dari agregat ringkasan, tanpa COUNT(*) terpisah
+        self.assertEqual(pertama['count'], 5)
+
+        Transaksi.objects.filter(id=pertama['results'][0]['id']).delete()
+        kedua = self.get(pertama['next'])
+        self.assertEqual(kedua['summary'], pertama['summary'])
+        self.assertNotIn('count', kedua)
+        self.assertEqual(self.get(url, {'cursor': '', 'page_size': 2, 'ringkas': 1})['summary']['jumlah_transaksi'], 4)
+
+
+@mock.patch.object(LowStockChangesView, 'JEDA_FEED', timedelta(0))
+class StokRendahTests(ApiTestCase):
+    URL_FEED = '/api/products/laporan/stok-rendah/perubahan/'
+    URL_JUMLAH = '/api/products/laporan/stok-rendah/count/'
+
+    def setUp(self):
+        super().setUp()
+        # Jumlah stok rendah di-cache per versi; versi kembali ke awal di setiap test
+        cache_katalog.kosongkan_lokal()
+        self.hampir, self.aman = buat_varian(2, stok=12, peringatan_stok_rendah=10)
+
+    def jumlah(self):
+        return self.client.get(self.URL_JUMLAH).data['count']
+
+    def feed(self, **params):
+        response = self.client.get(self.URL_FEED, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_perpindahan_batas_dua_arah_tercatat_di_feed(self):
+        self.assertEqual(self.jumlah(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.checkout([self.hampir], jumlah=3)
+            self.checkout([self.aman])
+        self.assertTrue(VarianProduk.objects.get(pk=self.hampir.pk).stok_rendah)
+        self.assertFalse(VarianProduk.objects.get(pk=self.aman.pk).stok_rendah)
+        self.assertEqual(self.jumlah(), 1)
+
+        # Penjualan yang tetap di bawah batas tidak mencatat apa-apa
+        with self.captureOnCommitCallbacks(execute=True):
+            self.checkout([self.hampir])
+        self.assertEqual(PerubahanStokRendah.objects.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/transactions/manage-stock/', {'reason': 'PEMBELIAN', 'items': [
+                {'varian_id': self.hampir.id, 'quantity': 10},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertFalse(VarianProduk.objects.get(pk=self.hampir.pk).stok_rendah)
+        self.assertEqual(self.jumlah(), 0)
+
+        data = self.feed()
+        self.assertEqual(
+            [(r['varian'], r['rendah'], Decimal(r['stok'])) for r in data['results']],
+            [(self.hampir.id, True, Decimal('9')), (self.hampir.id, False, Decimal('18'))],
+        )
+        self.assertEqual(data['results'][0]['nama_produk_induk'], self.hampir.produk_induk.nama_produk)
+        self.assertEqual((data['count'], data['ada_lagi']), (0, False))
+
+    def test_feed_dilanjutkan_dengan_setelah(self):
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.checkout([self.hampir], jumlah=3)
+                self.client.post('/api/transactions/manage-stock/', {'reason': 'PEMBELIAN', 'items': [
+                    {'varian_id': self.hampir.id, 'quantity': 3},
+                ]}, format='json')
+        ids = list(PerubahanStokRendah.objects.values_list('id', flat=True))
+        self.assertEqual(len(ids), 6)
+
+        halaman = self.feed(setelah=ids[0], limit=4)
+        self.assertEqual([r['id'] for r in halaman['results']], ids[1:5])
+        self.assertEqual((halaman['terakhir'], halaman['ada_lagi']), (ids[4], True))
+        halaman = self.feed(setelah=halaman['terakhir'], limit=4)
+        self.assertEqual([r['id'] for r in halaman['results']], ids[5:])
+        self.assertFalse(halaman['ada_lagi'])
+        # Tidak ada perubahan baru: `terakhir` tetap
+        self.assertEqual(self.feed(setelah=ids[-1]), {'results': [], 'terakhir': ids[-1], 'ada_lagi': False, 'count': 0})
+        # Tanpa `setelah`: perubahan terbaru, tetap urut naik
+        self.assertEqual([r['id'] for r in self.feed(limit=2)['results']], ids[-2:])
+        self.assertEqual(self.client.get(self.URL_FEED, {'setelah': 'x'}).status_code, 400)
+
+    def test_baris_terlalu_baru_ditahan_dulu(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.checkout([self.hampir], jumlah=3)
+        with mock.patch.object(LowStockChangesView, 'JEDA_FEED', timedelta(minutes=1)):
+            self.assertEqual(self.feed()['results'], [])
+        self.assertEqual(len(self.feed()['results']), 1)
+
+
+class LogAktivitasTests(ApiTestCase):
+    URL = '/api/transactions/aktivitas/'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.varian = buat_varian(stok=20)[0]
+        self.transaksi = self.checkout([self.varian], jumlah=2)
+        self.client.post('/api/transactions/manage-stock/', {'reason': 'RUSAK', 'items': [
+            {'varian_id': self.varian.id, 'quantity': 1},
+        ]}, format='json')
+        piutang = HutangPiutang.objects.create(tipe='PIUTANG', pelanggan_nama='Bu Sari', total_awal=50000)
+        self.client.post('/api/transactions/pembayaran/', {'hutang_piutang': piutang.id, 'jumlah_bayar': '20000'})
+        self.client.post('/api/transactions/setoran-simpanan/', {'nama_pelanggan': 'Pak Budi', 'jumlah': '15000'})
+
+    def get(self, params=None, jumlah_query=None, url=URL):
+        if jumlah_query is None:
+            response = self.client.get(url, params)
+        else:
+            with self.assertNumQueries(jumlah_query):
+                response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, getattr(response, 'data', None))
+        return response.data
+
+    def test_setiap_operasi_menulis_satu_log(self):
+        hasil = self.get({'cursor': ''})['results']
+        # Terbaru lebih dulu; stok keluar karena penjualan sudah tercatat sebagai transaksi
+        self.assertEqual([(r['tipe'], r['sub_tipe']) for r in hasil], [
+            ('SIMPANAN', 'MASUK'), ('PEMBAYARAN', 'PIUTANG'), ('STOK', 'RUSAK'), ('TRANSAKSI', ''),
+        ])
+        self.assertEqual([r['keterangan'] for r in hasil], [
+            'Rp 15,000 - Pak Budi', 'Rp 20,000 - Bu Sari', '-1 pada Produk 0 Biasa', 'sebesar Rp 2,000',
+        ])
+        self.assertEqual({r['user'] for r in hasil}, {'admin'})
+        self.assertEqual(hasil[-1]['objek_id'], self.transaksi['id'])
+
+    def test_filter_per_tipe(self):
+        def tipe(**params):
+            return [r['tipe'] for r in self.get({'cursor': '', **params})['results']]
+
+        self.assertEqual(tipe(tipe='STOK'), ['STOK'])
+        self.assertEqual(tipe(tipe__in='PEMBAYARAN,SIMPANAN'), ['SIMPANAN', 'PEMBAYARAN'])
+        self.assertEqual(tipe(sub_tipe='RUSAK'), ['STOK'])
+        kasir = User.objects.create(username='kasir', role='kasir')
+        self.assertEqual(tipe(tipe='STOK', user=kasir.id), [])
+
+    def test_kursor_satu_query_per_halaman(self):
+        aktivitas.catat(*[
+            LogAktivitas(tipe=LogAktivitas.Tipe.STOK, sub_tipe='OPNAME', judul=f'Opname {i}', created_at=timezone.now())
+            for i in range(8)
+        ])
+        semua = list(LogAktivitas.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        halaman = self.get({'cursor': '', 'page_size': 5}, jumlah_query=1)
+        dilihat = [r['id'] for r in halaman['results']]
+        while halaman['next']:
+            halaman = self.get(jumlah_query=1, url=halaman['next'])
+            dilihat += [r['id'] for r in halaman['results']]
+        self.assertEqual(dilihat, semua)
+
+        # Filter tetap terbawa di link halaman berikutnya
+        halaman = self.get({'cursor': '', 'page_size': 5, 'tipe': 'STOK'}, jumlah_query=1)
+        halaman = self.get(jumlah_query=1, url=halaman['next'])
+        self.assertEqual([r['tipe'] for r in halaman['results']], ['STOK'] * 4)
+        self.assertIsNone(halaman['next'])
+
+
+class RingkasanPenjualanTests(ApiTestCase):
+    """Rekap harian yang diperbarui setiap checkout harus sama dengan agregat tabel mentah."""
+
+    def setUp(self):
+        super().setUp()
+        # Tabel harga di memori dikunci versi katalog yang ikut kembali ke awal di setiap test
+        patcher = mock.patch('transactions.services.mesin_harga', MesinHarga())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.varian = buat_varian(3, harga_jual_normal=2500)
+        self.checkout(self.varian[:2], jumlah=3)
+        self.checkout(self.varian[1:], metode_pembayaran='QRIS', diskon_nominal='500')
+        self.checkout(self.varian[:1], jumlah=2, metode_pembayaran='Debit')
+        self.checkout(self.varian, jumlah=Decimal('1.5'))
+        # Transaksi yang ditahan tidak ikut dihitung
+        response = self.client.post('/api/transactions/transaksi/hold_transaction/', {
+            'detail_items': [{'varian_produk_id': self.varian[2].id, 'jumlah': 4}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def ringkasan(self):
+        return {
+            'harian': list(RingkasanPenjualanHarian.objects.order_by('tanggal').values(
+                'tanggal', 'pendapatan', 'jumlah_transaksi', 'item_terjual', *RingkasanPenjualanHarian.KOLOM_METODE.values()
+            )),
+            'varian': list(RingkasanVarianHarian.objects.order_by('tanggal', 'varian_id').values_list(
+                'tanggal', 'varian_id', 'jumlah_terjual', 'pendapatan'
+            )),
+        }
+
+    def mentah(self):
+        selesai = Transaksi.objects.filter(status='Selesai').annotate(tanggal=TruncDate('created_at'))
+        detail = DetailTransaksi.objects.filter(transaksi__status='Selesai').annotate(
+            tanggal=TruncDate('transaksi__created_at')
+        )
+        item_per_hari = dict(detail.values('tanggal').annotate(total=Sum('jumlah')).values_list('tanggal', 'total'))
+        harian = []
+        for row in selesai.values('tanggal').annotate(
+            pendapatan=Sum('total_setelah_diskon'), jumlah_transaksi=Count('id')
+        ).order_by('tanggal'):
+            per_metode = {
+                kolom: selesai.filter(tanggal=row['tanggal'], metode_pembayaran=metode).aggregate(
+                    total=Sum('total_setelah_diskon')
+                )['total'] or 0
+                for metode, kolom in RingkasanPenjualanHarian.KOLOM_METODE.items()
+            }
+            harian.append({**row, 'item_terjual': item_per_hari[row['tanggal']], **per_metode})
+        varian = list(detail.values('tanggal', 'varian_produk_terjual_id').annotate(
+            jumlah=Sum('jumlah'), pendapatan=Sum('subtotal')
+        ).order_by('tanggal', 'varian_produk_terjual_id').values_list(
+            'tanggal', 'varian_produk_terjual_id', 'jumlah', 'pendapatan'
+        ))
+        return {'harian': harian, 'varian': varian}
+
+    def test_rekap_checkout_sama_dengan_agregat_mentah(self):
+        self.assertEqual(Transaksi.objects.exclude(status='Selesai').count(), 1)
+        ringkasan = self.ringkasan()
+        self.assertEqual(ringkasan, self.mentah())
+        hari_ini = ringkasan['harian'][0]
+        self.assertEqual((hari_ini['jumlah_transaksi'], hari_ini['item_terjual']), (4, Decimal('14.5')))
+        self.assertEqual(hari_ini['pendapatan_qris'], Decimal('4500'))
+
+    def test_ubah_transaksi_lewat_api_menyamakan_rekap(self):
+        trx = list(Transaksi.objects.filter(status='Selesai').order_by('id'))
+        url = '/api/transactions/transaksi/{}/'
+        perubahan = [
+            (trx[1], {'metode_pembayaran': 'Tunai', 'total_setelah_diskon': '4000.00'}),
+            (trx[2], {'status': 'Dibatalkan'}),
+            (trx[0], {'created_at': (trx[0].created_at - timedelta(days=2)).isoformat()}),
+            (trx[2], {'status': 'Selesai', 'metode_pembayaran': 'QRIS'}),
+        ]
+        for transaksi, data in perubahan:
+            with self.subTest(data=data):
+                response = self.client.patch(url.format(transaksi.id), data, format='json')
+                self.assertEqual(response.status_code, 200, response.data)
+                self.assertEqual(self.ringkasan(), self.mentah())
+        self.assertEqual(len(self.ringkasan()['harian']), 2)
+
+        # Perubahan yang tidak menyentuh rekap tidak menjalankan query rekap
+        transaksi = Transaksi.objects.get(pk=trx[3].pk)
+        lama = copy.copy(transaksi)
+        transaksi.notes = 'Catatan baru'
+        with self.assertNumQueries(0):
+            sesuaikan_ringkasan_penjualan(lama, transaksi)
+
+    def test_hapus_transaksi_lewat_api_mengeluarkannya_dari_rekap(self):
+        for transaksi in Transaksi.objects.order_by('id'):
+            with self.subTest(transaksi=transaksi.id):
+                response = self.client.delete(f'/api/transactions/transaksi/{transaksi.id}/')
+                self.assertEqual(response.status_code, 204)
+                self.assertEqual(self.ringkasan(), self.mentah())
+        self.assertEqual(self.ringkasan(), {'harian': [], 'varian': []})
+
+    def test_rebuild_menghasilkan_rekap_yang_sama(self):
+        sebelum = self.ringkasan()
+        call_command('rebuild_ringkasan_penjualan', stdout=io.StringIO())
+        self.assertEqual(self.ringkasan(), sebelum)
+
+    def test_rebuild_memperbaiki_rekap_beberapa_hari(self):
+        # Memindah transaksi ke hari lain tanpa lewat checkout membuat rekap basi
+        pertama = Transaksi.objects.filter(status='Selesai').order_by('id').first()
+        Transaksi.objects.filter(pk=pertama.pk).update(created_at=pertama.created_at - timedelta(days=3))
+        self.assertNotEqual(self.ringkasan(), self.mentah())
+
+        call_command('rebuild_ringkasan_penjualan', stdout=io.StringIO())
+        ringkasan = self.ringkasan()
+        self.assertEqual(ringkasan, self.mentah())
+        self.assertEqual([r['jumlah_transaksi'] for r in ringkasan['harian']], [1, 3])
+
+
+class HutangPiutangTests(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.piutang = HutangPiutang.objects.create(tipe='PIUTANG', pelanggan_nama='Bu Sari', total_awal=50000)
+
+    def test_simpan_instance_basi_tidak_membatalkan_pelunasan(self):
+        # Instance dimuat sebelum pembayaran lain melunasinya
+        basi = HutangPiutang.objects.get(pk=self.piutang.pk)
+        sesuaikan_hutang_piutang(self.piutang.pk, delta_dibayar=Decimal('50000'))
+
+        basi.pelanggan_nama = 'Bu Sari Dewi'
+        basi.save()
+        self.assertEqual((basi.lunas, basi.total_dibayar), (True, Decimal('50000')))
+        self.piutang.refresh_from_db()
+        self.assertEqual((self.piutang.lunas, self.piutang.pelanggan_nama), (True, 'Bu Sari Dewi'))
+
+    def test_ubah_total_lewat_api_menghitung_ulang_lunas(self):
+        sesuaikan_hutang_piutang(self.piutang.pk, delta_dibayar=Decimal('30000'))
+        url = f'/api/transactions/hutang-piutang/{self.piutang.pk}/'
+
+        response = self.client.patch(url, {'total_awal': '30000'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['lunas'], response.data['sisa_tagihan']), (True, '0.00'))
+
+        response = self.client.patch(url, {'total_awal': '45000', 'lunas': True}, format='json')
+        self.assertEqual((response.data['lunas'], response.data['sisa_tagihan']), (False, '15000.00'))
+        self.assertFalse(HutangPiutang.objects.get(pk=self.piutang.pk).lunas)
+
+
+class QuoteTests(ApiTestCase):
+    URL = '/api/transactions/transaksi/quote/'
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('transactions.services.mesin_harga', MesinHarga())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.varian, self.biasa = buat_varian(2, harga_jual_normal=1000, harga_jual_reseller=900)
+        AturanHargaKuantitas.objects.create(varian_produk=self.varian, jumlah_minimal=6, harga_total_khusus=5000)
+
+    def quote(self, *isi, **data):
+        return self.client.post(self.URL, {
+            'detail_items': [{'varian_produk_id': v.id, 'jumlah': jumlah} for v, jumlah in isi], **data,
+        }, format='json')
+
+    def test_quote_sama_dengan_harga_checkout_tanpa_menyimpan(self):
+        response = self.quote((self.varian, 7), (self.biasa, 2))
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            [(b['jumlah'], b['harga_satuan'], b['subtotal']) for b in response.data['detail_items']],
+            [('7.000', '857.14', '6000.00'), ('2.000', '1000.00', '2000.00')],
+        )
+        self.assertEqual(response.data['total_harga'], '8000.00')
+        self.assertFalse(Transaksi.objects.exists())
+
+        trx = self.checkout([self.varian, self.biasa], jumlah=7)
+        self.assertEqual(Decimal(trx['total_harga']), Decimal('6000') + Decimal('7000'))
+
+    def test_quote_reseller(self):
+        response = self.quote((self.varian, 6), (self.biasa, 2), customer_type='Reseller')
+        self.assertEqual([b['subtotal'] for b in response.data['detail_items']], ['5000.00', '1800.00'])
+
+    def test_quote_tidak_valid_400(self):
+        self.assertEqual(self.quote((self.varian, 0)).status_code, 400)
+        response = self.client.post(self.URL, {'detail_items': [{'varian_produk_id': 999999, 'jumlah': 1}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        with mock.patch('products.mesin_harga.MAKS_TABEL', 20):
+            response = self.quote((self.varian, 21))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('melebihi 20', response.data['error'])
+
+
+class RiwayatTransaksiTests(ApiTestCase):
+    """Riwayat penjualan tertaut ke transaksinya lewat FK, bukan lewat notes yang ditulis ulang."""
+    URL = '/api/transactions/transaksi/'
+
+    def test_checkout_menautkan_riwayat_tanpa_menyentuh_riwayat_lama(self):
+        varian = buat_varian(2)
+        pertama = self.checkout(varian)
+        kedua = self.checkout(varian[:1], jumlah=3)
+
+        riwayat = StockHistory.objects.filter(reason=StockHistory.Reason.PENJUALAN)
+        self.assertEqual(
+            sorted(riwayat.values_list('transaksi_id', 'product_id', 'quantity_change', 'notes')),
+            sorted([
+                (pertama['id'], varian[0].id, -1, f"Transaksi No: {pertama['nomor_transaksi']}"),
+                (pertama['id'], varian[1].id, -1, f"Transaksi No: {pertama['nomor_transaksi']}"),
+                (kedua['id'], varian[0].id, -3, f"Transaksi No: {kedua['nomor_transaksi']}"),
+            ]),
+        )
+
+    def test_transaksi_ditahan_yang_dilanjutkan_menautkan_riwayatnya(self):
+        varian = buat_varian(2)
+        self.checkout(varian[1:])
+        keranjang = {'detail_items': [{'varian_produk_id': varian[0].id, 'jumlah': 2}]}
+        ditahan = self.client.post(self.URL + 'hold_transaction/', keranjang, format='json').data
+        self.assertFalse(StockHistory.objects.filter(transaksi_id=ditahan['id']).exists())
+
+        response = self.client.post(f"{self.URL}{ditahan['id']}/resume_transaction/", {
+            **keranjang, 'jumlah_bayar': 2000, 'metode_pembayaran': 'Tunai',
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        riwayat = StockHistory.objects.get(transaksi_id=ditahan['id'])
+        self.assertEqual((riwayat.product_id, riwayat.quantity_change), (varian[0].id, -2))
+        self.assertEqual(StockHistory.objects.filter(transaksi__isnull=True).count(), 0)
+
+    def test_backfill_migrasi_hanya_menautkan_riwayat_yang_cocok(self):
+        migrasi = importlib.import_module('transactions.migrations.0007_backfill_stockhistory_transaksi')
+        varian, lain = buat_varian(2)
+        trx = Transaksi.objects.get(id=self.checkout([varian])['id'])
+        cocok = StockHistory.objects.get(transaksi=trx)
+        catatan = f'Transaksi No: {trx.nomor_transaksi}'
+
+        def riwayat_lama(product, notes=catatan, umur=timedelta(0)):
+            h = StockHistory.objects.create(product=product, quantity_change=-1, reason=StockHistory.Reason.PENJUALAN, notes=notes)
+            StockHistory.objects.filter(pk=h.pk).update(created_at=trx.created_at - umur)
+            return h
+
+        salah_varian = riwayat_lama(lain)
+        # Korban backfill notes lama: riwayat jauh sebelum transaksinya dibuat
+        terlalu_tua = riwayat_lama(varian, umur=timedelta(days=2))
+        tanpa_transaksi = riwayat_lama(varian, notes='Transaksi No: TIDAK-ADA')
+        StockHistory.objects.filter(pk=cocok.pk).update(transaksi=None)
+
+        with mock.patch.object(migrasi, 'BATCH_SIZE', 2):
+            migrasi.tautkan_riwayat(apps, None)
+
+        tertaut = dict(StockHistory.objects.values_list('id', 'transaksi_id'))
+        self.assertEqual(tertaut[cocok.pk], trx.id)
+        for h in (salah_varian, terlalu_tua, tanpa_transaksi):
+            self.assertIsNone(tertaut[h.pk])
+
+
+class SaldoSimpananTests(ApiTestCase):
+    """Saldo tersimpan pelanggan harus selalu sama dengan jumlah riwayat simpanannya."""
+
+    def saldo_ledger(self, pelanggan):
+        masuk = pelanggan.riwayat_simpanan.filter(tipe=RiwayatSimpanan.Tipe.MASUK).aggregate(t=Sum('jumlah'))['t'] or 0
+        keluar = pelanggan.riwayat_simpanan.filter(tipe=RiwayatSimpanan.Tipe.KELUAR).aggregate(t=Sum('jumlah'))['t'] or 0
+        return masuk - keluar
+
+    def setor(self, jumlah, nama='Bu Ani'):
+        response = self.client.post('/api/transactions/setoran-simpanan/', {'nama_pelanggan': nama, 'jumlah': jumlah}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Pelanggan.objects.get(nama_pelanggan=nama)
+
+    def tarik(self, pelanggan, jumlah, **data):
+        return self.client.post('/api/transactions/penarikan-simpanan/', {
+            'pelanggan_id': pelanggan.id, 'jumlah': jumlah, **data,
+        }, format='json')
+
+    def test_saldo_sama_dengan_riwayat_setelah_setor_tarik_dan_belanja(self):
+        pelanggan = self.setor(50000)
+        self.setor(25000)
+        self.assertEqual(self.tarik(pelanggan, 10000).status_code, 201)
+        # Belanja dibayar dari simpanan dicatat sebagai penarikan
+        self.checkout(buat_varian(2), jumlah=3)
+        self.assertEqual(self.tarik(pelanggan, 6000, keterangan='Pembayaran belanja').status_code, 201)
+        # Penarikan melebihi saldo ditolak tanpa mengubah apa pun
+        response = self.tarik(pelanggan, 100000)
+        self.assertEqual(response.status_code, 400)
+
+        pelanggan.refresh_from_db()
+        self.assertEqual(pelanggan.saldo, Decimal('59000'))
+        self.assertEqual(pelanggan.saldo, self.saldo_ledger(pelanggan))
+        terakhir = pelanggan.riwayat_simpanan.latest('id')
+        self.assertEqual(terakhir.saldo_setelah, pelanggan.saldo)
+        self.assertEqual(
+            self.client.get('/api/transactions/simpanan-summary/').data['total_simpanan_aktif'], pelanggan.saldo
+        )
+
+    def test_rebuild_saldo_simpanan_memperbaiki_selisih(self):
+        ani = self.setor(50000)
+        self.tarik(ani, 20000)
+        budi = self.setor(10000, nama='Pak Budi')
+        Pelanggan.objects.filter(id=ani.id).update(saldo=12345)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_saldo_simpanan', check=True, stdout=io.StringIO())
+        ani.refresh_from_db()
+        self.assertEqual(ani.saldo, Decimal('12345'))
+
+        keluaran = io.StringIO()
+        call_command('rebuild_saldo_simpanan', stdout=keluaran)
+        self.assertIn('1 saldo pelanggan diperbaiki', keluaran.getvalue())
+        self.assertEqual(
+            dict(Pelanggan.objects.values_list('id', 'saldo')), {ani.id: Decimal('30000'), budi.id: Decimal('10000')}
+        )
+        call_command('rebuild_saldo_simpanan', check=True, stdout=io.StringIO())
+
+
+class HargaPokokTests(ApiTestCase):
+    """HPP laba-rugi memakai harga pokok yang dibekukan saat barang terjual."""
+    URL = '/api/transactions/laporan/laba-rugi/'
+
+    def cogs(self):
+        hari_ini = timezone.localdate().isoformat()
+        response = self.client.get(self.URL, {'start_date': hari_ini, 'end_date': hari_ini})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['cogs']
+
+    def test_harga_pokok_tidak_berubah_saat_harga_beli_naik(self):
+        dilacak, = buat_varian(stok=10, purchase_price=600)
+        tidak_dilacak, = buat_varian(stok=0, purchase_price=400, lacak_stok=False)
+        self.checkout([dilacak, tidak_dilacak], jumlah=2)
+        self.assertEqual(
+            sorted(DetailTransaksi.objects.values_list('harga_pokok', flat=True)), [Decimal('400'), Decimal('600')]
+        )
+        self.assertEqual(self.cogs(), Decimal('2000'))
+
+        VarianProduk.objects.filter(id__in=[dilacak.id, tidak_dilacak.id]).update(purchase_price=2000)
+        self.assertEqual(self.cogs(), Decimal('2000'))
+
+        # Penjualan berikutnya memakai harga pokok saat itu; yang lama tetap
+        self.checkout([tidak_dilacak])
+        self.assertEqual(self.cogs(), Decimal('4000'))
+
+    def test_backfill_mengisi_baris_lama_saja(self):
+        varian = buat_varian(2, stok=10, purchase_price=600)
+        self.checkout(varian)
+        lama = DetailTransaksi.objects.get(varian_produk_terjual=varian[0])
+        DetailTransaksi.objects.filter(pk=lama.pk).update(harga_pokok=None)
+        VarianProduk.objects.filter(id__in=[v.id for v in varian]).update(purchase_price=750)
+        # Baris tanpa harga pokok sementara memakai harga beli saat ini
+        self.assertEqual(self.cogs(), Decimal('1350'))
+
+        call_command('backfill_harga_pokok', batch_size=1, stdout=io.StringIO())
+
+        self.assertEqual(
+            dict(DetailTransaksi.objects.values_list('varian_produk_terjual_id', 'harga_pokok')),
+            {varian[0].id: Decimal('750'), varian[1].id: Decimal('600')},
+        )
+        self.assertEqual(self.cogs(), Decimal('1350'))
+        VarianProduk.objects.filter(id__in=[v.id for v in varian]).update(purchase_price=900)
+        self.assertEqual(self.cogs(), Decimal('1350'))
+
+
+def kumpulkan_varian_count(data):
+    """Semua nilai `varian_count` di sebuah response, di level mana pun."""
+    if isinstance(data, dict):
+        hasil = [data['varian_count']] if 'varian_count' in data else []
+        return hasil + [n for v in data.values() for n in kumpulkan_varian_count(v)]
+    if isinstance(data, list):
+        return [n for v in data for n in kumpulkan_varian_count(v)]
+    return []
+
+
+class VarianCountQueryTests(ApiTestCase):
+    """
+    Setiap daftar yang menampilkan varian mengambil `varian_count` dari anotasi
+    `VarianProduk.objects.untuk_tampilan()` (atau varian yang sudah di-prefetch),
+    jadi jumlah query tidak bergantung pada banyaknya baris.
+    """
+    URLS = [
+        '/api/products/varian-produk/',
+        '/api/products/produk/',
+        '/api/products/laporan/stok-rendah/',
+        '/api/products/laporan/produk-terlaris/',
+        '/api/transactions/dashboard-stats/',
+        '/api/transactions/transaksi/',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('transactions.services.mesin_harga', MesinHarga())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tambah_katalog(self, jumlah):
+        # Setiap produk punya dua varian berstok rendah yang keduanya terjual
+        varian = buat_varian(jumlah, stok=5)
+        varian += [
+            VarianProduk.objects.create(
+                produk_induk=v.produk_induk, nama_varian='Besar', stok=5, satuan='pcs',
+                purchase_price=600, harga_jual_normal=1000,
+            ) for v in varian
+        ]
+        self.checkout(varian)
+
+    def get(self, url):
+        # Tanpa cache katalog, agar query daftar varian benar-benar dijalankan
+        cache_katalog.kosongkan_lokal()
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return kumpulkan_varian_count(response.data)
+
+    def test_varian_count_dari_anotasi_dengan_jumlah_query_tetap(self):
+        self.tambah_katalog(1)
+        jumlah_query, sedikit = {}, {}
+        for url in self.URLS:
+            with CaptureQueriesContext(connection) as queries:
+                sedikit[url] = self.get(url)
+            jumlah_query[url] = len(queries)
+            self.assertEqual(set(sedikit[url]), {2}, url)
+
+        self.tambah_katalog(4)
+        for url in self.URLS:
+            with self.subTest(url=url):
+                with self.assertNumQueries(jumlah_query[url]):
+                    banyak = self.get(url)
+                self.assertGreater(len(banyak), len(sedikit[url]))
+                self.assertEqual(set(banyak), {2})
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class StokKonkurenTests(TransactionTestCase):
+    """
+    Beberapa kasir dan admin gudang mengubah stok varian yang sama secara
+    bersamaan. Butuh database dengan row lock (Postgres); SQLite in-memory
+    tidak bisa dipakai bersama oleh beberapa thread.
+    """
+    JUMLAH_THREAD = 8
+    OPERASI_PER_THREAD = 6
+    STOK_AWAL = Decimal('60')
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='admin')
+        self.varian = buat_varian(stok=0, purchase_price=600)[0]
+        jalankan_dengan_retry(
+            mutasi_stok, [{'varian_id': self.varian.id, 'quantity_change': self.STOK_AWAL, 'harga_satuan': Decimal('600')}],
+            StockHistory.Reason.AWAL, self.admin,
+        )
+
+    def _pekerja(self, nomor, mulai, berhasil, gagal):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        mulai.wait()
+        try:
+            for i in range(self.OPERASI_PER_THREAD):
+                jenis = (nomor + i) % 3
+                if jenis == 0:
+                    response = client.post('/api/transactions/transaksi/', {
+                        'detail_items': [{'varian_produk_id': self.varian.id, 'jumlah': 3}],
+                        'jumlah_bayar': 3000, 'metode_pembayaran': 'Tunai',
+                    }, format='json')
+                    delta = Decimal('-3')
+                else:
+                    reason, delta = ('RUSAK', Decimal('-2')) if jenis == 1 else ('PEMBELIAN', Decimal('1'))
+                    response = client.post('/api/transactions/manage-stock/', {
+                        'reason': reason,
+                        'items': [{'varian_id': self.varian.id, 'quantity': abs(delta), 'purchase_price': 600}],
+                    }, format='json')
+                if response.status_code in (200, 201):
+                    berhasil.append(delta)
+                elif response.status_code == 400:
+                    # Ditolak karena stok tidak cukup, tidak boleh mengubah apa pun
+                    gagal.append(delta)
+                else:
+                    raise AssertionError(f'Status {response.status_code}: {response.data}')
+        finally:
+            connection.close()
+
+    def test_tidak_ada_lost_update_dan_stok_tidak_pernah_negatif(self):
+        mulai = threading.Barrier(self.JUMLAH_THREAD)
+        berhasil, gagal, error = [], [], []
+
+        def jalankan(nomor):
+            try:
+                self._pekerja(nomor, mulai, berhasil, gagal)
+            except Exception as e:  # diteruskan ke thread utama
+                error.append(e)
+
+        threads = [threading.Thread(target=jalankan, args=(n,)) for n in range(self.JUMLAH_THREAD)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(error, [])
+
+        self.varian.refresh_from_db()
+        self.assertEqual(len(berhasil) + len(gagal), self.JUMLAH_THREAD * self.OPERASI_PER_THREAD)
+        # Permintaan keluar melebihi stok, jadi sebagian harus ditolak
+        self.assertTrue(gagal)
+        self.assertEqual(self.varian.stok, self.STOK_AWAL + sum(berhasil))
+        self.assertGreaterEqual(self.varian.stok, 0)
+
+        riwayat = StockHistory.objects.filter(product=self.varian)
+        self.assertEqual(riwayat.aggregate(total=Sum('quantity_change'))['total'], self.varian.stok)
+        self.assertEqual(riwayat.count(), len(berhasil) + 1)
+        berjalan = Decimal('0')
+        for quantity_change, stock_after in riwayat.order_by('id').values_list('quantity_change', 'stock_after'):
+            berjalan += quantity_change
+            self.assertEqual(stock_after, berjalan)
+            self.assertGreaterEqual(stock_after, 0)
@@ -21,7 +21,10 @@ from .views import (
     SetoranSimpananView,
     SimpananSummaryView,
     PenarikanSimpananView,
-    KasbonHistoryView
+    KasbonHistoryView,
+    NilaiPersediaanView,
+    SesiOpnameViewSet,
+    LogAktivitasViewSet
 )
 
 router = DefaultRouter()
@@ -32,6 +35,8 @@ router.register(r'stock-history', StockHistoryViewSet, basename='stock-history')
 router.register(r'expenses', ExpenseViewSet, basename='expense')
 router.register(r'pelanggan', PelangganViewSet, basename='pelanggan')
 router.register(r'riwayat-simpanan', RiwayatSimpananViewSet, basename='riwayat-simpanan')
+router.register(r'sesi-opname', SesiOpnameViewSet, basename='sesi-opname')
+router.register(r'aktivitas', LogAktivitasViewSet, basename='aktivitas')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -44,6 +49,7 @@ urlpatterns = [
     path('hutang-piutang-summary/', HutangPiutangSummaryView.as_view(), name='hutang-piutang-summary'),
     path('laporan/arus-kas/', CashFlowReportView.as_view(), name='laporan-arus-kas'),
     path('laporan/laba-rugi/', ProfitLossReportView.as_view(), name='laporan-laba-rugi'),
+    path('laporan/nilai-persediaan/', NilaiPersediaanView.as_view(), name='laporan-nilai-persediaan'),
     path('aktivitas-terbaru/', RecentActivityView.as_view(), name='aktivitas-terbaru'),
     path('kasbon-history/', KasbonHistoryView.as_view(), name='kasbon-history'),
     path('setoran-simpanan/', SetoranSimpananView.as_view(), name='setoran-simpanan'),
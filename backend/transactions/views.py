@@ -3,33 +3,50 @@
 from django.db import transaction, models
 from rest_framework import viewsets, status, views
 from rest_framework.decorators import action
-from decimal import Decimal
 from itertools import chain
 from operator import itemgetter
 from django.utils import timezone
-from django.db.models import Sum, Count, F, DecimalField, Value, ExpressionWrapper
-from django.db.models.functions import Coalesce, Cast, TruncDay
+from django.db.models import (
+    Sum, Count, F, Q, DecimalField, Value, ExpressionWrapper, Prefetch, OuterRef, Subquery, Exists, Case, When
+)
+from django.db.models.functions import Coalesce, Cast
 from datetime import timedelta
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend 
 from rest_framework.filters import SearchFilter
-from pos_project.pagination import StandardResultsSetPagination
+from pos_project.pagination import StandardResultsSetPagination, RiwayatPagination
+from pos_project.daterange import rentang_waktu, filter_rentang
+import copy
 import csv
-from django.http import HttpResponse
+import hashlib
+import zlib
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
 from .models import (
-    Transaksi, DetailTransaksi, HutangPiutang, Pembayaran, StockHistory, StoreInfo, Expense, Pelanggan, RiwayatSimpanan
+    Transaksi, DetailTransaksi, HutangPiutang, Pembayaran, StockHistory, StoreInfo, Expense, Pelanggan, RiwayatSimpanan,
+    RingkasanPenjualanHarian, RingkasanVarianHarian, SesiOpname, ItemOpname, LogAktivitas
 )
 from products.models import VarianProduk, Produk
+from products.stok_rendah import jumlah_stok_rendah
 from products.serializers import VarianProdukSerializer
 from .serializers import (
-    TransaksiReadSerializer, TransaksiCreateSerializer,
+    TransaksiReadSerializer, TransaksiRingkasSerializer, TransaksiCreateSerializer,
     HutangPiutangSerializer, PiutangCreateSerializer, HutangCreateSerializer,
     PembayaranSerializer, PembayaranReadSerializer,
     StockHistorySerializer, StoreInfoSerializer, ExpenseSerializer,
     PelangganSerializer, RiwayatSimpananSerializer, SetoranSimpananSerializer,
-    PenarikanSimpananSerializer, AddAmountSerializer
+    PenarikanSimpananSerializer, AddAmountSerializer, SesiOpnameSerializer, HitunganOpnameSerializer,
+    StockOpnameItemSerializer, ManageStockSerializer, LogAktivitasSerializer
+)
+from . import aktivitas
+from .services import (
+    proses_checkout, selesaikan_transaksi_ditahan, tahan_transaksi, perbarui_transaksi_ditahan,
+    hitung_harga_keranjang, mutasi_manual, setel_stok,
+    buka_sesi_opname, catat_hitungan_opname, komit_sesi_opname,
+    catat_simpanan, sesuaikan_hutang_piutang, sesuaikan_ringkasan_penjualan, jalankan_dengan_retry,
+    CheckoutError, StokTidakCukupError, SaldoTidakCukupError, OpnameError, VarianTidakValidError
 )
 
 class TransaksiViewSet(viewsets.ModelViewSet):
@@ -37,8 +54,8 @@ class TransaksiViewSet(viewsets.ModelViewSet):
     API untuk mengelola Transaksi.
     Logika pembuatan transaksi (POST) disesuaikan dengan model stok per varian.
     """
-    queryset = Transaksi.objects.select_related('kasir').all().order_by('-created_at')
-    pagination_class = StandardResultsSetPagination
+    queryset = Transaksi.objects.select_related('kasir').all().order_by('-created_at', '-id')
+    pagination_class = RiwayatPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = {
         'created_at': ['gte', 'lte'],
@@ -47,19 +64,73 @@ class TransaksiViewSet(viewsets.ModelViewSet):
         'status': ['exact']
     }
     
+    def _ringkas(self):
+        return self.action == 'list' and self.request.query_params.get('ringkas') in ('1', 'true')
+
+    @staticmethod
+    def _prefetch_detail(queryset):
+        # Satu query per level relasi, bukan per item: varian beserta produk induk,
+        # kategori, pemasok, aturan harga dan varian_count dimuat sekaligus
+        return queryset.prefetch_related(
+            'detail_items',
+            Prefetch(
+                'detail_items__varian_produk_terjual',
+                queryset=VarianProduk.objects.untuk_tampilan()
+            ),
+        )
+
+    def _baca(self, instance):
+        """Memuat ulang transaksi dengan prefetch lengkap untuk response."""
+        return self._prefetch_detail(Transaksi.objects.select_related('kasir')).get(pk=instance.pk)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ['list', 'retrieve']:
+            return queryset
+        if self._ringkas():
+            return queryset.prefetch_related('detail_items__varian_produk_terjual__produk_induk')
+        return self._prefetch_detail(queryset)
+
     def get_serializer_class(self, *args, **kwargs):
         if self.action in ['create', 'resume_transaction']:
             return TransaksiCreateSerializer
+        if self._ringkas():
+            return TransaksiRingkasSerializer
         return TransaksiReadSerializer
 
+    # Parameter yang tidak mengubah himpunan transaksi, jadi tidak ikut kunci cache ringkasan
+    PARAM_NON_FILTER = ('page', 'page_size', 'cursor', 'hitung', 'ringkas')
+    CACHE_RINGKASAN_DETIK = 600
+
+    def _ringkasan(self, queryset):
+        """
+        Ringkasan (total penjualan, jumlah transaksi) untuk filter aktif.
+        Dihitung ulang di halaman pertama lalu disimpan per tanda tangan filter;
+        halaman berikutnya memakai cache agar tidak mengulang agregat penuh.
+        """
+        params = sorted(
+            (k, v) for k, v in self.request.query_params.lists() if k not in self.PARAM_NON_FILTER
+        )
+        kunci = 'ringkasan-transaksi:' + hashlib.md5(repr(params).encode()).hexdigest()
+        if self.paginator is None or not self.paginator.halaman_pertama(self.request):
+            summary = cache.get(kunci)
+            if summary is not None:
+                return summary, False
+        summary = queryset.aggregate(
+            total_penjualan=Coalesce(Sum('total_setelah_diskon'), Value(0, output_field=DecimalField())),
+            jumlah_transaksi=Count('id')
+        )
+        cache.set(kunci, summary, self.CACHE_RINGKASAN_DETIK)
+        return summary, True
+
     def list(self, request, *args, **kwargs):
         
         filtered_queryset = self.filter_queryset(self.get_queryset())
 
-        summary = filtered_queryset.aggregate(
-            total_penjualan=Coalesce(Sum('total_setelah_diskon'), Value(0, output_field=DecimalField())),
-            jumlah_transaksi=Count('id')
-        )
+        summary, segar = self._ringkasan(filtered_queryset)
+        if segar and self.paginator is not None and not request.query_params.get('hitung'):
+            # Jumlah transaksi di ringkasan = jumlah baris; paginator tidak perlu COUNT(*) lagi
+            self.paginator.jumlah_diketahui = summary['jumlah_transaksi']
 
         page = self.paginate_queryset(filtered_queryset)
         if page is not None:
@@ -74,82 +145,32 @@ class TransaksiViewSet(viewsets.ModelViewSet):
             'results': serializer.data
         })
 
-    @transaction.atomic
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
         detail_items_data = data.pop('detail_items')
-        kasir = request.user
 
-        total_harga = Decimal('0.0')
-        items_to_create = []
-
-        for item_data in detail_items_data:
-            try:
-                varian = VarianProduk.objects.get(id=item_data['varian_produk_id'])
-            except VarianProduk.DoesNotExist:
-                return Response({'error': f"Varian produk dengan ID {item_data['varian_produk_id']} tidak ditemukan."}, status=status.HTTP_400_BAD_REQUEST)
-
-            if varian.lacak_stok and varian.stok < item_data['jumlah']:
-                return Response({'error': f"Stok untuk '{varian}' tidak mencukupi. Sisa: {varian.stok}"}, status=status.HTTP_400_BAD_REQUEST)
-
-            subtotal = varian.harga_jual_normal * item_data['jumlah']
-            total_harga += subtotal
-
-            if varian.lacak_stok:
-                varian.stok -= item_data['jumlah']
-                varian.save()
-                
-                StockHistory.objects.create(
-                    product=varian,
-                    quantity_change=-item_data['jumlah'],
-                    stock_after=varian.stok,
-                    reason=StockHistory.Reason.PENJUALAN,
-                    user=kasir
-                )
+        try:
+            transaksi_baru = jalankan_dengan_retry(proses_checkout, request.user, data, detail_items_data)
+        except CheckoutError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            items_to_create.append({
-                'varian': varian, 'jumlah': item_data['jumlah'],
-                'harga_saat_transaksi': varian.harga_jual_normal, 'subtotal': subtotal
-            })
+        response_serializer = TransaksiReadSerializer(self._baca(transaksi_baru))
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
-        diskon = data.get('diskon_nominal', Decimal('0.0'))
-        total_setelah_diskon = total_harga - diskon
-        jumlah_bayar = data['jumlah_bayar']
-        kembalian = jumlah_bayar - total_setelah_diskon
-
-        if kembalian < 0:
-            return Response({'error': 'Jumlah bayar tidak mencukupi.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        transaksi_baru = Transaksi.objects.create(
-            kasir=kasir,
-            total_harga=total_harga,
-            diskon_nominal=diskon,
-            total_setelah_diskon=total_setelah_diskon,
-            jumlah_bayar=jumlah_bayar,
-            kembalian=kembalian,
-            metode_pembayaran=data['metode_pembayaran'],
-            customer_type=data.get('customer_type', 'Biasa'),
-            status='Selesai'  # PERBAIKAN: Pastikan status diatur ke 'Selesai'
-        )
-        
-        StockHistory.objects.filter(product__in=[item['varian'] for item in items_to_create], user=kasir).update(notes=f"Transaksi No: {transaksi_baru.nomor_transaksi}")
-
-        for item in items_to_create:
-            DetailTransaksi.objects.create(
-                transaksi=transaksi_baru,
-                varian_produk_terjual=item['varian'],
-                jumlah=item['jumlah'],
-                harga_saat_transaksi=item['harga_saat_transaksi'],
-                subtotal=item['subtotal']
-            )
+    @transaction.atomic
+    def perform_update(self, serializer):
+        # Rekap harian hanya diperbarui saat checkout, jadi perubahan lewat API disamakan di sini
+        lama = copy.copy(serializer.instance)
+        sesuaikan_ringkasan_penjualan(lama, serializer.save())
 
-        response_serializer = TransaksiReadSerializer(transaksi_baru)
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        sesuaikan_ringkasan_penjualan(instance)
+        instance.delete()
     
     @action(detail=True, methods=['patch'])
-    @transaction.atomic
     def update_held_transaction(self, request, pk=None):
         instance = self.get_object()
         if instance.status != 'Ditahan':
@@ -161,33 +182,15 @@ class TransaksiViewSet(viewsets.ModelViewSet):
         data = serializer.validated_data
         detail_items_data = data.get('detail_items', [])
 
-        # Hapus detail lama dan buat yang baru
-        instance.detail_items.all().delete()
-        
-        total_harga = Decimal('0.0')
-        for item_data in detail_items_data:
-            varian = VarianProduk.objects.get(id=item_data['varian_produk_id'])
-            subtotal = varian.harga_jual_normal * item_data['jumlah']
-            total_harga += subtotal
-            DetailTransaksi.objects.create(
-                transaksi=instance,
-                varian_produk_terjual_id=item_data['varian_produk_id'],
-                jumlah=item_data['jumlah'],
-                harga_saat_transaksi=varian.harga_jual_normal,
-                subtotal=subtotal
-            )
-        
-        # Update total di transaksi induk
-        instance.total_harga = total_harga
-        instance.total_setelah_diskon = total_harga # Asumsi diskon direset
-        instance.customer_type = data.get('customer_type', instance.customer_type)
-        instance.save()
+        try:
+            instance = jalankan_dengan_retry(perbarui_transaksi_ditahan, instance, data, detail_items_data)
+        except CheckoutError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        response_serializer = TransaksiReadSerializer(instance)
+        response_serializer = TransaksiReadSerializer(self._baca(instance))
         return Response(response_serializer.data, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['post'])
-    @transaction.atomic
     def hold_transaction(self, request, *args, **kwargs):
         serializer = TransaksiCreateSerializer(data=request.data, partial=True) # partial=True karena tidak ada data pembayaran
         serializer.is_valid(raise_exception=True)
@@ -197,38 +200,38 @@ class TransaksiViewSet(viewsets.ModelViewSet):
         if not detail_items_data:
             return Response({'error': 'Keranjang tidak boleh kosong.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        total_harga = Decimal('0.0')
-        for item_data in detail_items_data:
-            varian = VarianProduk.objects.get(id=item_data['varian_produk_id'])
-            subtotal = varian.harga_jual_normal * item_data['jumlah'] # Harga akan dihitung ulang saat dilanjutkan
-            total_harga += subtotal
-        
-        # Buat transaksi dengan status 'Ditahan'
-        transaksi_ditahan = Transaksi.objects.create(
-            kasir=request.user,
-            total_harga=total_harga,
-            total_setelah_diskon=total_harga,
-            jumlah_bayar=0,
-            kembalian=0,
-            customer_type=data.get('customer_type', 'Biasa'),
-            status='Ditahan',
-            notes=data.get('notes', None) # Tambahkan ini
-        )
-        for item_data in detail_items_data:
-            DetailTransaksi.objects.create(
-                transaksi=transaksi_ditahan,
-                varian_produk_terjual_id=item_data['varian_produk_id'],
-                jumlah=item_data['jumlah'],
-                harga_saat_transaksi=VarianProduk.objects.get(id=item_data['varian_produk_id']).harga_jual_normal,
-                subtotal=VarianProduk.objects.get(id=item_data['varian_produk_id']).harga_jual_normal * item_data['jumlah']
-            )
+        try:
+            transaksi_ditahan = jalankan_dengan_retry(tahan_transaksi, request.user, data, detail_items_data)
+        except CheckoutError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        response_serializer = TransaksiReadSerializer(transaksi_ditahan)
+        response_serializer = TransaksiReadSerializer(self._baca(transaksi_ditahan))
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def quote(self, request, *args, **kwargs):
+        """
+        Menghitung harga keranjang (aturan harga kuantitas dan harga reseller)
+        dengan mesin harga yang sama seperti checkout, tanpa menyimpan apa pun.
+        """
+        serializer = TransaksiCreateSerializer(data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            baris, total_harga = hitung_harga_keranjang(data.get('detail_items', []), data.get('customer_type', 'Biasa'))
+        except CheckoutError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'detail_items': [{
+                'varian_produk_id': b['varian_id'], 'jumlah': str(b['jumlah']),
+                'harga_satuan': str(b['harga_satuan']), 'subtotal': str(b['subtotal'])
+            } for b in baris],
+            'total_harga': str(total_harga),
+        })
+
     # --- AKSI BARU UNTUK MELANJUTKAN TRANSAKSI ---
     @action(detail=True, methods=['post'])
-    @transaction.atomic
     def resume_transaction(self, request, pk=None):
         instance = self.get_object()
         if instance.status != 'Ditahan':
@@ -237,43 +240,19 @@ class TransaksiViewSet(viewsets.ModelViewSet):
         serializer = TransaksiCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         payment_data = serializer.validated_data
-        
+
         # Di sini kita akan mengurangi stok
-        total_harga_final = Decimal('0.0')
-        for detail in instance.detail_items.all():
-            varian = detail.varian_produk_terjual
-            if varian.lacak_stok and varian.stok < detail.jumlah:
-                return Response({'error': f"Stok untuk '{varian}' tidak mencukupi."}, status=status.HTTP_400_BAD_REQUEST)
-            
-            if varian.lacak_stok:
-                varian.stok -= detail.jumlah
-                varian.save()
-                StockHistory.objects.create(
-                    product=varian,
-                    quantity_change=-detail.jumlah,
-                    stock_after=varian.stok,
-                    reason=StockHistory.Reason.PENJUALAN,
-                    user=request.user,
-                    notes=f"Transaksi No: {instance.nomor_transaksi}"
-                )
-            total_harga_final += detail.subtotal # Gunakan subtotal yang sudah tersimpan
-
-        # Update transaksi dengan data pembayaran
-        instance.total_harga = total_harga_final
-        instance.diskon_nominal = payment_data.get('diskon_nominal', 0)
-        instance.total_setelah_diskon = total_harga_final - instance.diskon_nominal
-        instance.jumlah_bayar = payment_data['jumlah_bayar']
-        instance.kembalian = instance.jumlah_bayar - instance.total_setelah_diskon
-        instance.metode_pembayaran = payment_data['metode_pembayaran']
-        instance.status = 'Selesai'
-        instance.save()
-        
-        response_serializer = TransaksiReadSerializer(instance)
+        try:
+            instance = jalankan_dengan_retry(selesaikan_transaksi_ditahan, instance, request.user, payment_data)
+        except CheckoutError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response_serializer = TransaksiReadSerializer(self._baca(instance))
         return Response(response_serializer.data, status=status.HTTP_200_OK)
 
 
 class HutangPiutangViewSet(viewsets.ModelViewSet):
-    queryset = HutangPiutang.objects.all().order_by('-created_at')
+    queryset = HutangPiutang.objects.select_related('supplier').all().order_by('-created_at')
     serializer_class = HutangPiutangSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter] 
     filterset_fields = ['tipe', 'lunas']
@@ -312,8 +291,8 @@ class HutangPiutangViewSet(viewsets.ModelViewSet):
         amount_to_add = serializer.validated_data['amount_to_add']
 
         # Tambahkan nominal baru ke total yang lama
-        instance.total_awal += amount_to_add
-        instance.save()
+        sesuaikan_hutang_piutang(instance.id, delta_total=amount_to_add)
+        instance.refresh_from_db()
 
         # Kembalikan data yang sudah diperbarui
         read_serializer = HutangPiutangSerializer(instance)
@@ -327,13 +306,12 @@ class HutangPiutangSummaryView(APIView):
         if not tipe:
             return Response({'error': 'Parameter tipe (HUTANG/PIUTANG) dibutuhkan.'}, status=400)
 
-        # Hitung total awal dari semua item
-        total_awal_agg = HutangPiutang.objects.filter(tipe=tipe).aggregate(total=Sum('total_awal'))
-        total_awal = total_awal_agg['total'] or 0
-
-        # Hitung total yang sudah dibayar dari semua pembayaran terkait
-        total_dibayar_agg = Pembayaran.objects.filter(hutang_piutang__tipe=tipe).aggregate(total=Sum('jumlah_bayar'))
-        total_dibayar = total_dibayar_agg['total'] or 0
+        # Hitung total awal dan total yang sudah dibayar dalam satu query
+        totals = HutangPiutang.objects.filter(tipe=tipe).aggregate(
+            total_awal=Sum('total_awal'), total_dibayar=Sum('total_dibayar')
+        )
+        total_awal = totals['total_awal'] or 0
+        total_dibayar = totals['total_dibayar'] or 0
 
         sisa_tagihan = total_awal - total_dibayar
 
@@ -365,57 +343,67 @@ class PembayaranViewSet(viewsets.ModelViewSet):
             return PembayaranReadSerializer
         return PembayaranSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
         pembayaran = serializer.save(dicatat_oleh=self.request.user)
-        # Update status lunas pada HutangPiutang terkait secara otomatis
-        pembayaran.hutang_piutang.save()
+        # Update total dibayar & status lunas pada HutangPiutang terkait secara otomatis
+        sesuaikan_hutang_piutang(pembayaran.hutang_piutang_id, delta_dibayar=pembayaran.jumlah_bayar)
+        aktivitas.catat(aktivitas.log_pembayaran(
+            pembayaran, HutangPiutang.objects.select_related('supplier').get(id=pembayaran.hutang_piutang_id)
+        ))
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        lama_id, lama_jumlah = serializer.instance.hutang_piutang_id, serializer.instance.jumlah_bayar
+        pembayaran = serializer.save()
+        sesuaikan_hutang_piutang(lama_id, delta_dibayar=-lama_jumlah)
+        sesuaikan_hutang_piutang(pembayaran.hutang_piutang_id, delta_dibayar=pembayaran.jumlah_bayar)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        sesuaikan_hutang_piutang(instance.hutang_piutang_id, delta_dibayar=-instance.jumlah_bayar)
+        instance.delete()
 
 class ManageStockView(APIView):
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
-        items = request.data.get('items', [])
-        reason = request.data.get('reason')
-
-        if not all([items, reason]):
-            return Response({'error': 'Data tidak lengkap.'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ManageStockSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
 
-        for item in items:
-            varian_id = item.get('varian_id')
-            quantity = Decimal(item.get('quantity', 0))
+        try:
+            riwayat = jalankan_dengan_retry(mutasi_manual, data['items'], data['reason'], request.user, data.get('notes'))
+        except VarianTidakValidError as e:
+            return Response({'error': str(e), 'items': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except StokTidakCukupError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'success': 'Stok berhasil diperbarui.', 'jumlah_baris': len(riwayat)}, status=status.HTTP_200_OK)
 
-            try:
-                varian = VarianProduk.objects.get(id=varian_id)
-            except VarianProduk.DoesNotExist:
-                continue 
 
-            quantity_change = quantity if reason == 'PEMBELIAN' else -quantity
-            
-            varian.stok += quantity_change
-            
-            if reason == 'PEMBELIAN' and 'purchase_price' in item and item['purchase_price']:
-                varian.purchase_price = Decimal(item.get('purchase_price'))
-            
-            varian.save()
-
-            StockHistory.objects.create(
-                product=varian,
-                quantity_change=quantity_change,
-                stock_after=varian.stok,
-                reason=reason,
-                notes=item.get('notes', ''),
-                user=request.user
-            )
-        return Response({'success': 'Stok berhasil diperbarui.'}, status=status.HTTP_200_OK)
+class LogAktivitasViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Feed aktivitas toko dari LogAktivitas. Pakai `?cursor=` untuk keyset
+    pagination (satu query berindex per halaman), filter `?tipe=`,
+    `?tipe__in=STOK,SIMPANAN`, `?sub_tipe=` dan `?user=`.
+    """
+    queryset = LogAktivitas.objects.all().order_by('-created_at', '-id')
+    serializer_class = LogAktivitasSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        'tipe': ['exact', 'in'],
+        'sub_tipe': ['exact'],
+        'user': ['exact'],
+    }
+    pagination_class = RiwayatPagination
 
 
 class StockHistoryViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = StockHistory.objects.select_related('product', 'user').all().order_by('-created_at')
+    queryset = StockHistory.objects.select_related('product__produk_induk', 'user').all().order_by('-created_at', '-id')
     serializer_class = StockHistorySerializer
     filter_backends = [DjangoFilterBackend, SearchFilter]
     filterset_fields = ['product', 'reason', 'user']
-    pagination_class = StandardResultsSetPagination
+    pagination_class = RiwayatPagination
     search_fields = ['product__nama_varian', 'product__produk_induk__nama_produk']
 
 
@@ -473,59 +461,61 @@ class DashboardStatsView(APIView):
         time_range = request.query_params.get('range', 'today')
         start_date, end_date, prev_start, prev_end = self._get_date_ranges(time_range)
 
-        # Querysets
-        trx_current = Transaksi.objects.filter(created_at__date__range=[start_date, end_date], status='Selesai')
-        trx_previous = Transaksi.objects.filter(created_at__date__range=[prev_start, prev_end], status='Selesai')
-        details_current = DetailTransaksi.objects.filter(transaksi__in=trx_current)
-        details_previous = DetailTransaksi.objects.filter(transaksi__in=trx_previous)
+        # Semua KPI diambil dari rekap harian, periode sekarang dan sebelumnya dalam satu query
+        current = Q(tanggal__range=[start_date, end_date])
+        previous = Q(tanggal__range=[prev_start, prev_end])
+        nol = Value(0, output_field=DecimalField())
+        kpi = RingkasanPenjualanHarian.objects.filter(current | previous).aggregate(
+            rev_current=Coalesce(Sum('pendapatan', filter=current), nol),
+            rev_previous=Coalesce(Sum('pendapatan', filter=previous), nol),
+            trx_count_current=Coalesce(Sum('jumlah_transaksi', filter=current), 0),
+            trx_count_previous=Coalesce(Sum('jumlah_transaksi', filter=previous), 0),
+            items_sold_current=Coalesce(Sum('item_terjual', filter=current), nol),
+            items_sold_previous=Coalesce(Sum('item_terjual', filter=previous), nol),
+            **{
+                metode: Coalesce(Sum(kolom, filter=current), nol)
+                for metode, kolom in RingkasanPenjualanHarian.KOLOM_METODE.items()
+            }
+        )
 
         # Kalkulasi KPI
-        rev_current = trx_current.aggregate(total=Sum('total_setelah_diskon'))['total'] or 0
-        rev_previous = trx_previous.aggregate(total=Sum('total_setelah_diskon'))['total'] or 0
-        rev_trend, rev_text = self._calculate_trend(rev_current, rev_previous)
+        rev_current = kpi['rev_current']
+        rev_trend, rev_text = self._calculate_trend(rev_current, kpi['rev_previous'])
 
-        trx_count_current = trx_current.count()
-        trx_count_previous = trx_previous.count()
-        trx_trend, trx_text = self._calculate_trend(trx_count_current, trx_count_previous)
+        trx_count_current = kpi['trx_count_current']
+        trx_trend, trx_text = self._calculate_trend(trx_count_current, kpi['trx_count_previous'])
 
-        items_sold_current = details_current.aggregate(total=Sum('jumlah'))['total'] or 0
-        items_sold_previous = details_previous.aggregate(total=Sum('jumlah'))['total'] or 0
-        items_trend, items_text = self._calculate_trend(items_sold_current, items_sold_previous)
+        items_sold_current = kpi['items_sold_current']
+        items_trend, items_text = self._calculate_trend(items_sold_current, kpi['items_sold_previous'])
         
-        low_stock_count = VarianProduk.objects.filter(stok__lte=F('peringatan_stok_rendah'), lacak_stok=True).count()
+        low_stock_count = jumlah_stok_rendah()
 
-        payment_method_summary = list(trx_current
-            .values('metode_pembayaran')
-            .annotate(total=Sum('total_setelah_diskon'))
-            .order_by('-total')
+        payment_method_summary = sorted(
+            [{'name': metode, 'total': kpi[metode]} for metode in RingkasanPenjualanHarian.KOLOM_METODE if kpi[metode]],
+            key=itemgetter('total'), reverse=True
         )
-        # Mengganti nama key agar sesuai dengan frontend
-        for item in payment_method_summary:
-            item['name'] = item.pop('metode_pembayaran')
 
         # Data Grafik Pendapatan
-        revenue_chart_data = list(trx_current
-            .annotate(date=TruncDay('created_at'))
-            .values('date')
-            .annotate(total_pendapatan=Sum('total_setelah_diskon'))
-            .order_by('date')
-        )
-        for item in revenue_chart_data:
-            item['date'] = item['date'].strftime('%d %b')
+        revenue_chart_data = [
+            {'date': row['tanggal'].strftime('%d %b'), 'total_pendapatan': row['pendapatan']}
+            for row in RingkasanPenjualanHarian.objects.filter(
+                current, jumlah_transaksi__gt=0
+            ).order_by('tanggal').values('tanggal', 'pendapatan')
+        ]
 
         # Produk Terlaris
-        top_variants_data = DetailTransaksi.objects.filter(
-            transaksi__created_at__date__gte=start_date
-        ).values('varian_produk_terjual_id').annotate(
-            total_sold=Sum('jumlah')
+        top_variants_data = RingkasanVarianHarian.objects.filter(
+            tanggal__gte=start_date
+        ).values('varian_id').annotate(
+            total_sold=Sum('jumlah_terjual')
         ).order_by('-total_sold')[:5]
 
         # 2. Ambil ID varian dan buat dictionary untuk mapping (sudah benar)
-        top_variant_ids = [item['varian_produk_terjual_id'] for item in top_variants_data]
-        sold_map = {item['varian_produk_terjual_id']: item['total_sold'] for item in top_variants_data}
+        top_variant_ids = [item['varian_id'] for item in top_variants_data]
+        sold_map = {item['varian_id']: item['total_sold'] for item in top_variants_data}
         
         # 3. Ambil objek VarianProduk berdasarkan ID (sudah benar)
-        best_sellers_qs = VarianProduk.objects.filter(id__in=top_variant_ids)
+        best_sellers_qs = VarianProduk.objects.untuk_tampilan().filter(id__in=top_variant_ids)
         
         # 4. Serialisasi data (sudah benar)
         serializer = VarianProdukSerializer(best_sellers_qs, many=True)
@@ -538,29 +528,10 @@ class DashboardStatsView(APIView):
         # 6. TAMBAHAN: Urutkan kembali berdasarkan jumlah terjual
         sorted_best_sellers = sorted(best_sellers_data, key=lambda x: x['total_sold'], reverse=True)
 
-        recent_transactions = Transaksi.objects.filter(status='Selesai').order_by('-created_at')[:5]
-        # Pastikan kita mengambil relasi produk induk
-        recent_stock_changes = StockHistory.objects.exclude(
-            reason=StockHistory.Reason.PENJUALAN
-        ).select_related('product__produk_induk', 'user').order_by('-created_at')[:5]
-        
-        activities = []
-        for trx in recent_transactions:
-            activities.append({
-                'id': f"trx-{trx.id}", 'type': 'TRANSAKSI', 'timestamp': trx.created_at,
-                'user': trx.kasir.username,
-                'description': f"Transaksi <strong>#{trx.nomor_transaksi.split('-')[1]}</strong> sebesar <strong>Rp {trx.total_setelah_diskon:,.0f}</strong>"
-            })
-        
-        for stock in recent_stock_changes:
-            activities.append({
-                'id': f"stock-{stock.id}", 'type': stock.reason, 'timestamp': stock.created_at,
-                'user': stock.user.username if stock.user else 'System',
-                # PERBAIKAN DI SINI: Tampilkan nama produk induk dan varian
-                'description': f"<strong>{stock.get_reason_display()}</strong> pada <strong>{stock.product.produk_induk.nama_produk} {(stock.product.nama_varian)}</strong>"
-            })
+        recent_activities = LogAktivitasSerializer(
+            LogAktivitas.objects.order_by('-created_at', '-id')[:5], many=True
+        ).data
 
-        sorted_activities = sorted(activities, key=itemgetter('timestamp'), reverse=True)
         
         # Final JSON structure
         data = {
@@ -570,7 +541,7 @@ class DashboardStatsView(APIView):
             'low_stock_items': {'value': low_stock_count, 'trend': 0, 'trend_text': f"{low_stock_count} item perlu di-restock"},
             'revenue_chart_data': revenue_chart_data,
             'best_sellers': sorted_best_sellers,
-            'recent_activities': sorted_activities[:5], # Ambil 5 aktivitas terbaru dari gabungan
+            'recent_activities': recent_activities,
             'payment_method_summary': payment_method_summary
         }
         return Response(data)
@@ -578,67 +549,189 @@ class DashboardStatsView(APIView):
 class StockOpnameView(APIView):
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
-        items_to_adjust = request.data.get('items', [])
-        for item in items_to_adjust:
-            varian_id = item.get('varian_id')
-            physical_count = Decimal(item.get('physical_count'))
-            try:
-                varian = VarianProduk.objects.get(id=varian_id)
-            except VarianProduk.DoesNotExist:
-                continue
-
-            system_stock = varian.stok
-            discrepancy = physical_count - system_stock
-
-            if discrepancy != 0:
-                varian.stok = physical_count
-                varian.save()
-                StockHistory.objects.create(
-                    product=varian,
-                    quantity_change=discrepancy,
-                    stock_after=varian.stok,
-                    reason=StockHistory.Reason.OPNAME,
-                    notes=f"Sistem: {system_stock}, Fisik: {physical_count}",
-                    user=request.user
-                )
+        serializer = StockOpnameItemSerializer(data=request.data.get('items', []), many=True)
+        serializer.is_valid(raise_exception=True)
+        hitungan = {item['varian_id']: item['physical_count'] for item in serializer.validated_data}
+        jalankan_dengan_retry(setel_stok, hitungan, request.user)
         return Response({'success': 'Stok opname berhasil disimpan.'}, status=status.HTTP_200_OK)
     
+class SesiOpnameViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Stok opname bertahap untuk hitungan besar (seluruh toko):
+    POST membuka sesi dan menyalin stok, `hitungan` menerima hasil hitung per
+    chunk, `selisih` menampilkan laporan selisih yang dihitung di SQL, dan
+    `komit` menerapkan semua selisih sekaligus. Katalog tidak dikunci selama
+    proses menghitung, hanya sesaat ketika komit.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = SesiOpnameSerializer
+    pagination_class = StandardResultsSetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['status']
+    queryset = SesiOpname.objects.select_related('dibuat_oleh').annotate(
+        jumlah_item=Count('items'),
+        jumlah_dihitung=Count('items', filter=Q(items__jumlah_fisik__isnull=False)),
+    ).order_by('-dibuka_pada')
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        with transaction.atomic():
+            sesi = buka_sesi_opname(request.user, data.get('catatan'), data.get('kategori'))
+        return Response(self.get_serializer(self.get_queryset().get(pk=sesi.pk)).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def hitungan(self, request, pk=None):
+        serializer = HitunganOpnameSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        hitungan = {item['varian_id']: item['physical_count'] for item in data['items']}
+        try:
+            tidak_dikenal = jalankan_dengan_retry(catat_hitungan_opname, pk, hitungan, data['tambah'])
+        except SesiOpname.DoesNotExist:
+            return Response({'error': 'Sesi opname tidak ditemukan.'}, status=status.HTTP_404_NOT_FOUND)
+        except OpnameError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'disimpan': len(hitungan) - len(tidak_dikenal), 'varian_tidak_dikenal': tidak_dikenal})
+
+    @action(detail=True, methods=['get'])
+    def selisih(self, request, pk=None):
+        sesi = self.get_object()
+        selisih = F('jumlah_fisik') - F('stok_saat_hitung')
+        items = ItemOpname.objects.filter(sesi=sesi, jumlah_fisik__isnull=False).annotate(
+            selisih=ExpressionWrapper(selisih, output_field=DecimalField(max_digits=10, decimal_places=3)),
+            nilai_selisih=ExpressionWrapper(
+                selisih * F('varian__purchase_price'), output_field=DecimalField(max_digits=16, decimal_places=2)
+            ),
+        )
+        nol = Value(0, output_field=DecimalField())
+        ringkasan = items.aggregate(
+            item_dihitung=Count('id'),
+            item_selisih=Count('id', filter=~Q(selisih=0)),
+            total_lebih=Coalesce(Sum('selisih', filter=Q(selisih__gt=0)), nol),
+            total_kurang=Coalesce(Sum('selisih', filter=Q(selisih__lt=0)), nol),
+            nilai_lebih=Coalesce(Sum('nilai_selisih', filter=Q(selisih__gt=0)), nol),
+            nilai_kurang=Coalesce(Sum('nilai_selisih', filter=Q(selisih__lt=0)), nol),
+        )
+        ringkasan['item_belum_dihitung'] = ItemOpname.objects.filter(sesi=sesi, jumlah_fisik__isnull=True).count()
+
+        baris = items.exclude(selisih=0).order_by('nilai_selisih', 'varian_id').values(
+            'varian_id', 'stok_awal', 'stok_saat_hitung', 'jumlah_fisik', 'selisih', 'nilai_selisih',
+            sku=F('varian__sku'), nama_varian=F('varian__nama_varian'),
+            nama_produk=F('varian__produk_induk__nama_produk'),
+        )
+        page = self.paginate_queryset(baris)
+        response = self.get_paginated_response(page)
+        response.data['ringkasan'] = ringkasan
+        return response
+
+    @action(detail=True, methods=['post'])
+    def komit(self, request, pk=None):
+        try:
+            riwayat = jalankan_dengan_retry(komit_sesi_opname, pk, request.user)
+        except SesiOpname.DoesNotExist:
+            return Response({'error': 'Sesi opname tidak ditemukan.'}, status=status.HTTP_404_NOT_FOUND)
+        except OpnameError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'success': 'Stok opname berhasil disimpan.', 'varian_disesuaikan': len(riwayat)})
+
+    @action(detail=True, methods=['post'])
+    def batalkan(self, request, pk=None):
+        diubah = SesiOpname.objects.filter(pk=pk, status=SesiOpname.Status.DIBUKA).update(
+            status=SesiOpname.Status.DIBATALKAN, selesai_pada=timezone.now()
+        )
+        if not diubah:
+            return Response({'error': 'Sesi opname tidak ditemukan atau sudah ditutup.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'success': 'Sesi opname dibatalkan.'})
+
+
+class _Echo:
+    """Objek mirip file untuk csv.writer: writerow langsung mengembalikan barisnya."""
+    def write(self, value):
+        return value
+
+
 class TransactionCSVExportView(APIView):
+    """
+    Ekspor CSV transaksi secara streaming. Baris dibaca dengan cursor
+    server-side (`iterator`) dalam bentuk tuple, username kasir di-join di SQL,
+    jadi memori tetap datar berapa pun panjang rentang tanggalnya.
+    `?mode=item` mengekspor per baris item, `?gzip=1` mengompres on the fly.
+    """
     permission_classes = [IsAuthenticated]
+    CHUNK_SIZE = 2000
+    BARIS_PER_BLOK = 500
+
+    KOLOM_TRANSAKSI = ['Nomor Transaksi', 'Tanggal', 'Kasir', 'Total', 'Metode Pembayaran', 'Status']
+    KOLOM_ITEM = [
+        'Nomor Transaksi', 'Tanggal', 'Kasir', 'SKU', 'Produk', 'Varian',
+        'Jumlah', 'Harga Satuan', 'Subtotal', 'Status'
+    ]
 
     def get(self, request, *args, **kwargs):
-        # Ambil queryset yang sama dengan filter dari TransaksiViewSet
-        queryset = Transaksi.objects.all().order_by('-created_at')
-        # Terapkan filter tanggal jika ada di query params
         start_date = request.query_params.get('created_at__gte')
         end_date = request.query_params.get('created_at__lte')
-        if start_date:
-            queryset = queryset.filter(created_at__date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(created_at__date__lte=end_date)
-
-        # Buat response CSV
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="laporan_transaksi.csv"'
-
-        writer = csv.writer(response)
-        # Tulis header
-        writer.writerow(['Nomor Transaksi', 'Tanggal', 'Kasir', 'Total', 'Metode Pembayaran', 'Status'])
-        # Tulis data
-        for trx in queryset:
-            writer.writerow([
-                trx.nomor_transaksi,
-                trx.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                trx.kasir.username,
-                trx.total_setelah_diskon,
-                trx.metode_pembayaran,
-                trx.status
-            ])
+        per_item = request.query_params.get('mode') == 'item'
+        try:
+            if per_item:
+                rentang = filter_rentang('transaksi__created_at', start_date, end_date)
+            else:
+                rentang = filter_rentang('created_at', start_date, end_date)
+        except ValueError:
+            return Response({'error': 'Format tanggal harus YYYY-MM-DD.'}, status=400)
+
+        if per_item:
+            header = self.KOLOM_ITEM
+            baris = DetailTransaksi.objects.filter(**rentang).order_by('-transaksi__created_at', 'transaksi_id', 'id').values_list(
+                'transaksi__nomor_transaksi', 'transaksi__created_at', 'transaksi__kasir__username',
+                'varian_produk_terjual__sku', 'varian_produk_terjual__produk_induk__nama_produk',
+                'varian_produk_terjual__nama_varian', 'jumlah', 'harga_saat_transaksi', 'subtotal',
+                'transaksi__status',
+            )
+            nama_file = 'laporan_transaksi_item'
+        else:
+            header = self.KOLOM_TRANSAKSI
+            baris = Transaksi.objects.filter(**rentang).order_by('-created_at').values_list(
+                'nomor_transaksi', 'created_at', 'kasir__username',
+                'total_setelah_diskon', 'metode_pembayaran', 'status',
+            )
+            nama_file = 'laporan_transaksi'
 
+        isi = self._baris_csv(header, baris.iterator(chunk_size=self.CHUNK_SIZE))
+        if request.query_params.get('gzip') in ('1', 'true'):
+            response = StreamingHttpResponse(self._gzip(isi), content_type='application/gzip')
+            response['Content-Disposition'] = f'attachment; filename="{nama_file}.csv.gz"'
+        else:
+            response = StreamingHttpResponse(isi, content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="{nama_file}.csv"'
         return response
-    
+
+    def _baris_csv(self, header, rows):
+        """Menghasilkan blok-blok teks CSV (beberapa ratus baris per yield)."""
+        writer = csv.writer(_Echo())
+        yield writer.writerow(header)
+        blok = []
+        for row in rows:
+            row = list(row)
+            row[1] = row[1].strftime('%Y-%m-%d %H:%M:%S')
+            blok.append(writer.writerow(row))
+            if len(blok) >= self.BARIS_PER_BLOK:
+                yield ''.join(blok)
+                blok = []
+        if blok:
+            yield ''.join(blok)
+
+    @staticmethod
+    def _gzip(blok_teks):
+        kompresor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for teks in blok_teks:
+            data = kompresor.compress(teks.encode('utf-8'))
+            if data:
+                yield data
+        yield kompresor.flush()
+
 class ExpenseViewSet(viewsets.ModelViewSet):
     queryset = Expense.objects.all()
     serializer_class = ExpenseSerializer
@@ -652,29 +745,31 @@ class CashFlowReportView(APIView):
 
         if not all([start_date, end_date]):
             return Response({'error': 'Parameter start_date dan end_date dibutuhkan.'}, status=400)
+        try:
+            rentang_waktu(start_date, end_date)
+        except ValueError:
+            return Response({'error': 'Format tanggal harus YYYY-MM-DD.'}, status=400)
 
         # --- UANG MASUK ---
         # 1. Dari Penjualan Tunai
-        cash_sales = Transaksi.objects.filter(
-            created_at__date__range=[start_date, end_date], 
-            status='Selesai', 
-            metode_pembayaran='Tunai'
-        ).aggregate(total=Coalesce(Sum('total_setelah_diskon'), Value(0, output_field=DecimalField())))['total']
-
-        # 2. Dari Pembayaran Piutang
-        piutang_payments = Pembayaran.objects.filter(
-            tanggal_bayar__date__range=[start_date, end_date],
-            hutang_piutang__tipe='PIUTANG'
-        ).aggregate(total=Coalesce(Sum('jumlah_bayar'), Value(0, output_field=DecimalField())))['total']
+        cash_sales = RingkasanPenjualanHarian.objects.filter(
+            tanggal__range=[start_date, end_date]
+        ).aggregate(total=Coalesce(Sum('pendapatan_tunai'), Value(0, output_field=DecimalField())))['total']
+
+        # 2. Dari Pembayaran Piutang (dan pembayaran hutang untuk uang keluar, satu query)
+        payments = Pembayaran.objects.filter(
+            **filter_rentang('tanggal_bayar', start_date, end_date)
+        ).aggregate(
+            piutang=Coalesce(Sum('jumlah_bayar', filter=Q(hutang_piutang__tipe='PIUTANG')), Value(0, output_field=DecimalField())),
+            hutang=Coalesce(Sum('jumlah_bayar', filter=Q(hutang_piutang__tipe='HUTANG')), Value(0, output_field=DecimalField())),
+        )
+        piutang_payments = payments['piutang']
 
         total_cash_in = cash_sales + piutang_payments
 
         # --- UANG KELUAR ---
         # 1. Untuk Pembayaran Hutang
-        hutang_payments = Pembayaran.objects.filter(
-            tanggal_bayar__date__range=[start_date, end_date],
-            hutang_piutang__tipe='HUTANG'
-        ).aggregate(total=Coalesce(Sum('jumlah_bayar'), Value(0, output_field=DecimalField())))['total']
+        hutang_payments = payments['hutang']
 
         # 2. Untuk Biaya Operasional
         expenses = Expense.objects.filter(
@@ -700,42 +795,19 @@ class CashFlowReportView(APIView):
         return Response(data)
     
 class RecentActivityView(APIView):
+    """
+    Aktivitas terbaru (?limit=, default 10, maks 50) dari LogAktivitas.
+    Untuk menelusuri lebih jauh pakai feed `aktivitas/` dengan kursor.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        # Ambil 5 transaksi terakhir
-        recent_transactions = Transaksi.objects.filter(status='Selesai').order_by('-created_at')[:5]
-
-        # Ambil 10 riwayat stok terakhir (di luar penjualan)
-        recent_stock_changes = StockHistory.objects.exclude(
-            reason=StockHistory.Reason.PENJUALAN
-        ).select_related('product', 'user').order_by('-created_at')[:10]
-
-        # Ubah data ke format standar
-        activities = []
-        for trx in recent_transactions:
-            activities.append({
-                'id': f"trx-{trx.id}",
-                'type': 'TRANSAKSI',
-                'timestamp': trx.created_at,
-                'user': trx.kasir.username,
-                'description': f"Transaksi #{trx.nomor_transaksi.split('-')[1]} sebesar Rp {trx.total_setelah_diskon:,.0f}"
-            })
-
-        for stock in recent_stock_changes:
-            activities.append({
-                'id': f"stock-{stock.id}",
-                'type': stock.reason,
-                'timestamp': stock.created_at,
-                'user': stock.user.username if stock.user else 'System',
-                'description': f"{stock.get_reason_display()} pada {stock.product.nama_varian}"
-            })
-
-        # Urutkan semua aktivitas berdasarkan waktu
-        sorted_activities = sorted(activities, key=itemgetter('timestamp'), reverse=True)
-
-        # Kembalikan 10 aktivitas terbaru
-        return Response(sorted_activities[:10])
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response({'error': 'Parameter limit harus angka.'}, status=400)
+        log = LogAktivitas.objects.order_by('-created_at', '-id')[:limit]
+        return Response(LogAktivitasSerializer(log, many=True).data)
     
 class ProfitLossReportView(APIView):
     permission_classes = [IsAuthenticated]
@@ -746,20 +818,30 @@ class ProfitLossReportView(APIView):
 
         if not all([start_date, end_date]):
             return Response({'error': 'Parameter start_date dan end_date dibutuhkan.'}, status=400)
+        try:
+            rentang = filter_rentang('transaksi__created_at', start_date, end_date)
+        except ValueError:
+            return Response({'error': 'Format tanggal harus YYYY-MM-DD.'}, status=400)
 
-        transactions_in_range = Transaksi.objects.filter(created_at__date__range=[start_date, end_date], status='Selesai')
         expenses_in_range = Expense.objects.filter(tanggal__range=[start_date, end_date])
 
         # 1. Hitung Penjualan Kotor
-        gross_sales = transactions_in_range.aggregate(total=Coalesce(Sum('total_setelah_diskon'), Value(0, output_field=DecimalField())))['total']
-
-        # 2. Hitung Harga Pokok Penjualan (HPP) di Python untuk menghindari error DB
-        details = DetailTransaksi.objects.filter(transaksi__in=transactions_in_range).select_related('varian_produk_terjual')
-        
-        cogs = Decimal(0)
-        for detail in details:
-            purchase_price = detail.varian_produk_terjual.purchase_price or 0
-            cogs += detail.jumlah * purchase_price
+        gross_sales = RingkasanPenjualanHarian.objects.filter(
+            tanggal__range=[start_date, end_date]
+        ).aggregate(total=Coalesce(Sum('pendapatan'), Value(0, output_field=DecimalField())))['total']
+
+        # 2. Hitung Harga Pokok Penjualan (HPP) dengan satu agregat di database,
+        # memakai harga pokok yang dicatat saat penjualan. Baris lama yang belum
+        # di-backfill (lihat `backfill_harga_pokok`) memakai harga beli varian saat ini.
+        cogs = DetailTransaksi.objects.filter(
+            transaksi__status='Selesai', **rentang
+        ).aggregate(total=Coalesce(
+            Sum(ExpressionWrapper(
+                F('jumlah') * Coalesce('harga_pokok', 'varian_produk_terjual__purchase_price'),
+                output_field=DecimalField()
+            )),
+            Value(0, output_field=DecimalField())
+        ))['total']
 
         # 3. Hitung Biaya Operasional
         operational_expenses_agg = expenses_in_range.aggregate(total=Coalesce(Sum('jumlah'), Value(0, output_field=DecimalField())))
@@ -782,6 +864,49 @@ class ProfitLossReportView(APIView):
         }
         return Response(data)
     
+class NilaiPersediaanView(APIView):
+    """
+    Nilai persediaan per akhir `tanggal` (default hari ini) dengan metode
+    `rata_rata` (rata-rata bergerak) atau `fifo`. Diambil dari snapshot valuasi
+    riwayat stok terakhir tiap varian sebelum batas tanggal: satu query dengan
+    satu lookup index (product, created_at) per varian.
+    """
+    permission_classes = [IsAuthenticated]
+    KOLOM = {
+        'rata_rata': ('nilai_setelah', 'nilai_persediaan__nilai_rata_rata'),
+        'fifo': ('nilai_fifo_setelah', 'nilai_persediaan__nilai_fifo'),
+    }
+
+    def get(self, request, *args, **kwargs):
+        tanggal = request.query_params.get('tanggal') or timezone.localdate().isoformat()
+        metode = request.query_params.get('metode', 'rata_rata')
+        if metode not in self.KOLOM:
+            return Response({'error': 'Metode harus rata_rata atau fifo.'}, status=400)
+        try:
+            _, batas = rentang_waktu(None, tanggal)
+        except ValueError:
+            return Response({'error': 'Format tanggal harus YYYY-MM-DD.'}, status=400)
+
+        kolom_riwayat, kolom_terkini = self.KOLOM[metode]
+        desimal = DecimalField(max_digits=16, decimal_places=2)
+        riwayat = StockHistory.objects.filter(product=OuterRef('pk'))
+        terakhir = riwayat.filter(created_at__lt=batas).order_by('-created_at', '-id').values(kolom_riwayat)[:1]
+        # Saldo sebelum pergerakan pertama (snapshot pembuka), dinilai dengan harga beli
+        saldo_awal = riwayat.order_by('created_at', 'id').annotate(awal=ExpressionWrapper(
+            (F('stock_after') - F('quantity_change')) * OuterRef('purchase_price'), output_field=desimal
+        )).values('awal')[:1]
+        # Tanggal sebelum pergerakan pertama memakai saldo awal; varian yang
+        # belum pernah bergerak memakai nilai terkininya, atau stok x harga beli
+        # jika belum punya baris NilaiPersediaan (mis. dibuat lewat impor).
+        nilai = VarianProduk.objects.annotate(nilai=Case(
+            When(Exists(riwayat), then=Coalesce(Subquery(terakhir), Subquery(saldo_awal))),
+            default=Coalesce(F(kolom_terkini), ExpressionWrapper(F('stok') * F('purchase_price'), output_field=desimal)),
+            output_field=desimal,
+        )).aggregate(total=Coalesce(Sum('nilai'), Value(0, output_field=desimal)))['total']
+
+        return Response({'tanggal': tanggal, 'metode': metode, 'nilai_persediaan': nilai})
+
+
 class PelangganViewSet(viewsets.ModelViewSet):
     """API untuk mengelola data pelanggan."""
     queryset = Pelanggan.objects.all().order_by('nama_pelanggan')
@@ -821,15 +946,12 @@ class SetoranSimpananView(APIView):
                 defaults=defaults
             )
 
-            saldo_setelah = pelanggan.saldo_simpanan + data['jumlah']
-            
-            RiwayatSimpanan.objects.create(
-                pelanggan=pelanggan,
-                tipe=RiwayatSimpanan.Tipe.MASUK,
-                jumlah=data['jumlah'],
-                saldo_setelah=saldo_setelah,
-                keterangan=data.get('keterangan', 'Setoran tunai.'),
-                dicatat_oleh=request.user
+            catat_simpanan(
+                pelanggan.id,
+                RiwayatSimpanan.Tipe.MASUK,
+                data['jumlah'],
+                data.get('keterangan', 'Setoran tunai.'),
+                request.user
             )
             
             return Response({'success': 'Setoran berhasil dicatat.'}, status=status.HTTP_201_CREATED)
@@ -839,14 +961,11 @@ class SimpananSummaryView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        # Ambil semua pelanggan dan hitung total saldo mereka
-        all_pelanggan = Pelanggan.objects.all()
-        total_saldo = sum(p.saldo_simpanan for p in all_pelanggan)
-
-        data = {
-            'total_simpanan_aktif': total_saldo,
-            'jumlah_pelanggan': all_pelanggan.count()
-        }
+        # Total saldo dihitung langsung dari kolom saldo dalam satu query
+        data = Pelanggan.objects.aggregate(
+            total_simpanan_aktif=Coalesce(Sum('saldo'), Value(0, output_field=DecimalField())),
+            jumlah_pelanggan=Count('id')
+        )
         return Response(data)
     
 class PenarikanSimpananView(APIView):
@@ -858,24 +977,18 @@ class PenarikanSimpananView(APIView):
         if serializer.is_valid():
             data = serializer.validated_data
             try:
-                pelanggan = Pelanggan.objects.get(id=data['pelanggan_id'])
+                catat_simpanan(
+                    data['pelanggan_id'],
+                    RiwayatSimpanan.Tipe.KELUAR,
+                    data['jumlah'],
+                    data.get('keterangan', 'Penarikan tunai.'),
+                    request.user
+                )
             except Pelanggan.DoesNotExist:
                 return Response({'error': 'Pelanggan tidak ditemukan.'}, status=404)
+            except SaldoTidakCukupError as e:
+                return Response({'error': str(e)}, status=400)
 
-            # Validasi: Pastikan saldo mencukupi
-            if pelanggan.saldo_simpanan < data['jumlah']:
-                return Response({'error': 'Saldo simpanan tidak mencukupi.'}, status=400)
-
-            saldo_setelah = pelanggan.saldo_simpanan - data['jumlah']
-
-            RiwayatSimpanan.objects.create(
-                pelanggan=pelanggan,
-                tipe=RiwayatSimpanan.Tipe.KELUAR,
-                jumlah=data['jumlah'],
-                saldo_setelah=saldo_setelah,
-                keterangan=data.get('keterangan', 'Penarikan tunai.'),
-                dicatat_oleh=request.user
-            )
             return Response({'success': 'Penarikan berhasil dicatat.'}, status=201)
         return Response(serializer.errors, status=400)
     
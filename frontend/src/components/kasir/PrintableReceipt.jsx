@@ -4,6 +4,11 @@ import React from 'react';
 // Ganti nama prop agar sesuai dengan yang kita gunakan di Kasir.jsx (lastTransaction)
 const PrintableReceipt = React.forwardRef(({ transaction, storeInfo }, ref) => {
   if (!transaction) return null;
+  // Struk butuh detail lengkap; payload daftar `ringkas` hanya berisi id varian
+  if (transaction.detail_items.some(item => typeof item.varian_produk_terjual !== 'object')) {
+    console.error('PrintableReceipt: detail_items harus dari detail transaksi lengkap, bukan daftar ringkas.');
+    return null;
+  }
 
   const formatCurrency = (value) => new Intl.NumberFormat('id-ID', { style: 'currency', currency: 'IDR', minimumFractionDigits: 0 }).format(value || 0);
   const formatQuantity = (qty) => parseFloat(qty);
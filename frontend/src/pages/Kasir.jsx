@@ -93,7 +93,47 @@ const Kasir = () => {
     return () => clearTimeout(handler);
   }, [searchTerm, selectedCategory]);
 
+  // Payload keranjang untuk harga dari server (mesin harga yang sama dengan checkout)
+  const quotePayload = useMemo(
+    () =>
+      JSON.stringify({
+        detail_items: cartItems.map((item) => ({
+          varian_produk_id: item.id,
+          jumlah: item.qty,
+        })),
+        customer_type: customerType === "reseller" ? "Reseller" : "Biasa",
+      }),
+    [cartItems, customerType]
+  );
+  const [quote, setQuote] = useState(null);
+
+  useEffect(() => {
+    if (cartItems.length === 0) {
+      setQuote(null);
+      return;
+    }
+    const handler = setTimeout(() => {
+      apiClient
+        .post("/transactions/transaksi/quote/", JSON.parse(quotePayload))
+        .then((response) =>
+          setQuote({ payload: quotePayload, data: response.data })
+        )
+        .catch(() => setQuote(null));
+    }, 200);
+    return () => clearTimeout(handler);
+  }, [quotePayload]);
+
+  // Quote hanya dipakai jika masih sesuai isi keranjang saat ini
+  const currentQuote = quote?.payload === quotePayload ? quote.data : null;
+
   const getPrice = (item, quantity) => {
+    const line = currentQuote?.detail_items.find(
+      (d) => d.varian_produk_id === item.id && parseFloat(d.jumlah) === quantity
+    );
+    if (line) {
+      return parseFloat(line.harga_satuan);
+    }
+    // Perkiraan lokal selagi harga dari server dimuat
     if (customerType === "reseller" && item.harga_jual_reseller > 0) {
       return parseFloat(item.harga_jual_reseller);
     }
@@ -151,11 +191,14 @@ const Kasir = () => {
   };
 
   const cartTotal = useMemo(() => {
+    if (currentQuote) {
+      return parseFloat(currentQuote.total_harga);
+    }
     return cartItems.reduce((total, item) => {
       const price = getPrice(item, item.qty);
       return total + price * item.qty;
     }, 0);
-  }, [cartItems, customerType, getPrice]);
+  }, [cartItems, customerType, getPrice, currentQuote]);
 
   const handleRequestHold = () => {
     if (cartItems.length > 0) {
@@ -113,6 +113,7 @@ const LaporanTransaksi = () => {
     const params = new URLSearchParams({
       page: currentPage,
       page_size: ITEMS_PER_PAGE,
+      ringkas: 1,
     });
     if (startDate) params.append("created_at__gte", startDate);
     if (endDate) params.append("created_at__lte", endDate);
@@ -182,8 +183,13 @@ const LaporanTransaksi = () => {
     setDetailModalOpen(true);
   };
 
-  const handlePrint = (transaction) => {
-    setTransactionToPrint(transaction);
+  // Baris daftar memakai serializer ringkas (varian hanya berupa id), jadi struk
+  // selalu dicetak dari detail transaksi lengkap
+  const handlePrint = (trxId) => {
+    apiClient
+      .get(`/transactions/transaksi/${trxId}/`)
+      .then((res) => setTransactionToPrint(res.data))
+      .catch(() => addToast("error", "Gagal memuat data struk."));
   };
 
   const containerVariants = {
@@ -445,7 +451,7 @@ const LaporanTransaksi = () => {
                               <Eye size={16} />
                             </button>
                             <button
-                              onClick={() => handlePrint(trx)}
+                              onClick={() => handlePrint(trx.id)}
                               title="Cetak Struk"
                               className="p-2 text-text-secondary hover:bg-light-gray/50 rounded-full"
                             >